@@ -7,6 +7,7 @@ pip3 install -r requirements.txt
 
 echo "### Migrating and initializing database"
 python3 manage.py migrate --noinput
+python3 manage.py createcachetable
 python3 manage.py initialize_plans
 
 echo "### Collecting static files"
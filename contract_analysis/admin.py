@@ -1,6 +1,60 @@
 from django.contrib import admin
+from django.template.response import TemplateResponse
+from django.urls import path
 
 from contract_analysis.models.contract import Contract, ContractDetails
+from contract_analysis.models.geocoding import GeocodeCache, NeighborhoodCache
+from contract_analysis.models.pipeline import AnalysisRun, AnalysisSpan
+from contract_analysis.models.poi import PointOfInterest
+from contract_analysis.utils.spans import MAX_PERCENTILE_DAYS, PERCENTILES, stage_percentiles
 
 admin.site.register(Contract)
 admin.site.register(ContractDetails)
+admin.site.register(GeocodeCache)
+admin.site.register(NeighborhoodCache)
+admin.site.register(PointOfInterest)
+
+
+class AnalysisSpanInline(admin.TabularInline):
+    model = AnalysisSpan
+    fields = ["name", "parent", "start_ms", "duration_ms", "success", "error", "attributes"]
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+
+@admin.register(AnalysisRun)
+class AnalysisRunAdmin(admin.ModelAdmin):
+    list_display = ["started_at", "contract", "status", "duration_ms"]
+    list_filter = ["status", "started_at"]
+    readonly_fields = ["contract", "started_at", "duration_ms", "status", "error"]
+    inlines = [AnalysisSpanInline]
+    change_list_template = "admin/contract_analysis/analysisrun/change_list.html"
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                "stage-timings/",
+                self.admin_site.admin_view(self.stage_timings_view),
+                name="contract_analysis_analysisrun_stage_timings",
+            ),
+        ] + super().get_urls()
+
+    def stage_timings_view(self, request):
+        """Duration percentiles per pipeline stage, overall and per day"""
+        try:
+            days = min(max(int(request.GET.get("days", 30)), 1), MAX_PERCENTILE_DAYS)
+        except ValueError:
+            days = 30
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Stage timings",
+            "opts": self.model._meta,
+            "days": days,
+            "percentiles": [f"p{percent}" for percent in PERCENTILES],
+            "stages": stage_percentiles(days),
+        }
+        return TemplateResponse(request, "admin/contract_analysis/analysisrun/stage_timings.html", context)
@@ -3,15 +3,23 @@ import json
 import logging
 import os
 from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict, List
 
 from PIL import Image
 from asgiref.sync import sync_to_async
+from django.conf import settings
 
 from contract_analysis.models.contract import ContractDetails, Contract
+from contract_analysis.models.geocoding import NeighborhoodCache
+from contract_analysis.utils import geohash
+from contract_analysis.utils.coercion import coerce_values
 from contract_analysis.utils.json import clean_json, model_to_schema
-from contract_analysis.utils.map import get_neighborhood_map
+from contract_analysis.utils.geocoding import is_final_location
+from contract_analysis.utils.map import geocode_address, get_neighborhood_map
+from contract_analysis.utils.poi import get_neighborhood_facts
+from contract_analysis.utils.spans import run_in_executor, span
+from klarmieten.metrics import count_cache_lookup
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -32,9 +40,30 @@ MISTRAL_SMALL_MODEL = "mistral-small"
 GEMINI_FLASH_MODEL = "gemini-2.0-flash"
 GEMINI_FLASH_EXP_MODEL = "gemini-2.0-flash-exp"
 
+# vision.Feature.Type.DOCUMENT_TEXT_DETECTION, requests are plain dicts so
+# that other clients can stand in for Cloud Vision
+VISION_DOCUMENT_TEXT_DETECTION = 11
+
+# Gemini settings as plain dicts too, the SDK reads them as GenerateContentConfig
+GEMINI_EXTRACTION_CONFIG = {
+    "temperature": 0.1,
+    "top_p": 0.9,
+    "top_k": 32,
+    "max_output_tokens": 4096,
+}
+GEMINI_NEIGHBORHOOD_CONFIG = {
+    "temperature": 0.3,
+    "top_p": 0.9,
+    "top_k": 32,
+    "max_output_tokens": 2048,
+}
+
 # In-memory cache
 OCR_CACHE = {}
 
+# Zoom level of the map the neighborhood analysis looks at
+NEIGHBORHOOD_MAP_ZOOM = 16
+
 # Prompts
 SIMPLIFICATION_PROMPT = """
 Es liegt ein Mietvertrag vor. Dieser enthält Paragraphen, die mit § oder einer entsprechenden Überschrift gekennzeichnet sind. Nur diese Paragraphen sollen vereinfacht werden. Teile des Textes ohne Paragraphen-Bezug werden ignoriert. 
@@ -63,7 +92,7 @@ Die Ausgabe erfolgt als JSON-Array. Jeder Eintrag enthält:
 
 NEIGHBORHOOD_ANALYSIS_PROMPT_TEMPLATE = """
 Sie sind ein Immobilienexperte und analysieren die Umgebung einer Immobilie.
-Ihre Aufgabe ist es, eine kurze Analyse der Umgebung basierend auf dem bereitgestellten Kartenbild zu liefern.
+Ihre Aufgabe ist es, eine kurze Analyse der Umgebung basierend auf dem bereitgestellten Kartenbild und den Fakten aus OpenStreetMap zu liefern.
 
 Wenn Sie spezifische Merkmale oder Wahrzeichen in der Umgebung sehen, beschreiben Sie diese bitte im Detail.
 Zum Beispiel, wenn es eine große Straße gibt, könnten Sie erwähnen, dass es sich um eine belebte Gegend handeln könnte und daher laut sein könnte.
@@ -71,7 +100,7 @@ Wenn es einen nahegelegenen Park gibt, könnten Sie erwähnen, dass dieser eine
 
 **Anforderungen:**
 
-1. Beschreiben Sie die Umgebung basierend auf dem bereitgestellten Kartenbild.
+1. Beschreiben Sie die Umgebung basierend auf dem bereitgestellten Kartenbild. Die Fakten haben Vorrang vor dem, was Sie im Bild zu erkennen glauben.
 2. Erwähnen Sie spezifische Merkmale oder Wahrzeichen, die Sie sehen.
 3. Bieten Sie eine kurze Analyse darüber, wie diese Merkmale die Immobilie oder ihre Bewohner beeinflussen könnten.
 4. Geben Sie keine persönlichen Meinungen oder Vorurteile ab.
@@ -83,8 +112,21 @@ Wenn es einen nahegelegenen Park gibt, könnten Sie erwähnen, dass dieser eine
 
 - Das Kartenbild zeigt die Umgebung der Immobilie, die sich befindet an: {address}
 - Das Bild ist eine Draufsicht auf das Gebiet und zeigt Straßen, Gebäude, Parks und andere Merkmale.
+
+**Fakten aus OpenStreetMap:**
+
+{facts}
 """
 
+# Labels of the neighborhood facts in the prompt, see contract_analysis.utils.poi
+NEIGHBORHOOD_FACT_LABELS = {
+    "transit": "Haltestellen des ÖPNV",
+    "school": "Schulen",
+    "supermarket": "Supermärkte",
+    "park": "Parks",
+    "major_road": "Hauptverkehrsstraßen",
+}
+
 DETAIL_EXTRACTION_PROMPT_TEMPLATE = """
 Sie sind ein Vertragsanalyse-Experte. Ihre Aufgabe ist es, den Vertrag zu analysieren und wichtige Informationen zu extrahieren, die in einem JSON-Objekt organisiert werden, das *strikt* dem folgenden Schema entspricht:
 
@@ -106,16 +148,43 @@ Sie sind ein Vertragsanalyse-Experte. Ihre Aufgabe ist es, den Vertrag zu analys
 """
 
 
+def vision_request(content: bytes) -> Dict:
+    """Cloud Vision request for the text of a page, as read by vision.AnnotateImageRequest"""
+    # Document text detection is optimized for dense text
+    return {
+        'image': {'content': content},
+        'features': [
+            {'type_': VISION_DOCUMENT_TEXT_DETECTION}
+        ]
+    }
+
+
 class ContractProcessor:
-    def __init__(self):
-        from google import genai
-        from google.cloud import vision
-        from mistralai import Mistral
-
-        #        Initialize clients
-        self.vision_client = vision.ImageAnnotatorClient()
-        self.gemini_client = genai.Client(api_key=GEMINI_API_KEY)
-        self.mistral_client = Mistral(api_key=MISTRAL_API_KEY)
+    def __init__(self, vision_client=None, gemini_client=None, mistral_client=None):
+        """
+        Args:
+            vision_client: Replaces the Cloud Vision client, like the fakes in
+                contract_analysis.utils.fake_providers
+            gemini_client: Replaces the Gemini client
+            mistral_client: Replaces the Mistral client
+        """
+        # Initialize clients, the SDKs are only imported for the real ones
+        if vision_client is None:
+            from google.cloud import vision
+
+            vision_client = vision.ImageAnnotatorClient()
+        if gemini_client is None:
+            from google import genai
+
+            gemini_client = genai.Client(api_key=GEMINI_API_KEY)
+        if mistral_client is None:
+            from mistralai import Mistral
+
+            mistral_client = Mistral(api_key=MISTRAL_API_KEY)
+
+        self.vision_client = vision_client
+        self.gemini_client = gemini_client
+        self.mistral_client = mistral_client
         self.executor = ThreadPoolExecutor(max_workers=5)
 
     async def process_contract(self, contract: Contract):
@@ -132,11 +201,14 @@ class ContractProcessor:
             logger.error("No contract images found")
             return {"error": "No contract images found"}
 
-        if not contract_details.full_contract_text:
-            full_contract_text = await self.extract_text_with_vision(contract_images)
-        else:
-            logger.info("Using existing full contract text")
-            full_contract_text = contract_details.full_contract_text
+        with span("ocr", images=len(contract_images)) as ocr_span:
+            if not contract_details.full_contract_text:
+                full_contract_text = await self.extract_text_with_vision(contract_images)
+            else:
+                logger.info("Using existing full contract text")
+                full_contract_text = contract_details.full_contract_text
+                ocr_span.set(cached=True)
+            ocr_span.set(characters=len(full_contract_text or ""))
 
         if not full_contract_text:
             logger.error("Text extraction failed")
@@ -156,14 +228,35 @@ class ContractProcessor:
         if len(step2_results) > 0 and isinstance(step2_results[0], dict):
             updated_contract_details.update(step2_results[0])  # Use update to merge dictionaries
 
+        simplified_paragraphs = None
         if len(step2_results) > 1 and isinstance(step2_results[1], list):
-            updated_contract_details["simplified_paragraphs"] = step2_results[1]
+            simplified_paragraphs = step2_results[1]
 
-        # Step 3: Analyze neighborhood based on address
+        # Coordinates only come from geocoding, never from the LLM
+        for field_name in ContractDetails.GEOCODE_FIELDS:
+            updated_contract_details.pop(field_name, None)
+
+        # Step 3: Geocode the address and analyze the neighborhood
         address = self.get_address_from_details(updated_contract_details)
+        geocode_values = {}
         if address:
+            with span("geocoding") as geocoding_span:
+                location = await self.geocode(contract_details, address)
+                geocoding_span.set(found=location is not None, precision=location["precision"] if location else None)
+            geocode_values = {
+                "latitude": location["lat"] if location else None,
+                "longitude": location["lon"] if location else None,
+                "geocode_precision": location["precision"] if location else None,
+                # Only a final location is reused, failed lookups and postal code
+                # fallbacks are retried next time
+                "geocoded_address": address[:255] if is_final_location(address, location) else None,
+            }
             try:
-                neighborhood_analysis = await self.analyze_neighborhood(address)
+                area = " ".join(filter(None, [
+                    updated_contract_details.get("postal_code"), updated_contract_details.get("city")
+                ]))
+                with span("neighborhood"):
+                    neighborhood_analysis = await self.analyze_neighborhood(address, location, area)
                 if isinstance(neighborhood_analysis, str):
                     updated_contract_details["neighborhood_analysis"] = neighborhood_analysis
             except Exception as e:
@@ -175,10 +268,20 @@ class ContractProcessor:
             "processing_time": (datetime.now() - start_time).total_seconds()
         }
 
+        # Convert LLM output to field types, dropping values that cannot be stored
+        updated_contract_details, rejected_fields = coerce_values(ContractDetails, updated_contract_details)
+        for field_name, reason in rejected_fields.items():
+            logger.warning(f"Rejected extracted value for {field_name}: {reason}")
+        result_dict["rejected_fields"] = rejected_fields
+        updated_contract_details.update(geocode_values)
+
         logger.info(f"Contract processing completed in {result_dict['processing_time']} seconds")
 
         # Update contract details - make sure this is properly awaited if it's an async operation
-        await sync_to_async(contract_details.update)(updated_contract_details)
+        with span("save"):
+            await sync_to_async(contract_details.update)(updated_contract_details)
+            if simplified_paragraphs is not None:
+                await sync_to_async(contract_details.set_paragraphs)(simplified_paragraphs)
 
         return result_dict
 
@@ -198,6 +301,14 @@ class ContractProcessor:
         # Filter out empty components and join the rest with a space
         return ' '.join(filter(None, components))
 
+    async def geocode(self, contract_details: ContractDetails, address: str) -> Dict:
+        """Geocode the address, reusing the stored location while the address is unchanged."""
+        if address[:255] == contract_details.geocoded_address and contract_details.location:
+            logger.info("Using stored coordinates")
+            return contract_details.location
+
+        return await run_in_executor(self.executor, lambda: geocode_address(address))
+
     async def extract_text_with_vision(self, image_paths: List[str]) -> str:
         """Extract text from images using Google Cloud Vision API."""
         logger.info(f"Extracting text from {len(image_paths)} images using Cloud Vision")
@@ -206,7 +317,11 @@ class ContractProcessor:
         cache_key = ','.join(sorted(image_paths))
         if cache_key in OCR_CACHE:
             logger.info("Using cached OCR results")
+            count_cache_lookup("ocr", hit=True)
             return OCR_CACHE[cache_key]
+        count_cache_lookup("ocr", hit=False)
+
+        payload_bytes = 0
 
         all_text = []
         batch_requests = []
@@ -216,17 +331,9 @@ class ContractProcessor:
             try:
                 with open(image_path, 'rb') as image_file:
                     content = image_file.read()
+                payload_bytes += len(content)
 
-                from google.cloud import vision
-                image = vision.Image(content=content)
-                # Request text detection and document text detection
-                # Document text detection is optimized for dense text
-                batch_requests.append({
-                    'image': image,
-                    'features': [
-                        {'type_': vision.Feature.Type.DOCUMENT_TEXT_DETECTION}
-                    ]
-                })
+                batch_requests.append(vision_request(content))
 
             except Exception as e:
                 logger.error(f"Error preparing image {image_path}: {e}")
@@ -236,7 +343,9 @@ class ContractProcessor:
 
         try:
             # Process images in batch
-            response = self.vision_client.batch_annotate_images(requests=batch_requests)
+            with span("vision.batch_annotate_images", provider="vision", images=len(batch_requests),
+                      payload_bytes=payload_bytes):
+                response = self.vision_client.batch_annotate_images(requests=batch_requests)
 
             for annotation in response.responses:
                 if annotation.full_text_annotation:
@@ -260,34 +369,36 @@ class ContractProcessor:
         """Extract full contract details using Gemini."""
         logger.info("Extracting full contract details")
 
-        try:
-            # Get the full schema for contract details
-            contract_details_schema = model_to_schema(ContractDetails, exclude=["id", "contract", "full_contract_text",
-                                                                                "neighborhood_analysis"])
+        with span("extraction") as extraction_span:
+            try:
+                # Get the full schema for contract details
+                contract_details_schema = model_to_schema(ContractDetails, exclude=["id", "contract", "full_contract_text",
+                                                                                    "neighborhood_analysis",
+                                                                                    *ContractDetails.GEOCODE_FIELDS])
 
-            prompt = DETAIL_EXTRACTION_PROMPT_TEMPLATE.format(
-                schema=json.dumps(contract_details_schema, indent=2)
-            )
+                prompt = DETAIL_EXTRACTION_PROMPT_TEMPLATE.format(
+                    schema=json.dumps(contract_details_schema, indent=2)
+                )
 
-            contents = [prompt, text]
+                contents = [prompt, text]
 
-            # Process in a separate thread to not block
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                self.executor,
-                lambda: self._extract_details_with_gemini(contents, images)
-            )
+                # Process in a separate thread to not block
+                result = await run_in_executor(
+                    self.executor,
+                    lambda: self._extract_details_with_gemini(contents, images)
+                )
+                extraction_span.set(fields=len(result))
 
-            return result
+                return result
 
-        except Exception as e:
-            logger.error(f"Error in extract_full_contract_details: {e}")
-            return {}
+            except Exception as e:
+                extraction_span.fail(e)
+                logger.error(f"Error in extract_full_contract_details: {e}")
+                return {}
 
     def _extract_details_with_gemini(self, contents, images=None) -> Dict:
         """Helper method to run in thread pool for Gemini API calls."""
 
-        from google.genai import types as genai_types
         try:
             # Add images if provided
             if images:
@@ -297,16 +408,15 @@ class ContractProcessor:
                         contents.append(img)
 
             # Generate content with the model
-            response = self.gemini_client.models.generate_content(
-                model=GEMINI_FLASH_MODEL,
-                contents=contents,
-                config=genai_types.GenerateContentConfig(
-                    temperature=0.1,
-                    top_p=0.9,
-                    top_k=32,
-                    max_output_tokens=4096
-                ),
-            )
+            text_characters = sum(len(content) for content in contents if isinstance(content, str))
+            with span("gemini.generate_content", provider="gemini", characters=text_characters,
+                      images=len(contents) - 2) as gemini_span:
+                response = self.gemini_client.models.generate_content(
+                    model=GEMINI_FLASH_MODEL,
+                    contents=contents,
+                    config=GEMINI_EXTRACTION_CONFIG,
+                )
+                gemini_span.set(response_characters=len(response.text or ""))
 
             response_text = response.text
 
@@ -329,23 +439,25 @@ class ContractProcessor:
         if not text:
             return []
 
-        try:
-            # Process in a separate thread to not block
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                self.executor,
-                lambda: self._simplify_with_mistral(text)
-            )
+        with span("simplification", characters=len(text)) as simplification_span:
+            try:
+                # Process in a separate thread to not block
+                result = await run_in_executor(
+                    self.executor,
+                    lambda: self._simplify_with_mistral(text)
+                )
+                simplification_span.set(paragraphs=len(result))
 
-            return result
+                return result
 
-        except Exception as e:
-            logger.error(f"Error in simplify_paragraphs: {e}")
-            return []
+            except Exception as e:
+                simplification_span.fail(e)
+                logger.error(f"Error in simplify_paragraphs: {e}")
+                return []
 
     @staticmethod
     def _merge_paragraphs(all_results: List[Dict]) -> List:
-        """Merge paragraphs into chunks of 4k characters."""
+        """Merge paragraphs with the same title, widening their source span."""
         merged_results = {}
         for item in all_results:
             title = item.get("title")
@@ -353,10 +465,18 @@ class ContractProcessor:
 
             if title and simplified:
                 if title not in merged_results:
-                    merged_results[title] = simplified
+                    merged_results[title] = {
+                        "title": title,
+                        "simplified": simplified,
+                        "source_start": item.get("source_start"),
+                        "source_end": item.get("source_end"),
+                    }
                 else:
-                    merged_results[title] += " " + simplified
-        return [{"title": title, "simplified": simplified} for title, simplified in merged_results.items()]
+                    merged = merged_results[title]
+                    merged["simplified"] += " " + simplified
+                    if item.get("source_end") is not None:
+                        merged["source_end"] = item["source_end"]
+        return list(merged_results.values())
 
     def _simplify_with_mistral(self, text: str) -> List[Dict]:
         """Helper method to run in thread pool for Mistral API calls."""
@@ -364,28 +484,40 @@ class ContractProcessor:
             # Split text into manageable chunks if needed (for token limits)
             chunks = ContractProcessor._chunk_text(text, max_chars=4000)
             all_results = []
+            chunk_start = 0
 
             for chunk in chunks:
-                response = self.mistral_client.chat.complete(
-                    model=MISTRAL_SMALL_MODEL,
-                    messages=[
-                        {"role": "system", "content": SIMPLIFICATION_PROMPT},
-                        {"role": "user", "content": chunk}
-                    ],
-                    max_tokens=4096,
-                    response_format={
-                        "type": "json_object",
-                    }
-                )
+                # Chunks are contiguous slices of the text, so track where each one starts
+                chunk_start = max(text.find(chunk, chunk_start), chunk_start)
+                chunk_end = chunk_start + len(chunk)
+
+                with span("mistral.chat.complete", provider="mistral", characters=len(chunk)):
+                    response = self.mistral_client.chat.complete(
+                        model=MISTRAL_SMALL_MODEL,
+                        messages=[
+                            {"role": "system", "content": SIMPLIFICATION_PROMPT},
+                            {"role": "user", "content": chunk}
+                        ],
+                        max_tokens=4096,
+                        response_format={
+                            "type": "json_object",
+                        }
+                    )
 
                 if response and response.choices and response.choices[0].message.content:
                     try:
                         result = json.loads(response.choices[0].message.content)
                         if isinstance(result, list):
-                            all_results.extend(result)
+                            for item in result:
+                                if isinstance(item, dict):
+                                    item["source_start"] = chunk_start
+                                    item["source_end"] = chunk_end
+                                    all_results.append(item)
                     except json.JSONDecodeError:
                         logger.warning("Failed to decode JSON from Mistral response")
 
+                chunk_start = chunk_end
+
             # Merge paragraphs if needed
             all_results = ContractProcessor._merge_paragraphs(all_results)
 
@@ -422,55 +554,103 @@ class ContractProcessor:
 
         return chunks
 
-    async def analyze_neighborhood(self, address: str) -> str:
-        """Analyze neighborhood based on address."""
+    async def analyze_neighborhood(self, address: str, location: Dict = None, area: str = None) -> str:
+        """
+        Analyze neighborhood based on address, using the location if already geocoded.
+
+        With a location and an area (postal code and city), the analysis is
+        shared by all contracts in the same geohash cell. It then describes
+        the cell around its center and only names the area, never the address.
+        """
         logger.info(f"Analyzing neighborhood for address: {address}")
 
         if not address:
             return ""
 
+        cell = None
+        if location and area:
+            cell = geohash.encode(location["lat"], location["lon"], settings.NEIGHBORHOOD_GEOHASH_PRECISION)
+            with span("neighborhood.cache") as cache_span:
+                cached = await sync_to_async(NeighborhoodCache.get)(
+                    cell, NEIGHBORHOOD_MAP_ZOOM, timedelta(days=settings.NEIGHBORHOOD_CACHE_TTL_DAYS)
+                )
+                cache_span.set(hit=bool(cached))
+            count_cache_lookup("neighborhood", hit=bool(cached))
+            if cached:
+                logger.info(f"Using cached neighborhood analysis of cell {cell}")
+                return cached
+
+            lat, lon = geohash.decode(cell)
+            location = {"lat": lat, "lon": lon}
+            address = area
+
         try:
+            facts = {}
+            if location:
+                with span("neighborhood.facts") as facts_span:
+                    facts = await sync_to_async(get_neighborhood_facts)(location["lat"], location["lon"])
+                    facts_span.set(categories=len(facts))
+
             # Get map image in a separate thread
-            loop = asyncio.get_event_loop()
-            map_image = await loop.run_in_executor(
-                self.executor,
-                lambda: get_neighborhood_map(address)
-            )
+            with span("map") as map_span:
+                map_image = await run_in_executor(
+                    self.executor,
+                    lambda: get_neighborhood_map(address, zoom=NEIGHBORHOOD_MAP_ZOOM, location=location)
+                )
+                map_span.set(rendered=map_image is not None)
 
             if not map_image:
                 logger.error("Failed to get neighborhood map")
-                return ""
+                if not facts:
+                    return ""
 
             # Analyze in a separate thread
-            result = await loop.run_in_executor(
+            result = await run_in_executor(
                 self.executor,
-                lambda: self._analyze_neighborhood_with_gemini(address, map_image)
+                lambda: self._analyze_neighborhood_with_gemini(address, map_image, facts)
             )
 
+            if cell and result:
+                await sync_to_async(NeighborhoodCache.store)(cell, NEIGHBORHOOD_MAP_ZOOM, result)
+
             return result
 
         except Exception as e:
             logger.error(f"Error in analyze_neighborhood: {e}")
             return ""
 
-    def _analyze_neighborhood_with_gemini(self, address: str, map_image) -> str:
+    @staticmethod
+    def format_neighborhood_facts(facts: Dict[str, Dict]) -> str:
+        """Describe the facts of get_neighborhood_facts as lines for the prompt"""
+        lines = []
+        for category, label in NEIGHBORHOOD_FACT_LABELS.items():
+            fact = facts.get(category)
+            if not fact:
+                lines.append(f"- {label}: keine im Datenbestand")
+                continue
+            nearest = f"nächste in {fact['nearest_m']} m"
+            if fact["nearest_name"]:
+                nearest += f" ({fact['nearest_name']})"
+            lines.append(f"- {label}: {nearest}, {fact['count']} im Umkreis von {fact['radius_m']} m")
+        return "\n".join(lines)
+
+    def _analyze_neighborhood_with_gemini(self, address: str, map_image, facts: Dict[str, Dict] = None) -> str:
         """Helper method to run in thread pool for Gemini API calls."""
-        from google.genai import types as genai_types
-
         try:
-            prompt = NEIGHBORHOOD_ANALYSIS_PROMPT_TEMPLATE.format(address=address)
+            prompt = NEIGHBORHOOD_ANALYSIS_PROMPT_TEMPLATE.format(
+                address=address,
+                facts=self.format_neighborhood_facts(facts) if facts else "Keine Fakten verfügbar.",
+            )
 
             # Generate content with the model
-            response = self.gemini_client.models.generate_content(
-                model=GEMINI_FLASH_MODEL,
-                contents=[prompt, map_image],
-                config=genai_types.GenerateContentConfig(
-                    temperature=0.3,
-                    top_p=0.9,
-                    top_k=32,
-                    max_output_tokens=2048
-                ),
-            )
+            with span("gemini.generate_content", provider="gemini", characters=len(prompt),
+                      images=1 if map_image else 0) as gemini_span:
+                response = self.gemini_client.models.generate_content(
+                    model=GEMINI_FLASH_MODEL,
+                    contents=[prompt, map_image] if map_image else [prompt],
+                    config=GEMINI_NEIGHBORHOOD_CONFIG,
+                )
+                gemini_span.set(response_characters=len(response.text or ""))
 
             return response.text or ""
 
@@ -0,0 +1,398 @@
+# contract_analysis/management/commands/bench_pipeline.py
+
+import json
+import logging
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from contract_analysis.models.contract import Contract
+from contract_analysis.models.geocoding import GeocodeCache, NeighborhoodCache
+from contract_analysis.utils.fake_providers import (
+    CONTRACT_TEXT,
+    FakeProviderServer,
+    FaultProfile,
+    create_fake_processor,
+)
+from contract_analysis.utils.image import convert_pdf_to_images
+from contract_analysis.models.poi import PointOfInterest
+from contract_analysis.utils.poi import invalidate_poi_index
+from contract_analysis.utils.spans import RunRecorder, percentile
+from contract_analysis.utils.tiles import get_tile_source
+from customers.models import User
+from klarmieten.metrics import CACHE_LOOKUPS, count_decrypted_bytes
+
+BENCH_PERCENTILES = (50, 95)
+
+# Uploaded PDF pages end up about this size, 200 dpi scaled to 35%
+PAGE_SIZE = (579, 819)
+
+# Roughly the text of a dense lease page
+PAGE_CHARACTERS = 2500
+
+IMAGE_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg"}
+
+FILLER_CLAUSES = [
+    ("Hausordnung", "Die Hausordnung ist Bestandteil dieses Vertrages. Der Mieter hält die Ruhezeiten von 22 bis 6 Uhr "
+                    "ein und beteiligt sich im Wechsel an der Reinigung des Treppenhauses."),
+    ("Betreten der Mietsache", "Der Vermieter darf die Wohnung nach rechtzeitiger Ankündigung zu üblichen Tageszeiten "
+                               "betreten, um ihren Zustand zu prüfen oder sie Kaufinteressenten zu zeigen."),
+    ("Modernisierung", "Maßnahmen zur Verbesserung der Mietsache hat der Mieter nach Maßgabe der gesetzlichen "
+                       "Vorschriften zu dulden. Eine Mieterhöhung nach Modernisierung richtet sich nach § 559 BGB."),
+    ("Bauliche Veränderungen", "Bauliche Veränderungen durch den Mieter, insbesondere Um- und Einbauten, bedürfen "
+                               "der vorherigen schriftlichen Zustimmung des Vermieters."),
+    ("Rückgabe der Mietsache", "Bei Beendigung des Mietverhältnisses gibt der Mieter die Wohnung mit sämtlichen "
+                               "Schlüsseln geräumt und besenrein zurück."),
+    ("Haftung", "Der Vermieter haftet für Schäden, die auf Mängeln der Mietsache beruhen, nur bei Vorsatz oder "
+                "grober Fahrlässigkeit, soweit es sich nicht um Schäden an Leben, Körper oder Gesundheit handelt."),
+]
+
+
+def synthetic_pages(page_count: int):
+    """
+    Text of a synthetic lease, one entry per page.
+
+    The first page holds the canned contract of the fake providers, the
+    others further clauses, each with a heading of its own.
+    """
+    pages = [CONTRACT_TEXT]
+    number = 8
+    while len(pages) < page_count:
+        page = []
+        while sum(len(paragraph) for paragraph in page) < PAGE_CHARACTERS:
+            title, body = FILLER_CLAUSES[number % len(FILLER_CLAUSES)]
+            page.append(f"§ {number} {title}, Teil {number // len(FILLER_CLAUSES)}\n{body}\n")
+            number += 1
+        pages.append("\n".join(page))
+    return pages
+
+
+def render_page(text: str) -> bytes:
+    """PNG of a page with its text, wrapped to fit"""
+    image = Image.new("RGB", PAGE_SIZE, "white")
+    draw = ImageDraw.Draw(image)
+    y = 30
+    for paragraph in text.splitlines():
+        # The default font is 6 pixels wide per character
+        for line in textwrap.wrap(paragraph, width=(PAGE_SIZE[0] - 60) // 6):
+            if y < PAGE_SIZE[1] - 30:
+                draw.text((30, y), line, fill="black")
+            y += 14
+        y += 6
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def load_corpus(corpus_dir: Path):
+    """
+    Yield name, loader and page texts of the leases in a directory.
+
+    A lease is a PDF or a directory of page images in file name order. A
+    `.txt` file next to the PDF or inside the directory holds its text with
+    pages separated by form feeds, for the fake OCR to return. Without one
+    the lease gets synthetic text.
+    """
+    for path in sorted(corpus_dir.iterdir()):
+        if path.suffix.lower() == ".pdf":
+            text_path = path.with_suffix(".txt")
+
+            def loader(contract, path=path):
+                with path.open("rb") as file:
+                    convert_pdf_to_images(File(file, name=path.name), contract)
+        elif path.is_dir():
+            text_path = next(iter(sorted(path.glob("*.txt"))), None)
+            images = [image for image in sorted(path.iterdir()) if image.suffix.lower() in IMAGE_TYPES]
+            if not images:
+                continue
+
+            def loader(contract, images=images):
+                for image in images:
+                    contract.add_file(image.name, image.read_bytes(), IMAGE_TYPES[image.suffix.lower()])
+        else:
+            continue
+
+        pages = text_path.read_text(encoding="utf-8").split("\f") if text_path and text_path.exists() else None
+        yield path.stem, loader, pages
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def summarize(values):
+    values = sorted(values)
+    summary = {"count": len(values), "max": round(values[-1], 3) if values else None}
+    for percent in BENCH_PERCENTILES:
+        value = percentile(values, percent)
+        summary[f"p{percent}"] = round(value, 3) if value is not None else None
+    return summary
+
+
+def git_revision():
+    """Commit of the checkout and whether it has uncommitted changes, None outside of git"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+class Command(BaseCommand):
+    help = 'Benchmark process_contract on synthetic or anonymized leases against fake providers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', default='1,5,20,60',
+                            help='Comma separated page counts of the synthetic leases, empty for none')
+        parser.add_argument('--corpus', help='Directory of anonymized leases, see load_corpus()')
+        parser.add_argument('--runs', type=int, default=5, help='Runs per lease')
+        parser.add_argument('--warm', action='store_true',
+                            help='Keep geocodes, neighborhood analyses and tiles between runs')
+        parser.add_argument('--latency-ms', type=float, default=50, help='Median provider latency in milliseconds')
+        parser.add_argument('--sigma', type=float, default=0.5, help='Spread of the log-normal latency distribution')
+        parser.add_argument('--error-rate', type=float, default=0, help='Share of provider calls failing')
+        parser.add_argument('--rate-limit-rate', type=float, default=0, help='Share of provider calls failing with 429')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of latencies and failures')
+        parser.add_argument('--output', help='Report path, by default bench-pipeline-<commit>-<time>.json')
+        parser.add_argument('--compare', help='Earlier report to compare the run latencies with')
+
+    def handle(self, *args, **options):
+        try:
+            page_counts = [int(count) for count in options['pages'].split(',') if count.strip()]
+        except ValueError:
+            raise CommandError(f"Invalid page counts: {options['pages']}")
+        if any(count < 1 for count in page_counts) or options['runs'] < 1:
+            raise CommandError("Page counts and runs must be at least 1")
+
+        leases = []
+        for count in page_counts:
+            pages = synthetic_pages(count)
+            images = [render_page(text) for text in pages]
+
+            def loader(contract, images=images):
+                for number, content in enumerate(images, 1):
+                    contract.add_file(f"synthetic_page_{number}.png", content, "image/png")
+
+            leases.append((f"synthetic-{count}p", loader, pages))
+        if options['corpus']:
+            corpus_dir = Path(options['corpus'])
+            if not corpus_dir.is_dir():
+                raise CommandError(f"Corpus {corpus_dir} is not a directory")
+            leases.extend(load_corpus(corpus_dir))
+        if not leases:
+            raise CommandError("No leases to benchmark")
+
+        commit, dirty = git_revision()
+        profile = FaultProfile(
+            median_ms=options['latency_ms'],
+            sigma=options['sigma'],
+            error_rate=options['error_rate'],
+            rate_limit_rate=options['rate_limit_rate'],
+            seed=options['seed'],
+        )
+        report = {
+            "commit": commit,
+            "dirty": dirty,
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "options": {
+                name: options[name]
+                for name in ('runs', 'warm', 'latency_ms', 'sigma', 'error_rate', 'rate_limit_rate', 'seed')
+            },
+        }
+
+        # The points of interest are the only data read from the real database,
+        # they are copied into the benchmark database
+        points = list(PointOfInterest.objects.values_list("category", "osm_id", "name", "latitude", "longitude"))
+        report["poi_count"] = len(points)
+
+        work_dir = Path(tempfile.mkdtemp(prefix="bench-pipeline-"))
+        temp_dir = work_dir / "tmp"
+        temp_dir.mkdir()
+        tile_dir = work_dir / "tiles"
+        old_tempdir = tempfile.tempdir
+        old_test_name = connection.settings_dict["TEST"]["NAME"]
+        old_name = None
+        # Pipeline logs would drown the progress output
+        if options['verbosity'] < 2:
+            logging.disable(logging.INFO)
+
+        try:
+            if connection.vendor == "sqlite":
+                # A file, so that the pipeline's threads can share it
+                connection.settings_dict["TEST"]["NAME"] = str(work_dir / "bench.sqlite3")
+            # Runs write contracts and caches, keep them out of the real database
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            PointOfInterest.objects.bulk_create(
+                [
+                    PointOfInterest(category=category, osm_id=osm_id, name=name, latitude=lat, longitude=lon)
+                    for category, osm_id, name, lat, lon in points
+                ],
+                batch_size=5000,
+            )
+            # Regions loaded before would hold the points of the real database
+            invalidate_poi_index()
+            user = User.objects.create_user("bench_pipeline")
+
+            server = FakeProviderServer(FaultProfile(
+                profile.median_ms, profile.sigma, profile.error_rate, profile.rate_limit_rate, seed=profile.seed + 3
+            ))
+            with server, override_settings(
+                NOMINATIM_URL=server.nominatim_url, TILE_URL=server.tile_url,
+                TILE_CACHE_DIR=str(tile_dir), MBTILES_PATH=None,
+            ):
+                get_tile_source.cache_clear()
+                processor = create_fake_processor(profile, seed=options['seed'])
+                # get_images() leaves its files in the temp directory, so they can be counted there
+                tempfile.tempdir = str(temp_dir)
+                cache_lookups = dict(CACHE_LOOKUPS.values)
+                try:
+                    report["leases"] = [
+                        self.bench_lease(processor, user, name, loader, pages, options, temp_dir, tile_dir)
+                        for name, loader, pages in leases
+                    ]
+                finally:
+                    tempfile.tempdir = old_tempdir
+                    processor.executor.shutdown(wait=True)
+                    get_tile_source.cache_clear()
+                report["cache_lookups"] = {
+                    f"{cache_name}.{result}": count - cache_lookups.get((cache_name, result), 0)
+                    for (cache_name, result), count in sorted(CACHE_LOOKUPS.values.items())
+                    if count != cache_lookups.get((cache_name, result), 0)
+                }
+        finally:
+            logging.disable(logging.NOTSET)
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            connection.settings_dict["TEST"]["NAME"] = old_test_name
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        stages = defaultdict(list)
+        for lease in report["leases"]:
+            for name, durations in lease.pop("_durations").items():
+                stages[name].extend(durations)
+        report["stages"] = {name: summarize(durations) for name, durations in sorted(stages.items())}
+        report["peak_rss_bytes"] = peak_rss_bytes()
+
+        default_output = f"bench-pipeline-{(commit or 'unknown')[:8]}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+        output = Path(options['output'] or default_output)
+        output.write_text(json.dumps(report, indent=2))
+
+        self.print_summary(report)
+        if options['compare']:
+            self.print_comparison(json.loads(Path(options['compare']).read_text()), report)
+        self.stdout.write(self.style.SUCCESS(f"Report written to {output}"))
+
+    def bench_lease(self, processor, user, name, loader, pages, options, temp_dir, tile_dir):
+        """Run one lease and summarize its runs"""
+        contract = Contract.objects.create(user=user, name=name)
+        loader(contract)
+        page_count = contract.files.count()
+        file_bytes = sum(contract.files.values_list("file_size", flat=True))
+        processor.vision_client.text = pages or synthetic_pages(page_count)
+
+        durations = defaultdict(list)
+        providers = Counter()
+        decrypted, temp_files, temp_bytes = [], [], []
+        errors = 0
+        for number in range(options['runs']):
+            # Every run analyzes the lease from scratch
+            details = contract.get_details()
+            details.full_contract_text = ""
+            details.geocoded_address = None
+            details.save()
+            if not options['warm']:
+                GeocodeCache.objects.all().delete()
+                NeighborhoodCache.objects.all().delete()
+                shutil.rmtree(tile_dir, ignore_errors=True)
+
+            run = RunRecorder()
+            start = time.perf_counter()
+            try:
+                with run.activate(), count_decrypted_bytes() as tally:
+                    result = async_to_sync(processor.process_contract)(contract=contract)
+                if result.get("error"):
+                    errors += 1
+            except Exception as e:
+                errors += 1
+                self.stderr.write(f"{name} run {number + 1} failed: {e}")
+            durations["run"].append((time.perf_counter() - start) * 1000)
+
+            for span in run.spans:
+                durations[span.name].append((span.end - span.start) * 1000)
+                if span.provider:
+                    providers[f"{span.provider}.{span.outcome}"] += 1
+            decrypted.append(tally[0])
+            created = [path for path in temp_dir.iterdir() if path.is_file()]
+            temp_files.append(len(created))
+            temp_bytes.append(sum(path.stat().st_size for path in created))
+            for path in created:
+                path.unlink()
+
+        runs = options['runs']
+        self.stdout.write(f"{name}: {page_count} pages, {runs} runs, p50 {summarize(durations['run'])['p50']:.0f}ms")
+        return {
+            "name": name,
+            "pages": page_count,
+            "file_bytes": file_bytes,
+            "runs": runs,
+            "errors": errors,
+            "stages": {stage: summarize(values) for stage, values in sorted(durations.items())},
+            "decrypted_bytes_per_run": round(sum(decrypted) / runs),
+            "temp_files_per_run": round(sum(temp_files) / runs, 2),
+            "temp_bytes_per_run": round(sum(temp_bytes) / runs),
+            "provider_calls": dict(sorted(providers.items())),
+            # High-water mark of the process so far, it never goes down
+            "peak_rss_bytes": peak_rss_bytes(),
+            "_durations": durations,
+        }
+
+    def print_summary(self, report):
+        self.stdout.write("")
+        self.stdout.write(f"{'stage':32} {'count':>6} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+        for name, stage in report["stages"].items():
+            self.stdout.write(
+                f"{name:32} {stage['count']:6} {stage['p50']:10.1f} {stage['p95']:10.1f} {stage['max']:10.1f}"
+            )
+        self.stdout.write(f"Peak RSS {report['peak_rss_bytes'] / 1024 / 1024:.1f} MiB")
+
+    def print_comparison(self, baseline, report):
+        """p50 and p95 of whole runs per lease, against an earlier report"""
+        self.stdout.write("")
+        self.stdout.write(f"Compared with {(baseline.get('commit') or 'unknown')[:8]}:")
+        earlier = {lease["name"]: lease for lease in baseline.get("leases", [])}
+        for lease in report["leases"]:
+            if lease["name"] not in earlier:
+                continue
+            changes = []
+            for key in (f"p{percent}" for percent in BENCH_PERCENTILES):
+                before = earlier[lease["name"]]["stages"]["run"][key]
+                after = lease["stages"]["run"][key]
+                changes.append(f"{key} {before:.0f} -> {after:.0f}ms ({(after - before) / before * 100:+.1f}%)")
+            self.stdout.write(f"  {lease['name']:24} " + ", ".join(changes))
@@ -0,0 +1,66 @@
+# contract_analysis/management/commands/geocode_contracts.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from contract_analysis.analysis import ContractProcessor
+from contract_analysis.models.contract import ContractDetails
+from contract_analysis.utils.geocoding import geocode_address, is_final_location
+
+
+class Command(BaseCommand):
+    help = 'Geocode analyzed contracts that have an address but no or only fallback coordinates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delay', type=float, default=1.0,
+                            help='Seconds to wait between contracts, Nominatim allows one request per second')
+        parser.add_argument('--limit', type=int, help='Geocode at most this many contracts')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the contracts without coordinates')
+
+    def handle(self, *args, **options):
+        details = (
+            ContractDetails.objects.defer(*ContractDetails.LARGE_TEXT_FIELDS)
+            .select_related("contract")
+            # Postal code fallbacks have coordinates, but no geocoded address
+            .filter(Q(latitude__isnull=True) | Q(geocoded_address__isnull=True), contract__status="analyzed")
+            .exclude(street__isnull=True, postal_code__isnull=True, city__isnull=True)
+            .order_by("pk")
+        )
+        if options['limit']:
+            details = details[:options['limit']]
+        details = list(details)
+
+        if options['dry_run']:
+            self.stdout.write(f"{len(details)} contracts without final coordinates")
+            return
+
+        located = 0
+        for index, contract_details in enumerate(details):
+            address = ContractProcessor.get_address_from_details({
+                "street": contract_details.street,
+                "postal_code": contract_details.postal_code,
+                "city": contract_details.city,
+            })
+            if not address:
+                continue
+            if index:
+                time.sleep(options['delay'])
+
+            location = geocode_address(address)
+            if location is None or (contract_details.location and not is_final_location(address, location)):
+                self.stdout.write(f"No better location for contract {contract_details.contract_id}")
+                continue
+
+            contract_details.update({
+                "latitude": location["lat"],
+                "longitude": location["lon"],
+                "geocode_precision": location["precision"],
+                "geocoded_address": address[:255] if is_final_location(address, location) else None,
+            })
+            # The cached page fragments render the map from the coordinates
+            contract_details.contract.bump_content_version()
+            located += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Geocoded {located} of {len(details)} contracts"))
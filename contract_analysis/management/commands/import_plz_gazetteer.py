@@ -0,0 +1,59 @@
+# contract_analysis/management/commands/import_plz_gazetteer.py
+
+import csv
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from contract_analysis.utils.gazetteer import PostalCodeGazetteer
+
+
+class Command(BaseCommand):
+    help = 'Compile a CSV of German postal codes with city and centroid into the offline gazetteer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', help='CSV file with a header row, comma, semicolon or tab separated')
+        parser.add_argument('--plz-column', default='plz')
+        parser.add_argument('--city-column', default='ort')
+        parser.add_argument('--lat-column', default='lat')
+        parser.add_argument('--lon-column', default='lon')
+        parser.add_argument('--output', default=settings.PLZ_GAZETTEER_PATH)
+
+    def handle(self, *args, **options):
+        columns = [options['plz_column'], options['city_column'], options['lat_column'], options['lon_column']]
+
+        rows = []
+        skipped = 0
+        with open(options['csv_path'], newline='', encoding='utf-8-sig') as file:
+            dialect = csv.Sniffer().sniff(file.read(4096), delimiters=',;\t')
+            file.seek(0)
+            reader = csv.DictReader(file, dialect=dialect)
+
+            missing = [column for column in columns if column not in (reader.fieldnames or [])]
+            if missing:
+                raise CommandError(f"Missing columns {missing}, found {reader.fieldnames}")
+
+            for record in reader:
+                postal_code, city, lat, lon = (record[column] for column in columns)
+                try:
+                    rows.append((
+                        int(postal_code),
+                        " ".join(city.split()),
+                        float(lat.replace(',', '.')),
+                        float(lon.replace(',', '.')),
+                    ))
+                except (AttributeError, ValueError):
+                    skipped += 1
+
+        if not rows:
+            raise CommandError("No valid rows found")
+
+        gazetteer = PostalCodeGazetteer.from_rows(rows)
+        output = Path(options['output'])
+        output.parent.mkdir(parents=True, exist_ok=True)
+        gazetteer.save(output)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {len(gazetteer)} postal code areas to {output} ({output.stat().st_size} bytes, {skipped} rows skipped)'
+        ))
@@ -0,0 +1,147 @@
+# contract_analysis/management/commands/import_pois.py
+
+import json
+import math
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from contract_analysis.models.poi import PointOfInterest
+from contract_analysis.utils.poi import invalidate_poi_index
+
+MAJOR_ROAD_TYPES = {"motorway", "motorway_link", "trunk", "trunk_link", "primary", "secondary"}
+TRANSIT_RAILWAY_TYPES = {"station", "halt", "tram_stop"}
+
+# Lines and areas get a point at least this often, in meters
+POINT_SPACING_M = 50
+
+BATCH_SIZE = 5000
+
+
+def categorize(tags: dict):
+    """Category of an OSM feature by its tags, or None if it is not relevant"""
+    if (
+        tags.get("highway") == "bus_stop"
+        or tags.get("railway") in TRANSIT_RAILWAY_TYPES
+        or tags.get("public_transport") == "station"
+    ):
+        return "transit"
+    if tags.get("amenity") == "school":
+        return "school"
+    if tags.get("shop") == "supermarket":
+        return "supermarket"
+    if tags.get("leisure") == "park":
+        return "park"
+    if tags.get("highway") in MAJOR_ROAD_TYPES:
+        return "major_road"
+    return None
+
+
+def _densify(line):
+    """Yield the vertices of a line with extra points so none are further apart than POINT_SPACING_M"""
+    for index, (lon, lat) in enumerate(line):
+        if index:
+            previous_lon, previous_lat = line[index - 1]
+            # Equirectangular distance is plenty for splitting short segments
+            dx = (lon - previous_lon) * math.cos(math.radians(lat)) * 111320
+            dy = (lat - previous_lat) * 110540
+            steps = int(math.hypot(dx, dy) // POINT_SPACING_M)
+            for step in range(1, steps + 1):
+                fraction = step / (steps + 1)
+                yield (
+                    previous_lat + (lat - previous_lat) * fraction,
+                    previous_lon + (lon - previous_lon) * fraction,
+                )
+        yield lat, lon
+
+
+def geometry_points(geometry: dict):
+    """Yield (latitude, longitude) points covering a GeoJSON geometry"""
+    geometry_type = geometry.get("type")
+    coordinates = geometry.get("coordinates") or []
+
+    if geometry_type == "Point":
+        yield coordinates[1], coordinates[0]
+    elif geometry_type == "MultiPoint":
+        for lon, lat, *_ in coordinates:
+            yield lat, lon
+    elif geometry_type == "LineString":
+        yield from _densify([point[:2] for point in coordinates])
+    elif geometry_type in ("MultiLineString", "Polygon"):
+        # For areas only the outline matters, the distance is measured to its edge
+        lines = coordinates if geometry_type == "MultiLineString" else coordinates[:1]
+        for line in lines:
+            yield from _densify([point[:2] for point in line])
+    elif geometry_type == "MultiPolygon":
+        for polygon in coordinates:
+            yield from _densify([point[:2] for point in polygon[0]])
+    elif geometry_type == "GeometryCollection":
+        for part in geometry.get("geometries", []):
+            yield from geometry_points(part)
+
+
+def _osm_id(feature: dict, number: int) -> str:
+    properties = feature.get("properties") or {}
+    if "@type" in properties and "@id" in properties:
+        return f"{properties['@type']}/{properties['@id']}"
+    return str(feature.get("id") or properties.get("osm_id") or f"feature/{number}")
+
+
+def read_features(path: str):
+    """Yield the features of a GeoJSON FeatureCollection, or of a GeoJSON text sequence"""
+    with open(path, encoding="utf-8") as file:
+        if path.endswith((".geojsonseq", ".geojsonl", ".jsonl")):
+            for line in file:
+                line = line.strip("\x1e \r\n")
+                if line:
+                    yield json.loads(line)
+        else:
+            data = json.load(file)
+            if data.get("type") != "FeatureCollection":
+                raise CommandError(f"{path} is not a GeoJSON FeatureCollection")
+            yield from data.get("features", [])
+
+
+class Command(BaseCommand):
+    help = 'Replace the points of interest with an OSM extract in GeoJSON, e.g. from osmium export'
+
+    def add_arguments(self, parser):
+        parser.add_argument('geojson_path', help='GeoJSON FeatureCollection, or a .geojsonseq text sequence')
+
+    def handle(self, *args, **options):
+        counts = {category: 0 for category, _ in PointOfInterest.CATEGORY_CHOICES}
+        points = []
+        skipped = 0
+
+        try:
+            for number, feature in enumerate(read_features(options['geojson_path'])):
+                properties = feature.get("properties") or {}
+                category = categorize(properties)
+                if category is None or not feature.get("geometry"):
+                    skipped += 1
+                    continue
+
+                osm_id = _osm_id(feature, number)
+                name = (properties.get("name") or "")[:255]
+                feature_points = [
+                    PointOfInterest(category=category, osm_id=osm_id, name=name, latitude=lat, longitude=lon)
+                    for lat, lon in geometry_points(feature["geometry"])
+                ]
+                if feature_points:
+                    counts[category] += 1
+                    points.extend(feature_points)
+        except (OSError, ValueError, TypeError, IndexError) as e:
+            raise CommandError(f"Could not read {options['geojson_path']}: {e}")
+
+        if not points:
+            raise CommandError("No points of interest found")
+
+        with transaction.atomic():
+            PointOfInterest.objects.all().delete()
+            PointOfInterest.objects.bulk_create(points, batch_size=BATCH_SIZE)
+        invalidate_poi_index()
+
+        summary = ", ".join(f"{count} {category}" for category, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {len(points)} points of {sum(counts.values())} features ({summary}, {skipped} features skipped)'
+        ))
@@ -0,0 +1,39 @@
+# contract_analysis/management/commands/run_fake_providers.py
+
+from django.core.management.base import BaseCommand
+
+from contract_analysis.utils.fake_providers import FakeProviderServer, FaultProfile
+
+
+class Command(BaseCommand):
+    help = 'Serve fake Nominatim search and OSM tiles on localhost for offline runs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+        parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+        parser.add_argument('--latency-ms', type=float, default=0, help='Median response latency in milliseconds')
+        parser.add_argument('--sigma', type=float, default=0, help='Spread of the log-normal latency distribution')
+        parser.add_argument('--error-rate', type=float, default=0, help='Share of responses failing with HTTP 500')
+        parser.add_argument('--rate-limit-rate', type=float, default=0, help='Share of responses failing with HTTP 429')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of latencies and failures')
+
+    def handle(self, *args, **options):
+        profile = FaultProfile(
+            median_ms=options['latency_ms'],
+            sigma=options['sigma'],
+            error_rate=options['error_rate'],
+            rate_limit_rate=options['rate_limit_rate'],
+            seed=options['seed'],
+        )
+        server = FakeProviderServer(profile, host=options['host'], port=options['port'])
+
+        self.stdout.write(f'Serving fake providers at {server.url}, point the app at them with:')
+        self.stdout.write(f'  NOMINATIM_URL={server.nominatim_url}')
+        self.stdout.write(f'  TILE_URL={server.tile_url}')
+        self.stdout.write('  TILE_CACHE_DIR=<a directory of its own, so fake tiles never mix with real ones>')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.stop()
@@ -0,0 +1,51 @@
+import contract_analysis.models.fields
+from django.db import migrations
+
+ENCRYPTED_FIELDS = ["neighborhood_analysis", "full_contract_text", "simplified_paragraphs"]
+
+
+def encrypt_existing_text(apps, schema_editor):
+    ContractDetails = apps.get_model("contract_analysis", "ContractDetails")
+    for details in ContractDetails.objects.iterator():
+        for name in ENCRYPTED_FIELDS:
+            setattr(details, f"{name}_encrypted", getattr(details, name))
+        details.save(update_fields=[f"{name}_encrypted" for name in ENCRYPTED_FIELDS])
+
+
+def decrypt_existing_text(apps, schema_editor):
+    ContractDetails = apps.get_model("contract_analysis", "ContractDetails")
+    for details in ContractDetails.objects.iterator():
+        for name in ENCRYPTED_FIELDS:
+            setattr(details, name, getattr(details, f"{name}_encrypted"))
+        details.save(update_fields=ENCRYPTED_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contract_analysis", "0002_initial"),
+    ]
+
+    operations = [
+        *[
+            migrations.AddField(
+                model_name="contractdetails",
+                name=f"{name}_encrypted",
+                field=contract_analysis.models.fields.EncryptedTextField(blank=True, null=True),
+            )
+            for name in ENCRYPTED_FIELDS
+        ],
+        migrations.RunPython(encrypt_existing_text, decrypt_existing_text),
+        *[
+            migrations.RemoveField(model_name="contractdetails", name=name)
+            for name in ENCRYPTED_FIELDS
+        ],
+        *[
+            migrations.RenameField(
+                model_name="contractdetails",
+                old_name=f"{name}_encrypted",
+                new_name=name,
+            )
+            for name in ENCRYPTED_FIELDS
+        ],
+    ]
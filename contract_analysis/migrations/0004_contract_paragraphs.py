@@ -0,0 +1,108 @@
+# Generated by Django 5.1.9 on 2026-10-19 10:50
+
+import ast
+import hashlib
+
+import contract_analysis.models.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def split_simplified_paragraphs(apps, schema_editor):
+    ContractDetails = apps.get_model("contract_analysis", "ContractDetails")
+    ContractParagraph = apps.get_model("contract_analysis", "ContractParagraph")
+
+    for details in ContractDetails.objects.exclude(simplified_paragraphs=None).iterator():
+        try:
+            # Paragraphs were stored as the repr of the list returned by Mistral
+            items = ast.literal_eval(details.simplified_paragraphs)
+        except (ValueError, SyntaxError):
+            continue
+
+        paragraphs = []
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict):
+                continue
+            title = (item.get("title") or "")[:255]
+            simplified = item.get("simplified") or ""
+            paragraphs.append(
+                ContractParagraph(
+                    details=details,
+                    ordinal=len(paragraphs),
+                    title=title,
+                    simplified=simplified,
+                    content_hash=hashlib.sha256(
+                        f"{title}\0{simplified}".encode("utf-8")
+                    ).hexdigest(),
+                )
+            )
+        ContractParagraph.objects.bulk_create(paragraphs)
+
+
+def join_simplified_paragraphs(apps, schema_editor):
+    ContractDetails = apps.get_model("contract_analysis", "ContractDetails")
+
+    for details in ContractDetails.objects.iterator():
+        paragraphs = [
+            {"title": paragraph.title, "simplified": paragraph.simplified}
+            for paragraph in details.paragraphs.order_by("ordinal")
+        ]
+        if paragraphs:
+            details.simplified_paragraphs = str(paragraphs)
+            details.save(update_fields=["simplified_paragraphs"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contract_analysis", "0003_encrypt_contract_details_text"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ContractParagraph",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("ordinal", models.PositiveIntegerField()),
+                ("title", models.CharField(blank=True, default="", max_length=255)),
+                (
+                    "simplified",
+                    contract_analysis.models.fields.EncryptedTextField(
+                        blank=True, null=True
+                    ),
+                ),
+                ("source_start", models.PositiveIntegerField(blank=True, null=True)),
+                ("source_end", models.PositiveIntegerField(blank=True, null=True)),
+                ("content_hash", models.CharField(max_length=64)),
+                (
+                    "details",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="paragraphs",
+                        to="contract_analysis.contractdetails",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["ordinal"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("details", "ordinal"), name="unique_paragraph_ordinal"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(split_simplified_paragraphs, join_simplified_paragraphs),
+        migrations.RemoveField(
+            model_name="contractdetails",
+            name="simplified_paragraphs",
+        ),
+    ]
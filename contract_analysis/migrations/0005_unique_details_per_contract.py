@@ -0,0 +1,37 @@
+# Generated by Django 5.1.9 on 2026-10-19 10:51
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def delete_duplicate_details(apps, schema_editor):
+    ContractDetails = apps.get_model("contract_analysis", "ContractDetails")
+
+    # Views always read the lowest id via filter().first(), so keep that row
+    duplicates = (
+        ContractDetails.objects.exclude(contract=None)
+        .values("contract")
+        .annotate(count=Count("id"), keep_id=Min("id"))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        ContractDetails.objects.filter(contract=duplicate["contract"]).exclude(
+            id=duplicate["keep_id"]
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contract_analysis", "0004_contract_paragraphs"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_details, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="contractdetails",
+            constraint=models.UniqueConstraint(
+                fields=("contract",), name="unique_details_per_contract"
+            ),
+        ),
+    ]
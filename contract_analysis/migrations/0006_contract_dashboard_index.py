@@ -0,0 +1,22 @@
+# Generated by Django 5.1.9 on 2026-10-19 10:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contract_analysis", "0005_unique_details_per_contract"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="contract",
+            index=models.Index(
+                fields=["user", "archived", "-uploaded_at", "-id"],
+                name="contract_dashboard_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.9 on 2026-10-19 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contract_analysis", "0006_contract_dashboard_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="contract",
+            name="content_version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.9 on 2026-10-19 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contract_analysis", "0007_contract_content_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="contractdetails",
+            name="geocode_precision",
+            field=models.CharField(
+                blank=True,
+                help_text="Nominatim address type of the match",
+                max_length=32,
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="contractdetails",
+            name="geocoded_address",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name="contractdetails",
+            name="latitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="contractdetails",
+            name="longitude",
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.9 on 2026-10-19 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contract_analysis", "0008_contract_details_coordinates"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GeocodeCache",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("address_key", models.CharField(max_length=64, unique=True)),
+                ("normalized_address", models.CharField(max_length=255)),
+                ("latitude", models.FloatField(blank=True, null=True)),
+                ("longitude", models.FloatField(blank=True, null=True)),
+                ("precision", models.CharField(blank=True, max_length=32, null=True)),
+                ("fetched_at", models.DateTimeField()),
+            ],
+            options={
+                "verbose_name": "Geocode Cache Entry",
+                "verbose_name_plural": "Geocode Cache",
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.9 on 2026-10-19 11:08
+
+import contract_analysis.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contract_analysis", "0009_geocode_cache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NeighborhoodCache",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("geohash", models.CharField(max_length=12)),
+                ("zoom", models.PositiveSmallIntegerField()),
+                ("analysis", contract_analysis.models.fields.EncryptedTextField()),
+                ("created_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Neighborhood Cache Entry",
+                "verbose_name_plural": "Neighborhood Cache",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("geohash", "zoom"), name="unique_neighborhood_cell"
+                    )
+                ],
+            },
+        ),
+    ]
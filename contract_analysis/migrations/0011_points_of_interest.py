@@ -0,0 +1,53 @@
+# Generated by Django 5.1.9 on 2026-10-19 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contract_analysis", "0010_neighborhood_cache"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PointOfInterest",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "category",
+                    models.CharField(
+                        choices=[
+                            ("transit", "Transit stop"),
+                            ("school", "School"),
+                            ("supermarket", "Supermarket"),
+                            ("park", "Park"),
+                            ("major_road", "Major road"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("osm_id", models.CharField(max_length=32)),
+                ("name", models.CharField(blank=True, default="", max_length=255)),
+                ("latitude", models.FloatField()),
+                ("longitude", models.FloatField()),
+            ],
+            options={
+                "verbose_name": "Point of Interest",
+                "verbose_name_plural": "Points of Interest",
+                "indexes": [
+                    models.Index(
+                        fields=["category"], name="contract_an_categor_c8905f_idx"
+                    )
+                ],
+            },
+        ),
+    ]
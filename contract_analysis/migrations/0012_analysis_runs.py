@@ -0,0 +1,92 @@
+# Generated by Django 5.1.9 on 2026-10-19 11:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contract_analysis", "0011_points_of_interest"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AnalysisRun",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("started_at", models.DateTimeField(db_index=True)),
+                ("duration_ms", models.FloatField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("success", "Success"), ("error", "Error")],
+                        max_length=10,
+                    ),
+                ),
+                ("error", models.TextField(blank=True, default="")),
+                (
+                    "contract",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="runs",
+                        to="contract_analysis.contract",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Analysis Run",
+                "verbose_name_plural": "Analysis Runs",
+                "ordering": ["-started_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="AnalysisSpan",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=64)),
+                ("parent", models.CharField(blank=True, default="", max_length=64)),
+                ("start_ms", models.FloatField()),
+                ("duration_ms", models.FloatField()),
+                ("success", models.BooleanField(default=True)),
+                ("error", models.TextField(blank=True, default="")),
+                ("attributes", models.JSONField(blank=True, default=dict)),
+                (
+                    "run",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="spans",
+                        to="contract_analysis.analysisrun",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Analysis Span",
+                "verbose_name_plural": "Analysis Spans",
+                "ordering": ["run", "start_ms"],
+                "indexes": [
+                    models.Index(
+                        fields=["name", "run"], name="contract_an_name_2fe8c4_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.9 on 2026-10-19 11:53
+
+from django.db import migrations
+
+
+def delete_geocode_cache(apps, schema_editor):
+    # Keyed by a plain hash of the address, these entries are never found again
+    apps.get_model("contract_analysis", "GeocodeCache").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contract_analysis", "0012_analysis_runs"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_geocode_cache, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="geocodecache",
+            name="normalized_address",
+        ),
+    ]
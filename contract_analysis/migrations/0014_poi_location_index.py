@@ -0,0 +1,17 @@
+# Generated by Django 5.1.9 on 2026-10-19 11:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("contract_analysis", "0013_geocode_cache_drop_address"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="pointofinterest",
+            index=models.Index(fields=["latitude", "longitude"], name="poi_location_idx"),
+        ),
+    ]
@@ -1,11 +1,15 @@
 # models.py
+import functools
+import hashlib
 import logging
 import tempfile
 import uuid
-from typing import List
+from datetime import datetime
+from typing import Dict, List
 
 from django.db import models
 
+from contract_analysis.models.fields import EncryptedPayload, EncryptedTextField
 from contract_analysis.utils.encryption import encrypt_file, decrypt_file
 from customers.models import Entitlement, User
 
@@ -31,6 +35,9 @@ class Contract(models.Model):
     retention_days = models.IntegerField(default=365)
     scheduled_deletion_date = models.DateField(null=True, blank=True)
 
+    # Bumped whenever the analysis results change, keys the cached page fragments
+    content_version = models.PositiveIntegerField(default=0)
+
     def save(self, *args, **kwargs):
         if self.pk:
             logger.info(f"Updating Contract {self.pk} for user {self.user}")
@@ -50,18 +57,80 @@ class Contract(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=["user", "status"]),
+            # Supports the keyset-paginated dashboard listing
+            models.Index(
+                fields=["user", "archived", "-uploaded_at", "-id"],
+                name="contract_dashboard_idx",
+            ),
         ]
 
     def __str__(self):
         return f"Contract {self.id} for {self.user.username}"
 
+    @staticmethod
+    def get_dashboard_page(user, cursor: str = None, page_size: int = 12):
+        """
+        Get a page of active contracts for the dashboard, newest first.
+
+        Uses keyset pagination on (uploaded_at, id) and annotates the page
+        count and first page id, so a page costs two queries regardless of size.
+
+        Returns:
+            Tuple of the contracts and the cursor of the next page (or None)
+        """
+        contracts = (
+            Contract.objects.filter(user=user, archived=False)
+            .annotate(page_count=models.Count("files"), first_file_id=models.Min("files__id"))
+            .prefetch_related(
+                models.Prefetch(
+                    "files",
+                    queryset=ContractFile.objects.only("id", "contract_id", "file_name").order_by("id"),
+                )
+            )
+            .order_by("-uploaded_at", "-id")
+        )
+
+        position = Contract.decode_cursor(cursor)
+        if position:
+            uploaded_at, contract_id = position
+            contracts = contracts.filter(
+                models.Q(uploaded_at__lt=uploaded_at)
+                | models.Q(uploaded_at=uploaded_at, id__lt=contract_id)
+            )
+
+        # Fetch one extra row to know whether there is a next page
+        page = list(contracts[:page_size + 1])
+        next_cursor = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            next_cursor = Contract.encode_cursor(page[-1])
+
+        return page, next_cursor
+
+    @staticmethod
+    def encode_cursor(contract) -> str:
+        return f"{contract.uploaded_at.isoformat()}|{contract.id}"
+
+    @staticmethod
+    def decode_cursor(cursor: str):
+        """Parse a dashboard cursor, returning None if it is missing or malformed."""
+        if not cursor:
+            return None
+        try:
+            uploaded_at, contract_id = cursor.split("|", 1)
+            return datetime.fromisoformat(uploaded_at), uuid.UUID(contract_id)
+        except ValueError:
+            return None
+
+    def bump_content_version(self):
+        """Increment the content version atomically and reload it."""
+        Contract.objects.filter(pk=self.pk).update(content_version=models.F("content_version") + 1)
+        self.refresh_from_db(fields=["content_version"])
+
     def get_details(self):
         """Get contract details object for contract."""
-        # Check if details already exist
-        contract_details = ContractDetails.objects.filter(contract=self).first()
-        if not contract_details:
-            contract_details = ContractDetails.objects.create(contract=self)
-
+        # The unique constraint on contract makes concurrent callers converge on one row
+        contract_details, _ = ContractDetails.objects.get_or_create(contract=self)
         return contract_details
 
     def get_images(self) -> List[str]:
@@ -263,18 +332,33 @@ class ContractDetails(models.Model):
     has_stepped_rent = models.BooleanField(default=False, null=True, blank=True)
     has_indexed_rent = models.BooleanField(default=False, null=True, blank=True)
 
-    # AI Extracted Data
-    neighborhood_analysis = models.TextField(null=True, blank=True)
-    full_contract_text = models.TextField(null=True, blank=True)
-    simplified_paragraphs = models.TextField(null=True, blank=True)
+    # Coordinates of geocoded_address, set during analysis
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geocode_precision = models.CharField(
+        max_length=32, null=True, blank=True, help_text="Nominatim address type of the match"
+    )
+    geocoded_address = models.CharField(max_length=255, null=True, blank=True)
+
+    # AI Extracted Data (compressed and encrypted, decoded on first access)
+    neighborhood_analysis = EncryptedTextField(null=True, blank=True)
+    full_contract_text = EncryptedTextField(null=True, blank=True)
+
+    # Large fields that views not showing them should defer
+    LARGE_TEXT_FIELDS = ["full_contract_text"]
+
+    # Set by geocoding, not extracted from the contract
+    GEOCODE_FIELDS = ["latitude", "longitude", "geocode_precision", "geocoded_address"]
 
     class Meta:
         verbose_name = "Rental Contract"
         verbose_name_plural = "Rental Contracts"
+        constraints = [
+            models.UniqueConstraint(fields=["contract"], name="unique_details_per_contract")
+        ]
 
     def __str__(self):
-        items = self.__dict__.items()
-        return f"{self.contract} - {', '.join([f'{k}: {v}' for k, v in items])}"
+        return f"Details {self.pk} of {self.contract}"
 
     @property
     def total_rent(self):
@@ -287,6 +371,13 @@ class ContractDetails(models.Model):
                 + (self.other_costs or 0)
         )
 
+    @property
+    def location(self):
+        """Stored coordinates as a dict with lat, lon and precision, or None"""
+        if self.latitude is None or self.longitude is None:
+            return None
+        return {"lat": self.latitude, "lon": self.longitude, "precision": self.geocode_precision}
+
     @property
     def is_unlimited(self):
         """Check if contract is unlimited"""
@@ -308,14 +399,134 @@ class ContractDetails(models.Model):
                 and self.renovation_interval_years >= 5
         )
 
-    def update(self, updated_contract_details: dict):
-        # Update fields with extracted information
-        valid_fields = [f.name for f in self._meta.fields]
+    @staticmethod
+    @functools.cache
+    def updatable_fields() -> Dict[str, models.Field]:
+        """Fields that update() may set, keyed by name and computed once per process."""
+        return {
+            field.name: field
+            for field in ContractDetails._meta.concrete_fields
+            if not field.primary_key and not field.is_relation
+        }
+
+    def update(self, updated_contract_details: dict) -> List[str]:
+        """
+        Update fields with extracted information, writing only changed columns.
+
+        Returns:
+            List[str]: names of the fields that were saved
+        """
+        fields = self.updatable_fields()
+        deferred_fields = self.get_deferred_fields()
+        changed_fields = []
+
         for key, value in updated_contract_details.items():
-            if key in valid_fields:
-                setattr(self, key, value)
+            field = fields.get(key)
+            if field is None:
+                continue
+            # Comparing a deferred or still encrypted value would load or decrypt
+            # it, which costs more than writing the new value
+            unread = field.attname in deferred_fields or isinstance(self.__dict__[field.attname], EncryptedPayload)
+            if unread or getattr(self, field.attname) != value:
+                setattr(self, field.attname, value)
+                changed_fields.append(field.name)
+
+        if changed_fields:
+            self.save(update_fields=changed_fields)
+        logger.info(f"Updated {len(changed_fields)} fields of details {self.pk}")
+        return changed_fields
+
+    def set_paragraphs(self, paragraphs: List[Dict]) -> int:
+        """
+        Store simplified paragraphs, only writing rows whose content changed.
+
+        Returns:
+            int: number of paragraphs created or updated
+        """
+        existing = {
+            paragraph.ordinal: paragraph
+            for paragraph in self.paragraphs.only("id", "ordinal", "content_hash")
+        }
+        to_create, to_update = [], []
+
+        for ordinal, item in enumerate(paragraphs):
+            title = (item.get("title") or "")[:255]
+            simplified = item.get("simplified") or ""
+            content_hash = ContractParagraph.compute_hash(title, simplified)
+
+            paragraph = existing.get(ordinal)
+            if paragraph is None:
+                paragraph = ContractParagraph(details=self, ordinal=ordinal)
+                to_create.append(paragraph)
+            elif paragraph.content_hash == content_hash:
+                continue
+            else:
+                to_update.append(paragraph)
+
+            paragraph.title = title
+            paragraph.simplified = simplified
+            paragraph.source_start = item.get("source_start")
+            paragraph.source_end = item.get("source_end")
+            paragraph.content_hash = content_hash
+
+        if to_create:
+            ContractParagraph.objects.bulk_create(to_create)
+        if to_update:
+            ContractParagraph.objects.bulk_update(
+                to_update,
+                ["title", "simplified", "source_start", "source_end", "content_hash"],
+            )
+        self.paragraphs.filter(ordinal__gte=len(paragraphs)).delete()
+
+        logger.info(f"Stored {len(to_create)} new and {len(to_update)} changed paragraphs for {self.pk}")
+        return len(to_create) + len(to_update)
+
+    def get_paragraphs(self, offset: int = 0, limit: int = 20) -> List[Dict]:
+        """Get a page of simplified paragraphs in document order."""
+        return [
+            paragraph.as_dict()
+            for paragraph in self.paragraphs.all()[offset:offset + limit]
+        ]
+
+
+class ContractParagraph(models.Model):
+    """Simplified paragraph of a contract, stored one row per paragraph."""
+
+    details = models.ForeignKey(
+        "ContractDetails", on_delete=models.CASCADE, related_name="paragraphs"
+    )
+    ordinal = models.PositiveIntegerField()
+    title = models.CharField(max_length=255, blank=True, default="")
+    simplified = EncryptedTextField(null=True, blank=True)
 
-        self.save()
+    # Character span of the source text the paragraph was simplified from
+    source_start = models.PositiveIntegerField(null=True, blank=True)
+    source_end = models.PositiveIntegerField(null=True, blank=True)
+
+    content_hash = models.CharField(max_length=64)
+
+    class Meta:
+        ordering = ["ordinal"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["details", "ordinal"], name="unique_paragraph_ordinal"
+            )
+        ]
+
+    def __str__(self):
+        return f"Paragraph {self.ordinal} of {self.details_id}: {self.title}"
+
+    @staticmethod
+    def compute_hash(title, simplified):
+        """Hash of the paragraph content, used to skip unchanged rows."""
+        return hashlib.sha256(f"{title}\0{simplified}".encode("utf-8")).hexdigest()
+
+    def as_dict(self):
+        return {
+            "ordinal": self.ordinal,
+            "title": self.title,
+            "simplified": self.simplified,
+        }
 
 
 class Analysis(models.Model):
@@ -0,0 +1,109 @@
+# models/fields.py
+import logging
+import zlib
+
+from django import forms
+from django.core import validators
+from django.db import connection, models
+from django.db.models.query_utils import DeferredAttribute
+
+from contract_analysis.utils.encryption import encrypt_file, decrypt_file
+
+logger = logging.getLogger(__name__)
+
+
+class EncryptedPayload(bytes):
+    """Raw [nonce][ciphertext] bytes as loaded from the database, not yet decoded."""
+
+
+def encode_text(text):
+    """Compress and encrypt a string for storage."""
+    return encrypt_file(zlib.compress(text.encode("utf-8"), 6))
+
+
+def decode_text(payload):
+    """Decrypt and decompress a payload produced by encode_text."""
+    return zlib.decompress(decrypt_file(bytes(payload))).decode("utf-8")
+
+
+class LazyDecryptedAttribute(DeferredAttribute):
+    """
+    Descriptor that keeps the encrypted payload on the instance until the
+    attribute is first read, then decodes it once and caches the plaintext.
+    """
+
+    def __get__(self, instance, cls=None):
+        value = super().__get__(instance, cls)
+        if instance is None:
+            return value
+
+        if isinstance(value, EncryptedPayload):
+            value = decode_text(value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        # Defining __set__ makes this a data descriptor, so reads go through
+        # __get__ even when the payload is already in the instance __dict__.
+        instance.__dict__[self.field.attname] = value
+
+
+class EncryptedTextField(models.BinaryField):
+    """
+    Text field stored zlib-compressed and AES-GCM encrypted.
+
+    Values are only decrypted when the attribute is accessed, and rows whose
+    value was never read are written back without re-encrypting.
+    """
+
+    descriptor_class = LazyDecryptedAttribute
+    # The values are text, an empty string is blank
+    empty_values = list(validators.EMPTY_VALUES)
+
+    def __init__(self, *args, **kwargs):
+        # BinaryField is not editable by default, the plaintext is
+        kwargs.setdefault("editable", True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.editable:
+            kwargs.pop("editable", None)
+        else:
+            kwargs["editable"] = False
+        return name, path, args, kwargs
+
+    def formfield(self, **kwargs):
+        # Edited as plain text, like a TextField
+        defaults = {"form_class": forms.CharField, "widget": forms.Textarea}
+        if self.null and not connection.features.interprets_empty_strings_as_nulls:
+            defaults["empty_value"] = None
+        defaults.update(kwargs)
+        return super().formfield(**defaults)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return EncryptedPayload(value)
+
+    def pre_save(self, model_instance, add):
+        # Read the stored value directly, going through the descriptor would
+        # decrypt a payload only to encrypt it again
+        return model_instance.__dict__.get(self.attname)
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        if isinstance(value, EncryptedPayload):
+            return bytes(value)
+        return encode_text(str(value))
+
+    def to_python(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        if isinstance(value, EncryptedPayload):
+            return decode_text(value)
+        return str(value)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.db import models
+from django.utils import timezone
+
+from contract_analysis.models.fields import EncryptedTextField
+
+
+class GeocodeCache(models.Model):
+    """Nominatim result for a normalized address, see contract_analysis.utils.geocoding"""
+
+    # HMAC of the normalized address, the address itself is not stored
+    address_key = models.CharField(max_length=64, unique=True)
+
+    # All None if Nominatim found no match
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    precision = models.CharField(max_length=32, null=True, blank=True)
+
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = "Geocode Cache Entry"
+        verbose_name_plural = "Geocode Cache"
+
+    def __str__(self):
+        return self.address_key[:12]
+
+    @property
+    def location(self):
+        if self.latitude is None or self.longitude is None:
+            return None
+        return {"lat": self.latitude, "lon": self.longitude, "precision": self.precision}
+
+
+class NeighborhoodCache(models.Model):
+    """Neighborhood analysis shared by all contracts in a geohash cell"""
+
+    geohash = models.CharField(max_length=12)
+    zoom = models.PositiveSmallIntegerField()
+    analysis = EncryptedTextField()
+    created_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Neighborhood Cache Entry"
+        verbose_name_plural = "Neighborhood Cache"
+        constraints = [
+            models.UniqueConstraint(fields=["geohash", "zoom"], name="unique_neighborhood_cell")
+        ]
+
+    def __str__(self):
+        return f"{self.geohash} at zoom {self.zoom}"
+
+    @staticmethod
+    def get(geohash: str, zoom: int, ttl: timedelta):
+        """Get the analysis of a cell if it is younger than the ttl, otherwise None"""
+        entry = NeighborhoodCache.objects.filter(
+            geohash=geohash, zoom=zoom, created_at__gte=timezone.now() - ttl
+        ).first()
+        return entry.analysis if entry else None
+
+    @staticmethod
+    def store(geohash: str, zoom: int, analysis: str):
+        NeighborhoodCache.objects.update_or_create(
+            geohash=geohash, zoom=zoom, defaults={"analysis": analysis}
+        )
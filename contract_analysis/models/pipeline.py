@@ -0,0 +1,54 @@
+from django.db import models
+
+from contract_analysis.models.contract import Contract
+
+
+class AnalysisRun(models.Model):
+    """One run of the analysis pipeline, with its spans, see contract_analysis.utils.spans"""
+
+    STATUS_CHOICES = [
+        ("success", "Success"),
+        ("error", "Error"),
+    ]
+
+    # Kept when the contract is deleted, runs are operational data
+    contract = models.ForeignKey(
+        Contract, on_delete=models.SET_NULL, null=True, blank=True, related_name="runs"
+    )
+    started_at = models.DateTimeField(db_index=True)
+    duration_ms = models.FloatField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    error = models.TextField(blank=True, default="")
+
+    class Meta:
+        verbose_name = "Analysis Run"
+        verbose_name_plural = "Analysis Runs"
+        ordering = ["-started_at"]
+
+    def __str__(self):
+        return f"{self.started_at:%Y-%m-%d %H:%M:%S} {self.status} ({self.duration_ms / 1000:.1f}s)"
+
+
+class AnalysisSpan(models.Model):
+    """A timed stage or provider call within an analysis run"""
+
+    run = models.ForeignKey(AnalysisRun, on_delete=models.CASCADE, related_name="spans")
+    name = models.CharField(max_length=64)
+    # Name of the enclosing span, empty for top level stages
+    parent = models.CharField(max_length=64, blank=True, default="")
+    # Milliseconds since the start of the run
+    start_ms = models.FloatField()
+    duration_ms = models.FloatField()
+    success = models.BooleanField(default=True)
+    error = models.TextField(blank=True, default="")
+    # Payload sizes, counts, cache hits and the like
+    attributes = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        verbose_name = "Analysis Span"
+        verbose_name_plural = "Analysis Spans"
+        ordering = ["run", "start_ms"]
+        indexes = [models.Index(fields=["name", "run"])]
+
+    def __str__(self):
+        return f"{self.name} ({self.duration_ms:.0f}ms)"
@@ -0,0 +1,37 @@
+from django.db import models
+
+
+class PointOfInterest(models.Model):
+    """
+    Point of an OSM feature relevant for the neighborhood analysis.
+
+    Lines and areas like roads and parks are stored as points along their
+    geometry, all sharing the feature's osm_id. Imported with
+    `manage.py import_pois`, see contract_analysis.utils.poi
+    """
+
+    CATEGORY_CHOICES = [
+        ("transit", "Transit stop"),
+        ("school", "School"),
+        ("supermarket", "Supermarket"),
+        ("park", "Park"),
+        ("major_road", "Major road"),
+    ]
+
+    category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
+    osm_id = models.CharField(max_length=32)
+    name = models.CharField(max_length=255, blank=True, default="")
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    class Meta:
+        verbose_name = "Point of Interest"
+        verbose_name_plural = "Points of Interest"
+        indexes = [
+            models.Index(fields=["category"]),
+            # Regions of the POI index are loaded by bounding box
+            models.Index(fields=["latitude", "longitude"], name="poi_location_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_category_display()} {self.name or self.osm_id}"
@@ -0,0 +1,224 @@
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipIf
+
+from PIL import Image
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from contract_analysis import analysis
+from contract_analysis.analysis import (
+    GEMINI_EXTRACTION_CONFIG,
+    GEMINI_NEIGHBORHOOD_CONFIG,
+    ContractProcessor,
+    vision_request,
+)
+from contract_analysis.models.contract import Contract
+from contract_analysis.models.geocoding import NeighborhoodCache
+from contract_analysis.utils import geohash
+from contract_analysis.utils.fake_providers import (
+    NEIGHBORHOOD_ANALYSIS,
+    FakeProviderServer,
+    FaultProfile,
+    create_fake_processor,
+)
+from contract_analysis.utils.spans import RunRecorder
+from contract_analysis.utils.tiles import get_tile_source
+from customers.models import User
+
+# The SDKs are in requirements.txt, the payload tests only skip where they are missing
+try:
+    from google.cloud import vision
+except ImportError:
+    vision = None
+try:
+    from google.genai import types as genai_types
+except ImportError:
+    genai_types = None
+
+
+def page_image() -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (60, 80), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakeProviderTestCase(TransactionTestCase):
+    """
+    Runs the pipeline against the fake providers, no network access needed.
+
+    TransactionTestCase, as the pipeline reads and writes from its worker threads.
+    """
+
+    def setUp(self):
+        server = FakeProviderServer().start()
+        self.addCleanup(server.stop)
+        settings_override = override_settings(
+            NOMINATIM_URL=server.nominatim_url,
+            TILE_URL=server.tile_url,
+            TILE_CACHE_DIR=tempfile.mkdtemp(),
+            MBTILES_PATH=None,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        get_tile_source.cache_clear()
+        self.addCleanup(get_tile_source.cache_clear)
+
+        self.processor = create_fake_processor()
+        self.addCleanup(self.processor.executor.shutdown)
+        self.user = User.objects.create_user("tenant")
+        self.contract = Contract.objects.create(user=self.user)
+        self.contract.add_file("page_1.png", page_image(), "image/png")
+
+    def process(self):
+        return async_to_sync(self.processor.process_contract)(contract=self.contract)
+
+
+class NeighborhoodCacheTests(TestCase):
+    def setUp(self):
+        # Only the neighborhood analysis is run, the provider clients are not needed
+        self.processor = ContractProcessor.__new__(ContractProcessor)
+        self.processor.executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(self.processor.executor.shutdown)
+
+        patchers = [
+            mock.patch.object(analysis, "get_neighborhood_map", return_value=object()),
+            mock.patch.object(ContractProcessor, "_analyze_neighborhood_with_gemini", return_value="Ruhige Lage"),
+        ]
+        self.get_map, self.analyze = [patcher.start() for patcher in patchers]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+
+    def analyze_neighborhood(self, address, lat, lon):
+        return async_to_sync(self.processor.analyze_neighborhood)(
+            address, {"lat": lat, "lon": lon}, "10115 Berlin"
+        )
+
+    def test_shared_by_cell(self):
+        lat, lon = geohash.decode(geohash.encode(52.52, 13.405))
+        self.assertEqual(self.analyze_neighborhood("Hauptstraße 1 10115 Berlin", lat - 0.0002, lon), "Ruhige Lage")
+        self.assertEqual(self.analyze_neighborhood("Hauptstraße 3 10115 Berlin", lat + 0.0002, lon), "Ruhige Lage")
+        self.analyze.assert_called_once()
+
+    def test_never_sends_the_address(self):
+        self.analyze_neighborhood("Hauptstraße 1 10115 Berlin", 52.52, 13.405)
+
+        address, = self.analyze.call_args.args[:1]
+        self.assertEqual(address, "10115 Berlin")
+        lat, lon = geohash.decode(geohash.encode(52.52, 13.405))
+        self.assertEqual(self.get_map.call_args.kwargs["location"], {"lat": lat, "lon": lon})
+
+    def test_expired_entries_are_refreshed(self):
+        self.analyze_neighborhood("Hauptstraße 1 10115 Berlin", 52.52, 13.405)
+        NeighborhoodCache.objects.update(created_at=timezone.now() - timedelta(days=365))
+        self.analyze_neighborhood("Hauptstraße 1 10115 Berlin", 52.52, 13.405)
+        self.assertEqual(self.analyze.call_count, 2)
+        self.assertEqual(NeighborhoodCache.objects.count(), 1)
+
+
+class GeocodingTests(FakeProviderTestCase):
+    def test_failed_geocode_is_retried(self):
+        with mock.patch("contract_analysis.analysis.geocode_address", return_value=None):
+            self.process()
+        details = self.contract.get_details()
+        self.assertIsNone(details.location)
+        self.assertIsNone(details.geocoded_address)
+
+        self.process()
+        details.refresh_from_db()
+        self.assertIsNotNone(details.location)
+        self.assertEqual(details.geocoded_address, "Hauptstraße 1 10115 Berlin")
+
+    def test_postal_code_fallback_is_retried(self):
+        fallback = {"lat": 52.5323, "lon": 13.3846, "precision": "postcode"}
+        with mock.patch("contract_analysis.analysis.geocode_address", return_value=fallback):
+            self.process()
+        details = self.contract.get_details()
+        self.assertEqual(details.geocode_precision, "postcode")
+        self.assertIsNone(details.geocoded_address)
+
+        self.process()
+        details.refresh_from_db()
+        self.assertEqual(details.geocode_precision, "building")
+        self.assertEqual(details.geocoded_address, "Hauptstraße 1 10115 Berlin")
+
+    def test_geocode_contracts_backfills_coordinates(self):
+        self.contract.status = "analyzed"
+        self.contract.save()
+        details = self.contract.get_details()
+        details.update({"street": "Hauptstraße 1", "postal_code": "10115", "city": "Berlin"})
+        version = self.contract.content_version
+
+        call_command("geocode_contracts", delay=0, stdout=StringIO())
+
+        details.refresh_from_db()
+        self.contract.refresh_from_db()
+        self.assertIsNotNone(details.location)
+        self.assertEqual(self.contract.content_version, version + 1)
+
+    def test_geocode_contracts_replaces_postal_code_fallbacks(self):
+        self.contract.status = "analyzed"
+        self.contract.save()
+        details = self.contract.get_details()
+        details.update({
+            "street": "Hauptstraße 1", "postal_code": "10115", "city": "Berlin",
+            "latitude": 52.5323, "longitude": 13.3846, "geocode_precision": "postcode",
+        })
+
+        call_command("geocode_contracts", delay=0, stdout=StringIO())
+
+        details.refresh_from_db()
+        self.assertEqual(details.geocode_precision, "building")
+        self.assertEqual(details.geocoded_address, "Hauptstraße 1 10115 Berlin")
+
+
+class ProcessContractTests(FakeProviderTestCase):
+    def test_process_contract(self):
+        run = RunRecorder()
+        with run.activate():
+            result = self.process()
+
+        self.assertNotIn("error", result)
+        self.assertEqual(result["rejected_fields"], {})
+        details = self.contract.get_details()
+        self.assertEqual(details.basic_rent, Decimal("950.00"))
+        self.assertEqual(details.city, "Berlin")
+        self.assertIsNotNone(details.location)
+        self.assertEqual(details.neighborhood_analysis, NEIGHBORHOOD_ANALYSIS)
+        self.assertEqual(len(details.get_paragraphs()), 7)
+
+        spans = {span.name for span in run.spans if not span.error}
+        for name in ("ocr", "vision.batch_annotate_images", "extraction", "simplification", "geocoding",
+                     "nominatim.search", "neighborhood", "map", "tiles.download", "save"):
+            self.assertIn(name, spans)
+
+    def test_rate_limited_ocr(self):
+        self.processor = create_fake_processor(FaultProfile(rate_limit_rate=1))
+        self.addCleanup(self.processor.executor.shutdown)
+
+        result = self.process()
+
+        self.assertEqual(result, {"error": "Text extraction failed"})
+        self.assertIsNone(self.contract.get_details().full_contract_text)
+
+
+class SDKPayloadTests(SimpleTestCase):
+    """The plain dict payloads the fakes accept must still be valid for the real SDKs"""
+
+    @skipIf(vision is None, "google-cloud-vision is not installed")
+    def test_vision_request(self):
+        request = vision.AnnotateImageRequest(**vision_request(page_image()))
+        self.assertEqual(request.features[0].type_, vision.Feature.Type.DOCUMENT_TEXT_DETECTION)
+        self.assertEqual(request.image.content, page_image())
+
+    @skipIf(genai_types is None, "google-genai is not installed")
+    def test_gemini_configs(self):
+        for config in (GEMINI_EXTRACTION_CONFIG, GEMINI_NEIGHBORHOOD_CONFIG):
+            with self.subTest(config=config):
+                parsed = genai_types.GenerateContentConfig(**config)
+                self.assertEqual(parsed.model_dump(exclude_none=True), config)
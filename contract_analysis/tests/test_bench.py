@@ -0,0 +1,74 @@
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase
+
+from contract_analysis.management.commands.bench_pipeline import (
+    PAGE_CHARACTERS,
+    Command,
+    load_corpus,
+    summarize,
+    synthetic_pages,
+)
+from contract_analysis.utils.fake_providers import CONTRACT_TEXT
+
+
+class SyntheticPagesTests(SimpleTestCase):
+    def test_pages(self):
+        pages = synthetic_pages(5)
+        self.assertEqual(len(pages), 5)
+        self.assertEqual(pages[0], CONTRACT_TEXT)
+        for page in pages[1:]:
+            self.assertGreaterEqual(len(page), PAGE_CHARACTERS)
+
+    def test_paragraph_numbers_continue_across_pages(self):
+        headings = [line for page in synthetic_pages(3)[1:] for line in page.splitlines() if line.startswith("§")]
+        numbers = [int(heading.split()[1]) for heading in headings]
+        self.assertEqual(numbers, list(range(8, 8 + len(numbers))))
+
+
+class SummarizeTests(SimpleTestCase):
+    def test_summary(self):
+        summary = summarize([float(value) for value in range(100, 0, -1)])
+        self.assertEqual(summary["count"], 100)
+        self.assertEqual(summary["max"], 100)
+        self.assertLessEqual(summary["p50"], summary["p95"])
+
+    def test_empty(self):
+        self.assertEqual(summarize([]), {"count": 0, "max": None, "p50": None, "p95": None})
+
+
+class LoadCorpusTests(SimpleTestCase):
+    def test_pdfs_and_image_directories(self):
+        with tempfile.TemporaryDirectory() as directory:
+            corpus = Path(directory)
+            (corpus / "a-lease.pdf").write_bytes(b"%PDF-1.4")
+            (corpus / "a-lease.txt").write_text("Seite 1\fSeite 2", encoding="utf-8")
+            scans = corpus / "b-scans"
+            scans.mkdir()
+            (scans / "page_1.png").write_bytes(b"")
+            (corpus / "empty").mkdir()
+            (corpus / "notes.md").write_text("")
+
+            leases = [(name, pages) for name, _, pages in load_corpus(corpus)]
+
+        self.assertEqual(leases, [("a-lease", ["Seite 1", "Seite 2"]), ("b-scans", None)])
+
+
+class BenchPipelineCommandTests(SimpleTestCase):
+    def test_invalid_options(self):
+        for options in ({"pages": "1,x"}, {"pages": "0"}, {"runs": 0}, {"pages": ""}):
+            with self.subTest(options=options), self.assertRaises(CommandError):
+                call_command("bench_pipeline", stdout=StringIO(), **options)
+
+    def test_comparison(self):
+        def report(p50, p95):
+            lease = {"name": "synthetic-1p", "stages": {"run": {"p50": p50, "p95": p95}}}
+            return {"commit": "0123456789", "leases": [lease]}
+
+        stdout = StringIO()
+        Command(stdout=stdout).print_comparison(report(100, 200), report(50, 300))
+        self.assertIn("Compared with 01234567", stdout.getvalue())
+        self.assertIn("p50 100 -> 50ms (-50.0%), p95 200 -> 300ms (+50.0%)", stdout.getvalue())
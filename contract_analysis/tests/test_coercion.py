@@ -0,0 +1,29 @@
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+
+from contract_analysis.models.contract import ContractDetails
+from contract_analysis.utils.coercion import coerce_values
+
+
+class CoerceValuesTests(SimpleTestCase):
+    def test_german_amount(self):
+        values, rejected = coerce_values(ContractDetails, {"basic_rent": "1.234,56 €"})
+        self.assertEqual(values, {"basic_rent": Decimal("1234.56")})
+        self.assertEqual(rejected, {})
+
+    def test_oversized_amount_is_rejected(self):
+        values, rejected = coerce_values(
+            ContractDetails, {"heating_costs": "99999999999999999999999999999", "basic_rent": "950"}
+        )
+        self.assertIn("heating_costs", rejected)
+        self.assertEqual(values, {"basic_rent": Decimal("950.00")})
+
+    def test_non_finite_numbers_are_rejected(self):
+        for value in (float("nan"), float("inf"), float("-inf"), Decimal("NaN")):
+            with self.subTest(value=value):
+                values, rejected = coerce_values(
+                    ContractDetails, {"heating_costs": value, "termination_notice_tenant": value}
+                )
+                self.assertEqual(values, {})
+                self.assertEqual(set(rejected), {"heating_costs", "termination_notice_tenant"})
@@ -0,0 +1,47 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from contract_analysis.models.contract import Contract
+from contract_analysis.utils import fragments
+from customers.models import User
+
+
+# The manifest only exists after collectstatic
+@override_settings(STORAGES={
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+})
+class ContractFragmentTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.contract = Contract.objects.create(user=User.objects.create_user("tenant"))
+        details = self.contract.get_details()
+        details.city = "Berlin"
+        details.save()
+
+    def test_cached_per_content_version(self):
+        with mock.patch.object(fragments, "build_fragment_context", wraps=fragments.build_fragment_context) as build:
+            first = fragments.get_contract_fragments(self.contract)
+            self.assertEqual(fragments.get_contract_fragments(self.contract), first)
+            self.assertEqual(build.call_count, 1)
+
+            self.contract.bump_content_version()
+            fragments.get_contract_fragments(self.contract)
+            self.assertEqual(build.call_count, 2)
+
+        self.assertEqual(set(first), set(fragments.CONTRACT_FRAGMENTS))
+        self.assertIn("Berlin", first["overview"])
+
+    def test_only_missing_fragments_are_rendered(self):
+        fragments.get_contract_fragments(self.contract)
+        cache.delete(fragments.fragment_cache_key(self.contract, "paragraphs"))
+
+        with mock.patch.object(fragments, "render_to_string", wraps=fragments.render_to_string) as render:
+            fragments.get_contract_fragments(self.contract)
+        render.assert_called_once_with(fragments.CONTRACT_FRAGMENTS["paragraphs"], mock.ANY)
+
+    def test_contract_without_details(self):
+        contract = Contract.objects.create(user=self.contract.user)
+        self.assertIsNone(fragments.get_contract_fragments(contract))
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+from contract_analysis.utils import gazetteer, geocoding
+from contract_analysis.utils.gazetteer import PostalCodeGazetteer
+
+ROWS = [
+    (72074, "Tübingen", 48.5372, 9.0556),
+    (10115, "Berlin", 52.5323, 13.3846),
+    # One postal code spanning two places
+    (88690, "Uhldingen-Mühlhofen", 47.7333, 9.2500),
+    (88690, "Meersburg", 47.6942, 9.2711),
+]
+
+
+class PostalCodeGazetteerTests(SimpleTestCase):
+    def setUp(self):
+        self.gazetteer = PostalCodeGazetteer.from_rows(ROWS)
+
+    def test_lookup(self):
+        self.assertEqual(self.gazetteer.lookup("10115"), {"lat": 52.5323, "lon": 13.3846, "precision": "postcode"})
+        self.assertEqual(self.gazetteer.lookup(72074)["lat"], 48.5372)
+
+    def test_unknown_postal_codes(self):
+        for postal_code in ("10116", "00000", "99999", "abc", None):
+            with self.subTest(postal_code=postal_code):
+                self.assertIsNone(self.gazetteer.lookup(postal_code))
+
+    def test_city_picks_place(self):
+        self.assertEqual(self.gazetteer.lookup("88690", "Uhldingen-Mühlhofen")["lat"], 47.7333)
+        self.assertEqual(self.gazetteer.lookup("88690", "meersburg Germany")["lat"], 47.6942)
+        # Without a match the first place of the postal code is used
+        self.assertEqual(self.gazetteer.lookup("88690", "Konstanz")["lat"], 47.6942)
+
+    def test_save_and_load(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "plz.bin")
+        self.gazetteer.save(path)
+
+        loaded = PostalCodeGazetteer.load(path)
+        self.assertEqual(len(loaded), len(ROWS))
+        self.assertEqual(loaded.lookup("88690", "Meersburg"), self.gazetteer.lookup("88690", "Meersburg"))
+
+    def test_is_coarse_address(self):
+        self.assertTrue(gazetteer.is_coarse_address("72074 Tübingen"))
+        self.assertFalse(gazetteer.is_coarse_address("Wilhelmstraße 5 72074 Tübingen"))
+
+
+class GazetteerGeocodingTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "plz.csv")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("plz;ort;lat;lon\n")
+            file.writelines(f"{row[0]};{row[1]};{str(row[2]).replace('.', ',')};{row[3]}\n" for row in ROWS)
+            file.write("kaputt;Nirgendwo;;\n")
+
+        settings_override = override_settings(PLZ_GAZETTEER_PATH=os.path.join(directory, "plz.bin"))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        gazetteer.get_gazetteer.cache_clear()
+        self.addCleanup(gazetteer.get_gazetteer.cache_clear)
+
+        output = StringIO()
+        call_command("import_plz_gazetteer", path, stdout=output)
+        self.assertIn("4 postal code areas", output.getvalue())
+        self.assertIn("1 rows skipped", output.getvalue())
+
+    def test_coarse_address_skips_nominatim(self):
+        with mock.patch.object(geocoding, "geocode_with_nominatim") as nominatim:
+            location = geocoding.geocode_address("72074 Tübingen")
+        nominatim.assert_not_called()
+        self.assertEqual(location["precision"], "postcode")
+
+    def test_fallback_when_nominatim_fails(self):
+        with mock.patch.object(geocoding, "geocode_with_nominatim", return_value=None):
+            location = geocoding.geocode_address("Wilhelmstraße 5, 72074 Tübingen")
+        self.assertEqual(location, {"lat": 48.5372, "lon": 9.0556, "precision": "postcode"})
+
+    def test_nominatim_preferred_for_full_addresses(self):
+        precise = {"lat": 48.52, "lon": 9.05, "precision": "building"}
+        with mock.patch.object(geocoding, "geocode_with_nominatim", return_value=precise):
+            self.assertEqual(geocoding.geocode_address("Wilhelmstraße 5, 72074 Tübingen"), precise)
+
+    def test_fallback_is_not_final(self):
+        with mock.patch.object(geocoding, "geocode_with_nominatim", return_value=None):
+            full = geocoding.geocode_address("Wilhelmstraße 5, 72074 Tübingen")
+        self.assertFalse(geocoding.is_final_location("Wilhelmstraße 5, 72074 Tübingen", full))
+
+        coarse = geocoding.geocode_address("72074 Tübingen")
+        self.assertTrue(geocoding.is_final_location("72074 Tübingen", coarse))
+        self.assertFalse(geocoding.is_final_location("72074 Tübingen", None))
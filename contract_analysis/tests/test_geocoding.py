@@ -0,0 +1,97 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+
+from contract_analysis.models.geocoding import GeocodeCache
+from contract_analysis.utils import geocoding
+
+LOCATION = {"lat": 48.52, "lon": 9.05, "precision": "building"}
+
+
+class NormalizeAddressTests(SimpleTestCase):
+    def test_spellings_of_one_address(self):
+        spellings = [
+            "Wilhelmstraße 5, 72074 Tübingen",
+            "72074 tübingen wilhelmstr. 5",
+            "Wilhelm-Straße 5, 72074 Tuebingen, Deutschland",
+        ]
+        for spelling in spellings:
+            with self.subTest(spelling=spelling):
+                self.assertEqual(geocoding.normalize_address(spelling), "72074 5 tuebingen wilhelmstr")
+
+    def test_different_addresses(self):
+        self.assertNotEqual(
+            geocoding.normalize_address("Wilhelmstraße 5, 72074 Tübingen"),
+            geocoding.normalize_address("Wilhelmstraße 7, 72074 Tübingen"),
+        )
+
+
+class GeocodeCacheTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        patcher = mock.patch.object(geocoding, "_request_nominatim", return_value=LOCATION)
+        self.request_nominatim = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_spellings_share_one_request(self):
+        self.assertEqual(geocoding.geocode_address("Wilhelmstraße 5, 72074 Tübingen"), LOCATION)
+        self.assertEqual(geocoding.geocode_address("72074 tübingen wilhelmstr. 5"), LOCATION)
+        self.request_nominatim.assert_called_once()
+
+    def test_address_is_not_stored(self):
+        geocoding.geocode_address("Wilhelmstraße 5, 72074 Tübingen")
+        entry = GeocodeCache.objects.get()
+        self.assertEqual(entry.address_key, geocoding.address_cache_key("72074 5 tuebingen wilhelmstr"))
+        self.assertNotIn("wilhelm", str(GeocodeCache.objects.values().get()).lower())
+
+    def test_misses_expire_sooner(self):
+        self.request_nominatim.return_value = None
+        self.assertIsNone(geocoding.geocode_address("Nirgendwo 1"))
+        self.assertIsNone(geocoding.geocode_address("Nirgendwo 1"))
+        self.assertEqual(self.request_nominatim.call_count, 1)
+
+        GeocodeCache.objects.update(fetched_at=timezone.now() - geocoding.GEOCODE_MISS_TTL)
+        self.request_nominatim.return_value = LOCATION
+        self.assertEqual(geocoding.geocode_address("Nirgendwo 1"), LOCATION)
+        self.assertEqual(self.request_nominatim.call_count, 2)
+
+    def test_waits_for_other_worker(self):
+        address = "Wilhelmstraße 5, 72074 Tübingen"
+        key = geocoding.address_cache_key(geocoding.normalize_address(address))
+        cache.add(f"geocode_flight:{key}", True)
+
+        def other_worker_stores(seconds):
+            GeocodeCache.objects.create(address_key=key, latitude=1.0, longitude=2.0, fetched_at=timezone.now())
+
+        with mock.patch.object(geocoding.time, "sleep", side_effect=other_worker_stores):
+            location = geocoding.geocode_address(address)
+
+        self.assertEqual(location, {"lat": 1.0, "lon": 2.0, "precision": None})
+        self.request_nominatim.assert_not_called()
+
+
+class GeocodeSingleFlightTests(TransactionTestCase):
+    def test_concurrent_lookups_share_one_request(self):
+        self.addCleanup(cache.clear)
+
+        def slow_request(address):
+            time.sleep(0.1)
+            return LOCATION
+
+        results = []
+        with mock.patch.object(geocoding, "_request_nominatim", side_effect=slow_request) as request_nominatim:
+            threads = [
+                threading.Thread(target=lambda: results.append(geocoding.geocode_address("Wilhelmstraße 5, Tübingen")))
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(results, [LOCATION] * 4)
+        request_nominatim.assert_called_once()
@@ -0,0 +1,21 @@
+from django.test import SimpleTestCase
+
+from contract_analysis.utils import geohash
+
+
+class GeohashTests(SimpleTestCase):
+    def test_encode(self):
+        # Reference values from the original geohash.org implementation
+        self.assertEqual(geohash.encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+        self.assertEqual(geohash.encode(42.6, -5.6, 5), "ezs42")
+
+    def test_decode_returns_cell_center(self):
+        lat, lon = geohash.decode("ezs42")
+        self.assertAlmostEqual(lat, 42.605, places=3)
+        self.assertAlmostEqual(lon, -5.603, places=3)
+        self.assertEqual(geohash.encode(lat, lon, 5), "ezs42")
+
+    def test_nearby_locations_share_a_cell(self):
+        lat, lon = geohash.decode(geohash.encode(52.52, 13.405))
+        self.assertEqual(geohash.encode(lat - 0.0002, lon - 0.0002), geohash.encode(lat + 0.0002, lon + 0.0002))
+        self.assertNotEqual(geohash.encode(lat, lon), geohash.encode(lat + 0.01, lon))
@@ -0,0 +1,17 @@
+from django.test import SimpleTestCase
+
+from contract_analysis.models.contract import ContractDetails
+from contract_analysis.utils.json import model_to_schema
+
+
+class ModelToSchemaTests(SimpleTestCase):
+    def test_skips_relations_and_primary_key(self):
+        schema = model_to_schema(ContractDetails)
+        self.assertNotIn("id", schema)
+        self.assertNotIn("contract", schema)
+        self.assertNotIn("paragraphs", schema)
+        self.assertEqual(schema["basic_rent"], "number, null")
+
+    def test_exclude(self):
+        schema = model_to_schema(ContractDetails, exclude=["full_contract_text"])
+        self.assertNotIn("full_contract_text", schema)
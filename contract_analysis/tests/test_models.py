@@ -0,0 +1,119 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.db import connection
+from django import forms
+from django.test import TestCase
+
+from contract_analysis.models import fields
+from contract_analysis.models.contract import Contract, ContractDetails
+from customers.models import User
+
+
+class EncryptedTextFieldTests(TestCase):
+    def setUp(self):
+        contract = Contract.objects.create(user=User.objects.create_user("tenant"))
+        self.details = contract.get_details()
+        self.details.full_contract_text = "§ 1 Mietsache\nDie Wohnung im 2. Obergeschoss"
+        self.details.save()
+
+    def test_stored_encrypted(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT full_contract_text FROM {ContractDetails._meta.db_table} WHERE id = %s",
+                [self.details.pk],
+            )
+            stored = bytes(cursor.fetchone()[0])
+        self.assertNotIn("Mietsache".encode(), stored)
+        self.assertEqual(fields.decode_text(stored), "§ 1 Mietsache\nDie Wohnung im 2. Obergeschoss")
+
+    def test_decoded_on_first_access(self):
+        with mock.patch.object(fields, "decode_text", wraps=fields.decode_text) as decode_text:
+            details = ContractDetails.objects.get(pk=self.details.pk)
+            decode_text.assert_not_called()
+
+            self.assertEqual(details.full_contract_text, "§ 1 Mietsache\nDie Wohnung im 2. Obergeschoss")
+            self.assertEqual(details.full_contract_text, "§ 1 Mietsache\nDie Wohnung im 2. Obergeschoss")
+            decode_text.assert_called_once()
+
+    def test_unread_value_written_back_unchanged(self):
+        details = ContractDetails.objects.get(pk=self.details.pk)
+        payload = details.__dict__["full_contract_text"]
+        with mock.patch.object(fields, "encode_text", wraps=fields.encode_text) as encode_text:
+            details.city = "Berlin"
+            details.save()
+        encode_text.assert_not_called()
+
+        reloaded = ContractDetails.objects.get(pk=self.details.pk)
+        self.assertEqual(reloaded.__dict__["full_contract_text"], payload)
+
+    def test_null(self):
+        details = ContractDetails.objects.get(pk=self.details.pk)
+        self.assertIsNone(details.neighborhood_analysis)
+
+    def test_edited_as_text_in_forms(self):
+        DetailsForm = forms.modelform_factory(ContractDetails, fields=["full_contract_text", "neighborhood_analysis"])
+        details = ContractDetails.objects.get(pk=self.details.pk)
+
+        form = DetailsForm(instance=details)
+        self.assertIsInstance(form.fields["full_contract_text"].widget, forms.Textarea)
+        self.assertIn("Mietsache", form["full_contract_text"].value())
+
+        form = DetailsForm({"full_contract_text": "§ 1 Mietsache, neu", "neighborhood_analysis": ""}, instance=details)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        reloaded = ContractDetails.objects.get(pk=self.details.pk)
+        self.assertEqual(reloaded.full_contract_text, "§ 1 Mietsache, neu")
+        self.assertIsNone(reloaded.neighborhood_analysis)
+
+
+class ContractParagraphTests(TestCase):
+    def setUp(self):
+        contract = Contract.objects.create(user=User.objects.create_user("tenant"))
+        self.details = contract.get_details()
+        self.paragraphs = [
+            {"title": f"§ {number}", "simplified": f"Inhalt {number}"} for number in range(1, 4)
+        ]
+        self.details.set_paragraphs(self.paragraphs)
+
+    def test_only_changed_paragraphs_are_written(self):
+        self.assertEqual(self.details.set_paragraphs(self.paragraphs), 0)
+
+        self.paragraphs[1]["simplified"] = "Neuer Inhalt"
+        self.assertEqual(self.details.set_paragraphs(self.paragraphs), 1)
+        self.assertEqual(self.details.get_paragraphs()[1]["simplified"], "Neuer Inhalt")
+
+    def test_removed_paragraphs_are_deleted(self):
+        self.details.set_paragraphs(self.paragraphs[:1])
+        self.assertEqual(self.details.get_paragraphs(), [{"ordinal": 0, "title": "§ 1", "simplified": "Inhalt 1"}])
+
+    def test_get_paragraphs_pages(self):
+        page = self.details.get_paragraphs(offset=1, limit=1)
+        self.assertEqual([paragraph["title"] for paragraph in page], ["§ 2"])
+
+
+class ContractDetailsUpdateTests(TestCase):
+    def setUp(self):
+        contract = Contract.objects.create(user=User.objects.create_user("tenant"))
+        details = contract.get_details()
+        details.update({"full_contract_text": "§ 1 Mietsache", "basic_rent": Decimal("950.00")})
+        self.pk = details.pk
+
+    def test_unchanged_fields_are_not_written(self):
+        details = ContractDetails.objects.get(pk=self.pk)
+        self.assertEqual(details.update({"basic_rent": Decimal("950.00")}), [])
+        self.assertEqual(details.update({"basic_rent": Decimal("1000.00")}), ["basic_rent"])
+
+    def test_encrypted_fields_are_not_decrypted(self):
+        for details in (
+            ContractDetails.objects.get(pk=self.pk),
+            ContractDetails.objects.defer(*ContractDetails.LARGE_TEXT_FIELDS).get(pk=self.pk),
+        ):
+            with mock.patch.object(fields, "decode_text", wraps=fields.decode_text) as decode_text, \
+                    self.assertNumQueries(1):
+                changed = details.update({"full_contract_text": "§ 1 Mietsache, neu"})
+            decode_text.assert_not_called()
+            self.assertEqual(changed, ["full_contract_text"])
+
+        details.refresh_from_db()
+        self.assertEqual(details.full_contract_text, "§ 1 Mietsache, neu")
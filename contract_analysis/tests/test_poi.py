@@ -0,0 +1,106 @@
+import math
+import random
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from contract_analysis.models.poi import PointOfInterest
+from contract_analysis.utils import poi
+from contract_analysis.utils.poi import KDTree, POIIndex, to_unit_vector
+
+
+def distance(a, b):
+    return math.sqrt(sum((a[axis] - b[axis]) ** 2 for axis in range(3)))
+
+
+class KDTreeTests(SimpleTestCase):
+    def setUp(self):
+        generator = random.Random(7)
+        self.points = [
+            (*to_unit_vector(52.4 + generator.random() * 0.2, 13.3 + generator.random() * 0.2), payload)
+            for payload in range(500)
+        ]
+        self.tree = KDTree(self.points)
+
+    def test_matches_brute_force(self):
+        generator = random.Random(11)
+        radius = poi._meters_to_chord(800)
+        for _ in range(50):
+            target = to_unit_vector(52.4 + generator.random() * 0.2, 13.3 + generator.random() * 0.2)
+            nearest, within = self.tree.query(target, radius)
+
+            expected = min(self.points, key=lambda point: distance(target, point))
+            self.assertEqual(nearest[1], expected[3])
+            self.assertAlmostEqual(nearest[0], distance(target, expected))
+            self.assertEqual(
+                sorted(within),
+                sorted(point[3] for point in self.points if distance(target, point) <= radius),
+            )
+
+    def test_empty(self):
+        self.assertEqual(KDTree([]).query(to_unit_vector(52.5, 13.4), 1), (None, []))
+
+
+class POIIndexTests(SimpleTestCase):
+    def test_facts(self):
+        index = POIIndex([
+            ("park", "way/1", "Volkspark", 52.5200, 13.4100),
+            # Second point of the same park
+            ("park", "way/1", "Volkspark", 52.5205, 13.4105),
+            ("park", "way/2", "Schlosspark", 52.5300, 13.4000),
+            ("school", "node/3", "Grundschule", 52.5201, 13.4050),
+        ])
+        facts = index.facts(52.5200, 13.4050)
+
+        self.assertEqual(facts["park"]["nearest_name"], "Volkspark")
+        self.assertAlmostEqual(facts["park"]["nearest_m"], 338, delta=2)
+        self.assertEqual(facts["park"]["count"], 1)
+        self.assertEqual(facts["school"]["nearest_m"], 11)
+        self.assertNotIn("transit", facts)
+
+    def test_nearest_beyond_loaded_margin_not_reported(self):
+        index = POIIndex([("school", "node/1", "Gymnasium", 52.5200 + 4000 / poi.METERS_PER_DEGREE, 13.4050)])
+        self.assertEqual(index.facts(52.5200, 13.4050), {})
+
+
+class POIIndexCacheTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        poi.invalidate_poi_index()
+
+    def test_rebuilt_after_import(self):
+        self.assertEqual(poi.get_neighborhood_facts(52.52, 13.405), {})
+
+        PointOfInterest.objects.create(category="transit", osm_id="node/1", name="Alexanderplatz",
+                                       latitude=52.5219, longitude=13.4132)
+        # Still the index built before the import
+        self.assertEqual(poi.get_neighborhood_facts(52.52, 13.405), {})
+
+        poi.invalidate_poi_index()
+        self.assertEqual(poi.get_neighborhood_facts(52.52, 13.405)["transit"]["nearest_name"], "Alexanderplatz")
+        self.assertIs(poi.get_poi_index(52.52, 13.405), poi.get_poi_index(52.52, 13.405))
+
+    def test_region_loads_its_margin_only(self):
+        south, west = 52.5, 13.4
+        # Just across the region's edge, and far away
+        PointOfInterest.objects.create(category="park", osm_id="way/1", name="Volkspark",
+                                       latitude=south - 0.01, longitude=west + 0.05)
+        PointOfInterest.objects.create(category="park", osm_id="way/2", name="Englischer Garten",
+                                       latitude=48.15, longitude=11.59)
+
+        facts = poi.get_neighborhood_facts(south + 0.001, west + 0.05)
+        self.assertEqual(facts["park"]["nearest_name"], "Volkspark")
+        self.assertEqual(len(poi.get_poi_index(south + 0.001, west + 0.05)), 1)
+
+    def test_least_recently_used_regions_dropped(self):
+        with mock.patch.object(poi, "MAX_REGIONS", 2), \
+                mock.patch.object(poi, "load_region", wraps=poi.load_region) as load_region:
+            first = poi.get_poi_index(52.52, 13.405)
+            poi.get_poi_index(48.15, 11.59)
+            self.assertIs(poi.get_poi_index(52.52, 13.405), first)
+            poi.get_poi_index(50.94, 6.96)
+            poi.get_poi_index(48.15, 11.59)
+
+        self.assertEqual(load_region.call_count, 4)
+        self.assertEqual(len(poi._regions), 2)
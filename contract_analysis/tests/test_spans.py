@@ -0,0 +1,126 @@
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from contract_analysis.models.pipeline import AnalysisRun, AnalysisSpan
+from contract_analysis.utils.spans import (
+    PERCENTILES,
+    RunRecorder,
+    percentile,
+    run_in_executor,
+    span,
+    stage_percentiles,
+)
+
+
+class SpanTests(SimpleTestCase):
+    def test_nesting_across_tasks_and_threads(self):
+        executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+
+        def provider_call():
+            with span("provider"):
+                pass
+
+        async def stage(name):
+            with span(name):
+                await run_in_executor(executor, provider_call)
+
+        async def pipeline():
+            with span("analysis"):
+                await asyncio.gather(stage("ocr"), stage("extraction"))
+
+        run = RunRecorder()
+        with run.activate():
+            async_to_sync(pipeline)()
+
+        parents = sorted((recorded.name, recorded.parent) for recorded in run.spans)
+        self.assertEqual(parents, [
+            ("analysis", ""),
+            ("extraction", "analysis"),
+            ("ocr", "analysis"),
+            ("provider", "extraction"),
+            ("provider", "ocr"),
+        ])
+
+    def test_exception_marks_span_failed(self):
+        run = RunRecorder()
+        with run.activate(), self.assertRaises(ValueError):
+            with span("ocr"):
+                raise ValueError("quota exceeded")
+        self.assertEqual(run.spans[0].error, "quota exceeded")
+
+    def test_not_recorded_outside_run(self):
+        run = RunRecorder()
+        with span("ocr") as current:
+            current.set(pages=3)
+        self.assertEqual(run.spans, [])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 90), 7)
+        self.assertIsNone(percentile([], 50))
+
+
+class RunLedgerTests(TestCase):
+    def record_run(self, stage_ms, started_at=None):
+        run = RunRecorder()
+        with run.activate():
+            with span("ocr", pages=1) as current:
+                pass
+        current.end = current.start + stage_ms / 1000
+        stored = run.save()
+        if started_at:
+            AnalysisRun.objects.filter(pk=stored.pk).update(started_at=started_at)
+        return stored
+
+    def test_save(self):
+        stored = self.record_run(120)
+        self.assertEqual(stored.status, "success")
+        ocr = AnalysisSpan.objects.get(run=stored)
+        self.assertEqual(ocr.name, "ocr")
+        self.assertAlmostEqual(ocr.duration_ms, 120)
+        self.assertEqual(ocr.attributes, {"pages": 1})
+
+    def test_stage_percentiles(self):
+        for stage_ms in (100, 200, 300, 400):
+            self.record_run(stage_ms)
+        self.record_run(900, started_at=timezone.now() - timedelta(days=1))
+        self.record_run(5000, started_at=timezone.now() - timedelta(days=60))
+
+        stages = {stage["name"]: stage for stage in stage_percentiles(days=30)}
+        self.assertEqual(list(stages), ["run", "ocr"])
+
+        ocr = stages["ocr"]
+        self.assertEqual(ocr["count"], 5)
+        self.assertAlmostEqual(ocr["max"], 900)
+        self.assertAlmostEqual(ocr["percentiles"][0], 300)
+        self.assertEqual([day["count"] for day in ocr["daily"]], [4, 1])
+
+    def test_stage_percentiles_match_sorted_durations(self):
+        generator = random.Random(3)
+        durations = {"ocr": [], "extraction": []}
+        for _ in range(40):
+            run = AnalysisRun.objects.create(started_at=timezone.now(), duration_ms=0, status="success")
+            for name, values in durations.items():
+                duration = round(generator.uniform(10, 1000), 1)
+                values.append(duration)
+                AnalysisSpan.objects.create(run=run, name=name, start_ms=0, duration_ms=duration)
+
+        stages = {stage["name"]: stage for stage in stage_percentiles()}
+        for name, values in durations.items():
+            values.sort()
+            self.assertEqual(stages[name]["percentiles"], [percentile(values, percent) for percent in PERCENTILES])
+            self.assertEqual(stages[name]["max"], values[-1])
+            self.assertEqual(stages[name]["daily"][0]["percentiles"], stages[name]["percentiles"])
+
+    def test_window_is_bounded(self):
+        self.record_run(100, started_at=timezone.now() - timedelta(days=200))
+        self.assertEqual(stage_percentiles(days=365), [])
@@ -0,0 +1,127 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from io import BytesIO
+from unittest import mock
+
+from PIL import Image
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from contract_analysis.utils import tiles
+
+
+def tile_png(color="white") -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (tiles.TILE_SIZE, tiles.TILE_SIZE), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class TileTestCase(SimpleTestCase):
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        settings_override = override_settings(TILE_CACHE_DIR=cache_dir, TILE_CACHE_TTL=3600)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class TileWindowTests(SimpleTestCase):
+    def test_covers_window(self):
+        coordinates, (offset_x, offset_y) = tiles.tile_window(52.52, 13.40, 16, 800, 600)
+        xs = sorted({x for x, _ in coordinates})
+        ys = sorted({y for _, y in coordinates})
+        self.assertEqual(len(coordinates), len(xs) * len(ys))
+        self.assertGreaterEqual(len(xs) * tiles.TILE_SIZE - offset_x, 800)
+        self.assertGreaterEqual(len(ys) * tiles.TILE_SIZE - offset_y, 600)
+        self.assertLess(offset_x, tiles.TILE_SIZE)
+        self.assertLess(offset_y, tiles.TILE_SIZE)
+
+
+class TileCacheTests(TileTestCase):
+    def test_expired_tile_is_missing(self):
+        tiles.write_cached_tile(16, 1, 2, b"tile")
+        self.assertEqual(tiles.read_cached_tile(16, 1, 2), b"tile")
+
+        path = tiles._tile_path(16, 1, 2)
+        old = time.time() - 7200
+        os.utime(path, (old, old))
+        self.assertIsNone(tiles.read_cached_tile(16, 1, 2))
+
+    def test_evicts_least_recently_used(self):
+        now = time.time()
+        for y in range(4):
+            tiles.write_cached_tile(16, 1, y, b"x" * 100)
+            os.utime(tiles._tile_path(16, 1, y), (now - 100 + y, now))
+
+        self.assertEqual(tiles.evict_tile_cache(max_bytes=250), 2)
+        remaining = [y for y in range(4) if tiles._tile_path(16, 1, y).exists()]
+        self.assertEqual(remaining, [2, 3])
+
+    def test_fetch_downloads_only_missing_tiles(self):
+        tiles.write_cached_tile(16, 1, 1, tile_png())
+        with mock.patch.object(tiles, "_download_tile", return_value=tile_png("gray")) as download:
+            fetched = tiles.OSMTileSource().get_tiles(16, [(1, 1), (1, 2)])
+
+        download.assert_called_once_with(16, 1, 2)
+        self.assertEqual(set(fetched), {(1, 1), (1, 2)})
+        self.assertEqual(fetched[(1, 2)].getpixel((0, 0)), (128, 128, 128))
+
+    def test_render_map_size(self):
+        with mock.patch.object(tiles, "_download_tile", return_value=tile_png()):
+            image = tiles.render_map(52.52, 13.40, width_px=300, height_px=200, source=tiles.OSMTileSource())
+        self.assertEqual(image.size, (300, 200))
+
+
+class MBTilesTileSourceTests(SimpleTestCase):
+    def create_mbtiles(self, tiles_by_xyz, tile_format="png"):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "tiles.mbtiles")
+        connection = sqlite3.connect(path)
+        connection.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+        connection.execute(
+            "CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)"
+        )
+        connection.execute("INSERT INTO metadata VALUES ('format', ?)", (tile_format,))
+        for (zoom, x, y), data in tiles_by_xyz.items():
+            # MBTiles stores TMS rows, counted from the bottom
+            connection.execute("INSERT INTO tiles VALUES (?, ?, ?, ?)", (zoom, x, (1 << zoom) - 1 - y, data))
+        connection.commit()
+        connection.close()
+        return path
+
+    def test_reads_xyz_tiles(self):
+        path = self.create_mbtiles({(2, 1, 0): tile_png("black"), (2, 1, 3): tile_png("white")})
+        source = tiles.MBTilesTileSource(path)
+
+        fetched = source.get_tiles(2, [(1, 0), (1, 3), (2, 2)])
+        self.assertEqual(set(fetched), {(1, 0), (1, 3)})
+        self.assertEqual(fetched[(1, 0)].getpixel((0, 0)), (0, 0, 0))
+        self.assertEqual(fetched[(1, 3)].getpixel((0, 0)), (255, 255, 255))
+
+    def test_decoded_tiles_are_cached(self):
+        source = tiles.MBTilesTileSource(self.create_mbtiles({(2, 1, 0): tile_png()}), cache_size=1)
+        source.get_tiles(2, [(1, 0)])
+        with mock.patch.object(source, "_read_tile") as read_tile:
+            source.get_tiles(2, [(1, 0)])
+        read_tile.assert_not_called()
+
+    def test_rejects_vector_tiles(self):
+        with self.assertRaises(ImproperlyConfigured):
+            tiles.MBTilesTileSource(self.create_mbtiles({}, tile_format="pbf"))
+
+    def test_missing_file(self):
+        with self.assertRaises(ImproperlyConfigured):
+            tiles.MBTilesTileSource("/nonexistent/tiles.mbtiles")
+
+
+class TileSourceTests(SimpleTestCase):
+    def test_get_tiles_is_abstract(self):
+        class IncompleteSource(tiles.TileSource):
+            pass
+
+        with self.assertRaises(TypeError):
+            IncompleteSource()
@@ -0,0 +1,129 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from contract_analysis.models.contract import Contract
+from customers.models import Entitlement, User
+from customers.tests import create_purchase
+
+
+# The manifest only exists after collectstatic
+without_manifest = override_settings(STORAGES={
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+})
+
+
+@without_manifest
+class HomeViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("tenant")
+        self.client.force_login(self.user)
+
+    def add_contracts(self, count):
+        for _ in range(count):
+            contract = Contract.objects.create(user=self.user)
+            contract.add_file("page_1.png", b"page", "image/png")
+            contract.add_file("page_2.png", b"page", "image/png")
+
+    def count_queries(self):
+        # Count the queries of a cold entitlement snapshot every time
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("home"))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_contracts(self):
+        self.add_contracts(1)
+        baseline = self.count_queries()
+        self.add_contracts(5)
+        self.assertEqual(self.count_queries(), baseline)
+
+    def test_cursor_pages(self):
+        self.add_contracts(3)
+        first, cursor = Contract.get_dashboard_page(self.user, page_size=2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(first[0].page_count, 2)
+
+        second, next_cursor = Contract.get_dashboard_page(self.user, cursor=cursor, page_size=2)
+        self.assertEqual(len(second), 1)
+        self.assertIsNone(next_cursor)
+        newest_first = list(Contract.objects.order_by("-uploaded_at", "-id").values_list("id", flat=True))
+        self.assertEqual([contract.id for contract in first + second], newest_first)
+
+    def test_malformed_cursor_starts_over(self):
+        self.add_contracts(1)
+        page, _ = Contract.get_dashboard_page(self.user, cursor="not-a-cursor")
+        self.assertEqual(len(page), 1)
+
+
+@without_manifest
+class ContractParagraphsViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("tenant")
+        self.contract = Contract.objects.create(user=self.user)
+        self.contract.get_details().set_paragraphs(
+            [{"title": f"§ {number}", "simplified": f"Inhalt {number}"} for number in range(1, 4)]
+        )
+        self.client.force_login(self.user)
+
+    def test_pages(self):
+        url = reverse("contract_paragraphs", args=[self.contract.id])
+        first = self.client.get(url, {"limit": 2}).json()
+        self.assertEqual([paragraph["title"] for paragraph in first["paragraphs"]], ["§ 1", "§ 2"])
+        self.assertEqual(first["next_offset"], 2)
+
+        last = self.client.get(url, {"offset": first["next_offset"], "limit": 2}).json()
+        self.assertEqual([paragraph["title"] for paragraph in last["paragraphs"]], ["§ 3"])
+        self.assertIsNone(last["next_offset"])
+
+    def test_invalid_offset(self):
+        response = self.client.get(reverse("contract_paragraphs", args=[self.contract.id]), {"offset": "x"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_other_users_contract(self):
+        self.client.force_login(User.objects.create_user("other"))
+        response = self.client.get(reverse("contract_paragraphs", args=[self.contract.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ContractAnalysisViewTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user("tenant")
+        self.client.force_login(self.user)
+        self.contract = Contract.objects.create(user=self.user)
+
+        patcher = mock.patch("contract_analysis.views.analysis.ContractProcessor")
+        self.processor = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def analyze(self, result):
+        self.processor.process_contract = mock.AsyncMock(return_value=result)
+        return self.client.post(reverse("analyze_contract", args=[self.contract.id]))
+
+    def test_denied_without_analyses_left(self):
+        create_purchase(self.user, analyses=0)
+        response = self.analyze({})
+
+        self.assertEqual(response.status_code, 403)
+        self.processor.process_contract.assert_not_called()
+        self.contract.refresh_from_db()
+        self.assertNotEqual(self.contract.status, "processing")
+
+    def test_analysis_is_charged(self):
+        create_purchase(self.user, analyses=1)
+        self.assertEqual(self.analyze({}).status_code, 200)
+        self.assertEqual(Entitlement.get(self.user, "analyses"), 0)
+
+    def test_failed_analysis_is_refunded(self):
+        create_purchase(self.user, analyses=1)
+        self.assertEqual(self.analyze({"error": "Text extraction failed"}).status_code, 500)
+        self.assertEqual(Entitlement.get(self.user, "analyses"), 1)
+        self.contract.refresh_from_db()
+        self.assertEqual(self.contract.status, "error")
@@ -5,6 +5,7 @@ from .views.chat import chat
 from .views.contract import (
     archive_contract,
     get_contract_file,
+    get_contract_paragraphs,
     home_view,
     save_edited_contract,
     contract_view,
@@ -21,6 +22,11 @@ urlpatterns = [
         get_contract_file,
         name="contract_file",
     ),
+    path(
+        "contracts/<uuid:contract_id>/paragraphs",
+        get_contract_paragraphs,
+        name="contract_paragraphs",
+    ),
     path(
         "contracts/<uuid:contract_id>/archive",
         archive_contract,
@@ -0,0 +1,254 @@
+import functools
+import logging
+import re
+from datetime import date, datetime, time
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Any, Callable, Dict, Tuple
+
+from django.db import models
+
+logger = logging.getLogger(__name__)
+
+# Values the LLM uses to say "not in the contract"
+NULL_STRINGS = {"", "null", "none", "n/a", "na", "-", "--", "k.a.", "keine angabe", "unbekannt"}
+
+TRUE_STRINGS = {"true", "ja", "yes", "y", "1", "wahr", "erlaubt", "vorhanden"}
+FALSE_STRINGS = {"false", "nein", "no", "n", "0", "falsch", "nicht erlaubt", "nicht vorhanden"}
+
+DATE_FORMATS = ["%d.%m.%Y", "%d.%m.%y", "%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y"]
+
+# Plausible ranges for extracted values; anything outside is clamped
+FIELD_RANGES = {
+    "number_of_rooms": (Decimal("0.5"), Decimal("50")),
+    "termination_notice_tenant": (0, 24),
+    "termination_notice_landlord": (0, 24),
+    "renovation_interval_years": (0, 30),
+}
+
+_NUMBER_PATTERN = re.compile(r"-?[\d.,]+")
+_GERMAN_THOUSANDS_PATTERN = re.compile(r"^-?\d{1,3}(\.\d{3})+$")
+_TIME_PATTERN = re.compile(r"^(\d{1,2})(?:[:.](\d{2}))?(?::(\d{2}))?")
+
+
+class CoercionError(ValueError):
+    """Raised when an extracted value cannot be converted for a field."""
+
+
+def is_null(value) -> bool:
+    return value is None or (isinstance(value, str) and value.strip().lower() in NULL_STRINGS)
+
+
+def parse_decimal(value) -> Decimal:
+    """
+    Parse numbers as written in German contracts.
+    Example: "1.234,56 €" -> Decimal("1234.56"), "850,-" -> Decimal("850").
+    """
+    if isinstance(value, bool):
+        raise CoercionError(f"Expected a number, got {value!r}")
+    if isinstance(value, (int, Decimal, float)):
+        # json.loads accepts NaN and Infinity
+        number = Decimal(str(value)) if isinstance(value, float) else Decimal(value)
+        if not number.is_finite():
+            raise CoercionError(f"Invalid number {value!r}")
+        return number
+
+    match = _NUMBER_PATTERN.search(str(value).replace(" ", ""))
+    if not match:
+        raise CoercionError(f"No number in {value!r}")
+    number = match.group().rstrip(".,")
+
+    if "," in number and "." in number:
+        # Whichever separator comes last is the decimal separator
+        if number.rfind(",") > number.rfind("."):
+            number = number.replace(".", "").replace(",", ".")
+        else:
+            number = number.replace(",", "")
+    elif "," in number:
+        number = number.replace(",", ".")
+    elif _GERMAN_THOUSANDS_PATTERN.match(number):
+        number = number.replace(".", "")
+
+    try:
+        return Decimal(number)
+    except InvalidOperation:
+        raise CoercionError(f"Invalid number {value!r}")
+
+
+def parse_date(value) -> date:
+    """Parse a date in German (01.04.2024) or ISO (2024-04-01) notation."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+
+    text = str(value).strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            pass
+    try:
+        return datetime.fromisoformat(text).date()
+    except ValueError:
+        raise CoercionError(f"Invalid date {value!r}")
+
+
+def parse_time(value) -> time:
+    """Parse times such as "22:00", "22.00 Uhr" or "22 Uhr"."""
+    if isinstance(value, time):
+        return value
+
+    match = _TIME_PATTERN.match(str(value).strip())
+    if not match:
+        raise CoercionError(f"Invalid time {value!r}")
+    hour, minute, second = (int(part or 0) for part in match.groups())
+    if hour == 24 and minute == 0:
+        hour = 0
+    try:
+        return time(hour, minute, second)
+    except ValueError:
+        raise CoercionError(f"Invalid time {value!r}")
+
+
+def parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return value != 0
+
+    text = str(value).strip().lower()
+    if text in TRUE_STRINGS:
+        return True
+    if text in FALSE_STRINGS:
+        return False
+    raise CoercionError(f"Invalid boolean {value!r}")
+
+
+def clamp(value, bounds):
+    low, high = bounds
+    return max(low, min(high, value))
+
+
+def _decimal_coercer(field: models.DecimalField) -> Callable:
+    quantum = Decimal(1).scaleb(-field.decimal_places)
+    limit = Decimal(10) ** (field.max_digits - field.decimal_places)
+    bounds = FIELD_RANGES.get(field.name)
+
+    def coerce(value):
+        try:
+            number = parse_decimal(value).quantize(quantum, rounding=ROUND_HALF_UP)
+        except InvalidOperation:
+            # More digits than the decimal context holds
+            raise CoercionError(f"{value!r} exceeds {field.max_digits} digits")
+        if bounds:
+            number = clamp(number, bounds)
+        if abs(number) >= limit:
+            raise CoercionError(f"{number} exceeds {field.max_digits} digits")
+        if number < 0:
+            raise CoercionError(f"Negative amount {number}")
+        return number
+
+    return coerce
+
+
+def _integer_coercer(field: models.IntegerField) -> Callable:
+    bounds = FIELD_RANGES.get(field.name)
+    positive = isinstance(field, models.PositiveIntegerField)
+
+    def coerce(value):
+        number = int(parse_decimal(value).to_integral_value(rounding=ROUND_HALF_UP))
+        if bounds:
+            number = clamp(number, bounds)
+        if positive and number < 0:
+            raise CoercionError(f"Negative value {number}")
+        return number
+
+    return coerce
+
+
+def _choice_coercer(field: models.CharField) -> Callable:
+    # Accept the stored key as well as the German label, case-insensitively
+    lookup = {}
+    for key, label in field.choices:
+        lookup[str(key).lower()] = key
+        lookup[str(label).lower()] = key
+
+    def coerce(value):
+        key = lookup.get(str(value).strip().lower())
+        if key is None:
+            raise CoercionError(f"{value!r} is not one of {[key for key, _ in field.choices]}")
+        return key
+
+    return coerce
+
+
+def _string_coercer(field: models.Field) -> Callable:
+    max_length = getattr(field, "max_length", None)
+
+    def coerce(value):
+        text = str(value).strip()
+        return text[:max_length] if max_length else text
+
+    return coerce
+
+
+def build_coercer(field: models.Field) -> Callable:
+    """Build the conversion function for a single model field."""
+    if field.choices:
+        return _choice_coercer(field)
+    if isinstance(field, models.BooleanField):
+        return parse_bool
+    if isinstance(field, models.DecimalField):
+        return _decimal_coercer(field)
+    if isinstance(field, models.IntegerField):
+        return _integer_coercer(field)
+    if isinstance(field, models.DateTimeField):
+        return lambda value: datetime.combine(parse_date(value), time())
+    if isinstance(field, models.DateField):
+        return parse_date
+    if isinstance(field, models.TimeField):
+        return parse_time
+    return _string_coercer(field)
+
+
+@functools.cache
+def get_coercers(model) -> Dict[str, Tuple[models.Field, Callable]]:
+    """Coercers for every concrete, non-relational field of a model, built once per model."""
+    return {
+        field.name: (field, build_coercer(field))
+        for field in model._meta.concrete_fields
+        if not field.primary_key and not field.is_relation
+    }
+
+
+def coerce_values(model, data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    """
+    Convert extracted values to the types of the model fields.
+
+    Unknown keys are dropped. Values that cannot be converted are left out
+    and reported instead of failing the whole batch.
+
+    Returns:
+        Tuple of the converted values and a mapping of rejected field names to reasons
+    """
+    coercers = get_coercers(model)
+    values, rejections = {}, {}
+
+    for key, value in data.items():
+        if key not in coercers:
+            continue
+        field, coerce = coercers[key]
+
+        if is_null(value):
+            if field.null:
+                values[key] = None
+            elif field.has_default():
+                values[key] = field.get_default()
+            continue
+
+        try:
+            values[key] = coerce(value)
+        except CoercionError as e:
+            rejections[key] = str(e)
+
+    return values, rejections
@@ -6,6 +6,8 @@ import secrets
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from django.conf import settings
 
+from klarmieten.metrics import record_decrypted_bytes
+
 logger = logging.getLogger(__name__)
 
 
@@ -79,9 +81,12 @@ def decrypt_file(encrypted_data):
 
     aesgcm = AESGCM(key)
     try:
-        return aesgcm.decrypt(nonce, ciphertext, b"")
+        plaintext = aesgcm.decrypt(nonce, ciphertext, b"")
     except Exception as e:
         # InvalidTag exception will be raised if tampered with
         logger.exception("File decryption failed")
         logger.error(e)
         raise ValueError("File decryption failed - data may be corrupted")
+
+    record_decrypted_bytes(len(plaintext))
+    return plaintext
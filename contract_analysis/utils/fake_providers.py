@@ -0,0 +1,354 @@
+"""
+Offline stand-ins for the external providers of the analysis pipeline.
+
+FakeVisionClient, FakeGeminiClient and FakeMistralClient replace the SDK
+clients passed to ContractProcessor, see create_fake_processor().
+FakeProviderServer answers Nominatim searches and serves map tiles on
+localhost, for NOMINATIM_URL and TILE_URL.
+
+All of them answer with canned responses after a latency drawn from a
+FaultProfile, which also injects server errors and 429 rate limits. Each
+profile draws from its own seeded generator, so a sequential run behaves
+the same every time.
+"""
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from types import SimpleNamespace
+from typing import List, Union
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image, ImageDraw
+
+from contract_analysis.utils.tiles import TILE_SIZE
+
+logger = logging.getLogger(__name__)
+
+CONTRACT_TEXT = """Mietvertrag über Wohnraum
+
+§ 1 Mietsache
+Vermietet wird die Wohnung im 2. Obergeschoss des Hauses Hauptstraße 1, 10115 Berlin, bestehend aus 3 Zimmern, Küche, Bad und Balkon mit einer Wohnfläche von 72 m².
+
+§ 2 Mietzeit
+Das Mietverhältnis beginnt am 01.04.2025 und läuft auf unbestimmte Zeit.
+
+§ 3 Miete und Nebenkosten
+Die Grundmiete beträgt monatlich 950,00 EUR. Für Betriebskosten wird eine Vorauszahlung von 180,00 EUR, für Heizkosten von 90,00 EUR monatlich erhoben, über die jährlich abgerechnet wird.
+
+§ 4 Mietsicherheit
+Der Mieter leistet eine Kaution in Höhe von 2.850,00 EUR, zahlbar in drei Raten.
+
+§ 5 Kündigung
+Der Mieter kann mit einer Frist von drei Monaten kündigen. Für den Vermieter gelten die gesetzlichen Fristen.
+
+§ 6 Schönheitsreparaturen und Kleinreparaturen
+Schönheitsreparaturen trägt der Mieter. Kleinreparaturen bis 100,00 EUR im Einzelfall trägt der Mieter.
+
+§ 7 Tierhaltung und Untervermietung
+Kleintiere sind erlaubt. Eine Untervermietung bedarf der Zustimmung des Vermieters.
+"""
+
+CONTRACT_DETAILS = {
+    "contract_type": "unlimited",
+    "start_date": "2025-04-01",
+    "street": "Hauptstraße 1",
+    "postal_code": "10115",
+    "city": "Berlin",
+    "property_type": "apartment",
+    "number_of_rooms": "3",
+    "living_space": "72",
+    "kitchen": True,
+    "bathroom": True,
+    "balcony_or_terrace": True,
+    "basic_rent": "950.00",
+    "operating_costs": "180.00",
+    "heating_costs": "90.00",
+    "operating_costs_type": "advance",
+    "heating_costs_type": "advance",
+    "deposit_amount": "2850.00",
+    "termination_notice_tenant": 3,
+    "cosmetic_repairs": "tenant",
+    "small_repairs": "tenant",
+    "small_repairs_limit": "100.00",
+    "pets_allowed": True,
+    "subletting_allowed": False,
+}
+
+NEIGHBORHOOD_ANALYSIS = (
+    "Die Wohnung liegt in einem dicht bebauten Wohngebiet mit guter Anbindung an den öffentlichen "
+    "Nahverkehr. Supermärkte und Schulen sind zu Fuß erreichbar. Eine Hauptverkehrsstraße in der Nähe "
+    "kann tagsüber für Lärm sorgen, ein Park bietet Erholung im Grünen."
+)
+
+_PARAGRAPH_PATTERN = re.compile(r"^§\s*\d+\s*(.*)$", re.MULTILINE)
+
+
+class FakeProviderError(Exception):
+    """Injected provider failure, with the HTTP status like the SDK errors"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class FaultProfile:
+    """Latency distribution and injected failures of a fake provider"""
+
+    def __init__(
+        self,
+        median_ms: float = 0,
+        sigma: float = 0,
+        error_rate: float = 0,
+        rate_limit_rate: float = 0,
+        seed: int = 0,
+    ):
+        """
+        Args:
+            median_ms: Median latency in milliseconds
+            sigma: Spread of the log-normal latency distribution, 0 for a fixed latency
+            error_rate: Share of calls failing with a server error
+            rate_limit_rate: Share of calls failing with 429 Too Many Requests
+            seed: Seed of the generator drawing latencies and failures
+        """
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """
+        Draw the outcome of the next call.
+
+        Returns:
+            Tuple of the latency in seconds and the HTTP status (200, 429 or 500)
+        """
+        with self._lock:
+            factor = self._random.lognormvariate(0, self.sigma) if self.sigma else 1
+            roll = self._random.random()
+
+        if roll < self.rate_limit_rate:
+            status = 429
+        elif roll < self.rate_limit_rate + self.error_rate:
+            status = 500
+        else:
+            status = 200
+        return self.median_ms * factor / 1000, status
+
+    def apply(self, name: str):
+        """Wait for the drawn latency, then raise FakeProviderError for an injected failure"""
+        latency, status = self.draw()
+        if latency:
+            time.sleep(latency)
+        if status == 429:
+            raise FakeProviderError(429, f"{name}: rate limit exceeded")
+        if status != 200:
+            raise FakeProviderError(status, f"{name}: internal error")
+
+
+class FakeVisionClient:
+    """Stands in for vision.ImageAnnotatorClient"""
+
+    def __init__(self, text: Union[str, List[str]] = CONTRACT_TEXT, profile: FaultProfile = None):
+        """
+        Args:
+            text: Text of the first page, or a list with the text of each page.
+                Pages without text have no annotation
+            profile: Faults of the client, by default none
+        """
+        self.text = text
+        self.profile = profile or FaultProfile()
+
+    def batch_annotate_images(self, requests):
+        self.profile.apply("vision")
+        pages = [self.text] if isinstance(self.text, str) else self.text
+        responses = [
+            SimpleNamespace(
+                full_text_annotation=SimpleNamespace(text=pages[index]) if index < len(pages) else None,
+                text_annotations=[],
+            )
+            for index in range(len(requests))
+        ]
+        return SimpleNamespace(responses=responses)
+
+
+class FakeGeminiClient:
+    """Stands in for genai.Client, answering the extraction and neighborhood prompts"""
+
+    def __init__(self, details: dict = None, neighborhood: str = NEIGHBORHOOD_ANALYSIS, profile: FaultProfile = None):
+        self.details = CONTRACT_DETAILS if details is None else details
+        self.neighborhood = neighborhood
+        self.profile = profile or FaultProfile()
+        self.models = SimpleNamespace(generate_content=self.generate_content)
+
+    def generate_content(self, model, contents, config=None):
+        self.profile.apply("gemini")
+        prompt = contents[0] if contents and isinstance(contents[0], str) else ""
+        if "Umgebung einer Immobilie" in prompt:
+            return SimpleNamespace(text=self.neighborhood)
+        return SimpleNamespace(text=json.dumps(self.details, ensure_ascii=False))
+
+
+class FakeMistralClient:
+    """Stands in for the Mistral client, simplifying each § paragraph to its first sentence"""
+
+    def __init__(self, profile: FaultProfile = None):
+        self.profile = profile or FaultProfile()
+        self.chat = SimpleNamespace(complete=self.complete)
+
+    def complete(self, model, messages, **kwargs):
+        self.profile.apply("mistral")
+        text = messages[-1]["content"]
+        paragraphs = []
+        matches = list(_PARAGRAPH_PATTERN.finditer(text))
+        for match, following in zip(matches, matches[1:] + [None]):
+            body = text[match.end():following.start() if following else len(text)].strip()
+            paragraphs.append({
+                "title": match.group(1).strip() or match.group(0).strip(),
+                "simplified": body.split(". ")[0].rstrip(".") + ".",
+            })
+        content = json.dumps(paragraphs, ensure_ascii=False)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def create_fake_processor(profile: FaultProfile = None, seed: int = 0):
+    """
+    ContractProcessor with fake Vision, Gemini and Mistral clients.
+
+    Args:
+        profile: Faults of all three clients, by default none. Each client
+            gets its own copy, seeded differently
+        seed: Seed of the default profiles
+    """
+    from contract_analysis.analysis import ContractProcessor
+
+    def client_profile(offset):
+        if profile is None:
+            return FaultProfile(seed=seed + offset)
+        return FaultProfile(profile.median_ms, profile.sigma, profile.error_rate, profile.rate_limit_rate,
+                            seed=seed + offset)
+
+    return ContractProcessor(
+        vision_client=FakeVisionClient(profile=client_profile(0)),
+        gemini_client=FakeGeminiClient(profile=client_profile(1)),
+        mistral_client=FakeMistralClient(profile=client_profile(2)),
+    )
+
+
+def fake_location(query: str):
+    """Location in Germany derived from the query, the same on every call"""
+    digest = hashlib.sha256(query.strip().lower().encode("utf-8")).digest()
+    lat = 47.3 + int.from_bytes(digest[:4], "big") / 2 ** 32 * 7.7
+    lon = 6.0 + int.from_bytes(digest[4:8], "big") / 2 ** 32 * 9.0
+    return round(lat, 6), round(lon, 6)
+
+
+def _render_tile(x: int, y: int) -> bytes:
+    # Checkerboard of two colors with a grid line, so tile seams are visible
+    color = (232, 229, 220) if (x + y) % 2 else (214, 222, 207)
+    image = Image.new("RGB", (TILE_SIZE, TILE_SIZE), color)
+    ImageDraw.Draw(image).rectangle((0, 0, TILE_SIZE - 1, TILE_SIZE - 1), outline=(180, 180, 180))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class FakeProviderServer:
+    """
+    Nominatim search and OSM tiles on localhost.
+
+    Point NOMINATIM_URL at `nominatim_url` and TILE_URL at `tile_url`, with
+    a TILE_CACHE_DIR of its own.
+    """
+
+    def __init__(self, profile: FaultProfile = None, host: str = "127.0.0.1", port: int = 0):
+        """
+        Args:
+            profile: Faults of all responses, by default none
+            port: Port to listen on, 0 picks a free one
+        """
+        self.profile = profile or FaultProfile()
+        self._tiles = {parity: _render_tile(parity, 0) for parity in (0, 1)}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def nominatim_url(self) -> str:
+        return f"{self.url}/search"
+
+    @property
+    def tile_url(self) -> str:
+        return f"{self.url}/{{z}}/{{x}}/{{y}}.png"
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                latency, status = server.profile.draw()
+                if latency:
+                    time.sleep(latency)
+                if status != 200:
+                    self._send(status, b"", "text/plain", {"Retry-After": "1"} if status == 429 else {})
+                    return
+
+                url = urlparse(self.path)
+                tile = re.fullmatch(r"/(\d+)/(\d+)/(\d+)\.png", url.path)
+                if url.path in ("/search", "/search.php"):
+                    query = parse_qs(url.query).get("q", [""])[0]
+                    lat, lon = fake_location(query)
+                    body = [{"lat": str(lat), "lon": str(lon), "addresstype": "building"}] if query else []
+                    self._send(200, json.dumps(body).encode("utf-8"), "application/json")
+                elif tile:
+                    _, x, y = (int(value) for value in tile.groups())
+                    self._send(200, server._tiles[(x + y) % 2], "image/png")
+                else:
+                    self._send(404, b"", "text/plain")
+
+            def _send(self, status, body, content_type, headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"Fake provider: {format % args}")
+
+        return Handler
+
+    def start(self) -> "FakeProviderServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-providers", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,89 @@
+import logging
+from typing import Dict, Optional
+
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from contract_analysis.models.contract import Contract, ContractDetails
+
+logger = logging.getLogger(__name__)
+
+# Keys contain the content version, so entries never go stale and can live long
+FRAGMENT_TIMEOUT = 60 * 60 * 24 * 7
+
+PARAGRAPH_PAGE_SIZE = 20
+
+# Rendered sections of the contract page, by name
+CONTRACT_FRAGMENTS = {
+    "overview": "contract/overview.html",
+    "paragraphs": "contract/paragraphs.html",
+}
+
+
+def fragment_cache_key(contract: Contract, name: str) -> str:
+    return f"contract_fragment:{name}:{contract.id}:{contract.content_version}"
+
+
+def build_fragment_context(contract: Contract, contract_details: ContractDetails = None) -> Optional[Dict]:
+    """
+    Load everything the contract fragments render.
+
+    Returns:
+        Template context, or None if the contract has no details
+    """
+    if contract_details is None:
+        contract_details = (
+            ContractDetails.objects.defer(*ContractDetails.LARGE_TEXT_FIELDS)
+            .filter(contract=contract)
+            .first()
+        )
+    if not contract_details:
+        return None
+
+    # Only the first page of paragraphs is embedded, the rest is fetched on demand
+    paragraphs = contract_details.get_paragraphs(limit=PARAGRAPH_PAGE_SIZE)
+
+    return {
+        "contract": contract,
+        "contract_details": contract_details,
+        # Geocoded during analysis, rendering never calls out to Nominatim
+        "location": contract_details.location,
+        "paragraphs": paragraphs,
+        "paragraphs_next_offset": PARAGRAPH_PAGE_SIZE if len(paragraphs) == PARAGRAPH_PAGE_SIZE else None,
+    }
+
+
+def get_contract_fragments(contract: Contract) -> Optional[Dict[str, str]]:
+    """
+    Get the rendered fragments of the contract page for its current content version.
+
+    Cached fragments are read in one cache round trip. The details are only
+    loaded and rendered for fragments that are missing.
+
+    Returns:
+        Rendered HTML by fragment name, or None if the contract has no details
+    """
+    keys = {name: fragment_cache_key(contract, name) for name in CONTRACT_FRAGMENTS}
+    cached = cache.get_many(keys.values())
+    fragments = {name: cached[key] for name, key in keys.items() if key in cached}
+
+    missing = [name for name in CONTRACT_FRAGMENTS if name not in fragments]
+    if missing:
+        context = build_fragment_context(contract)
+        if context is None:
+            return None
+
+        rendered = {name: render_to_string(CONTRACT_FRAGMENTS[name], context) for name in missing}
+        cache.set_many({keys[name]: html for name, html in rendered.items()}, FRAGMENT_TIMEOUT)
+        fragments.update(rendered)
+
+    return {name: mark_safe(html) for name, html in fragments.items()}
+
+
+def warm_contract_fragments(contract: Contract):
+    """Render the fragments of a freshly analyzed contract, so its first view is a cache hit."""
+    try:
+        get_contract_fragments(contract)
+    except Exception as e:
+        logger.error(f"Error warming fragments of contract {contract.id}: {e}")
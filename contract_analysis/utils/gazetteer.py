@@ -0,0 +1,150 @@
+"""
+Offline German postal code gazetteer.
+
+Maps a postal code (and optionally the city) to the centroid of its area,
+without any network call. The data is compiled from a CSV by
+`manage.py import_plz_gazetteer` into a compact file holding parallel
+arrays sorted by postal code, which is loaded once and searched with bisect.
+"""
+import functools
+import logging
+import re
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+FILE_MAGIC = b"PLZ1"
+_HEADER = struct.Struct("<4sI")
+
+_POSTAL_CODE_PATTERN = re.compile(r"\b(\d{5})\b")
+_DIGIT_PATTERN = re.compile(r"\d")
+
+
+def normalize_city(city: str) -> str:
+    return " ".join(city.lower().replace("ß", "ss").split())
+
+
+class PostalCodeGazetteer:
+    """Postal code centroids in parallel arrays, sorted by postal code and city"""
+
+    def __init__(self, postal_codes: array, latitudes: array, longitudes: array, cities: list):
+        self.postal_codes = postal_codes
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.cities = cities
+
+    def __len__(self):
+        return len(self.postal_codes)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, str, float, float]]) -> "PostalCodeGazetteer":
+        """Build from (postal code, city, latitude, longitude) rows"""
+        rows = sorted(set(rows), key=lambda row: (row[0], normalize_city(row[1])))
+        return cls(
+            array("I", (row[0] for row in rows)),
+            array("f", (row[2] for row in rows)),
+            array("f", (row[3] for row in rows)),
+            [row[1] for row in rows],
+        )
+
+    @classmethod
+    def load(cls, path) -> "PostalCodeGazetteer":
+        data = Path(path).read_bytes()
+        magic, count = _HEADER.unpack_from(data)
+        if magic != FILE_MAGIC:
+            raise ValueError(f"{path} is not a postal code gazetteer")
+
+        offset = _HEADER.size
+        columns = []
+        for typecode in ("I", "f", "f"):
+            column = array(typecode)
+            size = column.itemsize * count
+            column.frombytes(data[offset:offset + size])
+            columns.append(column)
+            offset += size
+
+        cities = data[offset:].decode("utf-8").split("\n") if count else []
+        return cls(*columns, cities)
+
+    def save(self, path):
+        with open(path, "wb") as file:
+            file.write(_HEADER.pack(FILE_MAGIC, len(self)))
+            for column in (self.postal_codes, self.latitudes, self.longitudes):
+                file.write(column.tobytes())
+            file.write("\n".join(self.cities).encode("utf-8"))
+
+    def lookup(self, postal_code, city: str = None) -> Optional[Dict]:
+        """
+        Get the centroid of a postal code area.
+
+        A postal code can span several places. With a city the matching place
+        is returned, otherwise the first one.
+
+        Returns:
+            Dict with lat, lon and precision "postcode", or None if unknown
+        """
+        try:
+            code = int(postal_code)
+        except (TypeError, ValueError):
+            return None
+
+        start = bisect_left(self.postal_codes, code)
+        end = bisect_right(self.postal_codes, code, lo=start)
+        if start == end:
+            return None
+
+        index = start
+        if city:
+            # The city may be followed by more words, like the country
+            wanted = normalize_city(city)
+            for candidate in range(start, end):
+                name = normalize_city(self.cities[candidate])
+                if wanted == name or wanted.startswith(name + " "):
+                    index = candidate
+                    break
+
+        return {
+            "lat": round(self.latitudes[index], 5),
+            "lon": round(self.longitudes[index], 5),
+            "precision": "postcode",
+        }
+
+
+@functools.cache
+def get_gazetteer() -> Optional[PostalCodeGazetteer]:
+    """The gazetteer at PLZ_GAZETTEER_PATH, or None if it was not imported"""
+    path = Path(settings.PLZ_GAZETTEER_PATH)
+    if not path.exists():
+        logger.info(f"No postal code gazetteer at {path}, run import_plz_gazetteer to create it")
+        return None
+    gazetteer = PostalCodeGazetteer.load(path)
+    logger.info(f"Loaded {len(gazetteer)} postal code areas from {path}")
+    return gazetteer
+
+
+def is_coarse_address(address: str) -> bool:
+    """Whether an address is only a postal code and city, without a house number"""
+    return not _DIGIT_PATTERN.search(_POSTAL_CODE_PATTERN.sub("", address))
+
+
+def lookup_postal_code(address: str) -> Optional[Dict]:
+    """
+    Locate an address by the postal code it contains.
+
+    Returns:
+        Dict with lat, lon and precision "postcode", or None
+    """
+    gazetteer = get_gazetteer()
+    match = _POSTAL_CODE_PATTERN.search(address)
+    if gazetteer is None or match is None:
+        return None
+
+    # Whatever follows the postal code is usually the city
+    city = address[match.end():].strip(" ,")
+    return gazetteer.lookup(match.group(1), city or None)
@@ -0,0 +1,211 @@
+import logging
+import re
+import threading
+import time
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+
+from contract_analysis.models.geocoding import GeocodeCache
+from contract_analysis.utils.gazetteer import is_coarse_address, lookup_postal_code
+from contract_analysis.utils.spans import span
+from klarmieten.metrics import count_cache_lookup
+
+USER_AGENT = "Darf Vermieter Das/1.0 (josef.mueller@student.uni-tuebingen.de) This is for testing purposes only. I want to provide AI-based contract analysis."
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for Nominatim
+GEOCODE_TIMEOUT = 10
+
+# How long results stay valid, misses are retried sooner
+GEOCODE_CACHE_TTL = timedelta(days=90)
+GEOCODE_MISS_TTL = timedelta(days=1)
+
+_UMLAUTS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+_STREET_PATTERN = re.compile(r"(strasse|str\b\.?)")
+_PUNCTUATION_PATTERN = re.compile(r"[.,;:/()\"'-]+")
+_POSTAL_CODE_PATTERN = re.compile(r"\b\d{5}\b")
+_COUNTRY_WORDS = {"germany", "deutschland", "de"}
+
+# Striped locks, so threads of a worker wait for a single request per address
+_address_locks = [threading.Lock() for _ in range(64)]
+
+
+def normalize_address(address: str) -> str:
+    """
+    Normalize an address so spellings of the same place share a cache entry.
+
+    Example: "Wilhelmstraße 5, 72074 Tübingen" and "72074 tübingen wilhelmstr. 5"
+    both become "72074 5 tuebingen wilhelmstr".
+    """
+    text = address.lower().translate(_UMLAUTS)
+    text = _STREET_PATTERN.sub("str ", text)
+    text = _PUNCTUATION_PATTERN.sub(" ", text)
+
+    # The postal code leads, wherever it was written
+    postal_codes = _POSTAL_CODE_PATTERN.findall(text)
+    text = _POSTAL_CODE_PATTERN.sub(" ", text)
+
+    words = []
+    for word in text.split():
+        if word in _COUNTRY_WORDS:
+            continue
+        if word == "str" and words:
+            # "Wilhelm-Straße" and "Wilhelmstraße" are the same street
+            words[-1] += word
+        else:
+            words.append(word)
+    # Word order differs between notations, the key does not need it
+    return " ".join(postal_codes[:1] + sorted(words))
+
+
+def address_cache_key(normalized_address: str) -> str:
+    """Keyed with SECRET_KEY, a plain hash of an address could be reversed by hashing street lists"""
+    return salted_hmac("geocode_cache", normalized_address, algorithm="sha256").hexdigest()
+
+
+def _lookup(key: str):
+    """
+    Get the cached result of an address key.
+
+    Returns:
+        Tuple of whether a valid entry exists and its location
+    """
+    entry = GeocodeCache.objects.filter(address_key=key).first()
+    if entry is None:
+        return False, None
+
+    ttl = GEOCODE_CACHE_TTL if entry.latitude is not None else GEOCODE_MISS_TTL
+    if entry.fetched_at < timezone.now() - ttl:
+        return False, None
+    return True, entry.location
+
+
+def _request_nominatim(address: str):
+    """
+    Query Nominatim for an address.
+
+    Returns:
+        Dict with lat, lon and precision, or None if there is no match
+
+    Raises:
+        requests.RequestException: if Nominatim could not be reached
+    """
+    params = {"q": address, "format": "jsonv2", "limit": 1}
+    headers = {"User-Agent": USER_AGENT}
+
+    with span("nominatim.search", provider="nominatim") as nominatim_span:
+        response = requests.get(settings.NOMINATIM_URL, params=params, headers=headers, timeout=GEOCODE_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+        nominatim_span.set(results=len(data))
+
+    if not data:
+        return None
+    return {
+        "lat": float(data[0]["lat"]),
+        "lon": float(data[0]["lon"]),
+        "precision": data[0].get("addresstype"),
+    }
+
+
+def _fetch_and_store(address: str, key: str):
+    location = _request_nominatim(address)
+    GeocodeCache.objects.update_or_create(
+        address_key=key,
+        defaults={
+            "latitude": location["lat"] if location else None,
+            "longitude": location["lon"] if location else None,
+            "precision": location["precision"] if location else None,
+            "fetched_at": timezone.now(),
+        },
+    )
+    return location
+
+
+def _address_lock(key: str) -> threading.Lock:
+    return _address_locks[int(key[:8], 16) % len(_address_locks)]
+
+
+def geocode_address(address):
+    """
+    Geocode an address, from the offline postal code gazetteer or Nominatim.
+
+    Addresses without a house number are located by postal code first. The
+    gazetteer is also the fallback when Nominatim fails or finds nothing.
+
+    Returns:
+        Dict with lat, lon and precision (the Nominatim address type), or None
+    """
+    if is_coarse_address(address):
+        location = lookup_postal_code(address)
+        if location:
+            return location
+
+    return geocode_with_nominatim(address) or lookup_postal_code(address)
+
+
+def is_final_location(address: str, location) -> bool:
+    """
+    Whether a location is as precise as the address allows.
+
+    A postal code centroid is final for addresses without a house number.
+    For others it stood in for a failed Nominatim lookup, which is worth
+    retrying.
+    """
+    return location is not None and (location["precision"] != "postcode" or is_coarse_address(address))
+
+
+def geocode_with_nominatim(address):
+    """
+    Geocode an address with Nominatim, cached in the database by normalized address.
+
+    Concurrent lookups of the same address are single-flighted: threads of a
+    worker share a lock, and across workers a cache.add() lock makes the
+    others wait for the stored result instead of querying Nominatim too.
+
+    Returns:
+        Dict with lat, lon and precision (the Nominatim address type), or None
+    """
+    normalized_address = normalize_address(address)
+    if not normalized_address:
+        return None
+    key = address_cache_key(normalized_address)
+
+    found, location = _lookup(key)
+    count_cache_lookup("geocode", hit=found)
+    if found:
+        return location
+
+    try:
+        with _address_lock(key):
+            found, location = _lookup(key)
+            if found:
+                return location
+
+            flight_key = f"geocode_flight:{key}"
+            if cache.add(flight_key, True, GEOCODE_TIMEOUT + 5):
+                try:
+                    return _fetch_and_store(address, key)
+                finally:
+                    cache.delete(flight_key)
+
+            # Another worker is fetching this address, wait for its result
+            deadline = time.monotonic() + GEOCODE_TIMEOUT + 5
+            while time.monotonic() < deadline:
+                time.sleep(0.2)
+                found, location = _lookup(key)
+                if found:
+                    return location
+
+            logger.warning(f"Timed out waiting for geocode {key[:12]}, fetching it")
+            return _fetch_and_store(address, key)
+    except Exception as e:
+        logger.error(f"Error geocoding address: {e}")
+
+    return None
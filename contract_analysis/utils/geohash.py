@@ -0,0 +1,65 @@
+"""
+Geohash encoding, to bucket coordinates into cells.
+
+Each character halves the cell five times: precision 6 is about
+1.2 km x 0.6 km, 7 about 150 m x 150 m, 8 about 38 m x 19 m.
+"""
+from typing import Tuple
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {character: index for index, character in enumerate(_BASE32)}
+
+
+def encode(lat: float, lon: float, precision: int = 7) -> str:
+    """Geohash of the cell containing a location"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    characters = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(characters) < precision:
+        # Bits alternate between longitude and latitude, longitude first
+        value, value_range = (lon, lon_range) if even else (lat, lat_range)
+        middle = (value_range[0] + value_range[1]) / 2
+        if value >= middle:
+            bits = bits << 1 | 1
+            value_range[0] = middle
+        else:
+            bits = bits << 1
+            value_range[1] = middle
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            characters.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(characters)
+
+
+def decode(geohash: str) -> Tuple[float, float]:
+    """
+    Center of a geohash cell.
+
+    Returns:
+        Tuple of latitude and longitude
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+
+    for character in geohash:
+        bits = _DECODE[character]
+        for shift in range(4, -1, -1):
+            value_range = lon_range if even else lat_range
+            middle = (value_range[0] + value_range[1]) / 2
+            if bits >> shift & 1:
+                value_range[0] = middle
+            else:
+                value_range[1] = middle
+            even = not even
+
+    return (lat_range[0] + lat_range[1]) / 2, (lon_range[0] + lon_range[1]) / 2
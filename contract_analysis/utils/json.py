@@ -13,8 +13,9 @@ def model_to_schema(model_class, exclude=None):
     schema = {}
 
     for field in fields:
-        # Skip primary keys (IDs) and relation fields (Foreign Keys)
-        if field.primary_key or field.is_relation or not hasattr(field, 'get_internal_type'):
+        # Skip relation fields (Foreign Keys and reverse relations) and primary keys (IDs).
+        # Reverse relations like ContractDetails.paragraphs have no primary_key attribute
+        if field.is_relation or getattr(field, 'primary_key', False) or not hasattr(field, 'get_internal_type'):
             continue
 
         field_type = field.get_internal_type()
@@ -0,0 +1,259 @@
+"""
+Structured neighborhood facts from the local POI extract.
+
+Points of interest are indexed by region: the first analysis in a region
+loads the points of the region plus a margin of NEAREST_MAX_M with a
+bounding box query, into one KD-tree per category. A process keeps the
+MAX_REGIONS most recently used regions, so its memory stays bounded however
+large the extract is. The points are placed on the unit sphere, where the
+straight-line distance grows with the great-circle distance, so nearest
+neighbor and radius queries are exact without any projection. The facts for
+all categories take a few milliseconds, so they are computed for every
+analysis instead of asking Gemini to read them off the map.
+
+The regions are loaded again when `manage.py import_pois` stores a new extract.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from operator import itemgetter
+from typing import Dict, Iterable, Tuple
+
+from django.core.cache import cache
+
+from contract_analysis.models.poi import PointOfInterest
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+# Key of the import version, changes whenever a new extract is imported
+POI_INDEX_VERSION_KEY = "poi_index_version"
+
+# Radius in meters within which features of a category are counted
+FACT_RADII = {
+    "transit": 500,
+    "school": 1000,
+    "supermarket": 1000,
+    "park": 1000,
+    "major_road": 200,
+}
+
+# Nearest features further away are not reported, the margin loaded around a region
+NEAREST_MAX_M = 3000
+
+# Side of a region in degrees, about 11 by 7 km in Germany
+REGION_DEGREES = 0.1
+
+# Regions kept per process, least recently used ones are dropped first
+MAX_REGIONS = 64
+
+_regions = OrderedDict()
+_regions_version = None
+_regions_lock = threading.Lock()
+
+
+def to_unit_vector(lat: float, lon: float) -> Tuple[float, float, float]:
+    lat_rad = math.radians(lat)
+    lon_rad = math.radians(lon)
+    cos_lat = math.cos(lat_rad)
+    return cos_lat * math.cos(lon_rad), cos_lat * math.sin(lon_rad), math.sin(lat_rad)
+
+
+def _chord_to_meters(chord: float) -> float:
+    return 2 * EARTH_RADIUS_M * math.asin(min(chord / 2, 1.0))
+
+
+def _meters_to_chord(meters: float) -> float:
+    return 2 * math.sin(min(meters / (2 * EARTH_RADIUS_M), math.pi / 2))
+
+
+class KDTree:
+    """
+    Static 3D KD-tree stored implicitly in a list.
+
+    Each range of the list holds its subtree with the splitting point in the
+    middle, smaller coordinates on the axis before and larger ones after it.
+    """
+
+    def __init__(self, points: Iterable[Tuple[float, float, float, int]]):
+        """
+        Args:
+            points: Tuples of x, y, z and an integer payload
+        """
+        self.points = list(points)
+        stack = [(0, len(self.points), 0)]
+        while stack:
+            low, high, axis = stack.pop()
+            if high - low <= 1:
+                continue
+            self.points[low:high] = sorted(self.points[low:high], key=itemgetter(axis))
+            middle = (low + high) // 2
+            next_axis = (axis + 1) % 3
+            stack.append((low, middle, next_axis))
+            stack.append((middle + 1, high, next_axis))
+
+    def __len__(self):
+        return len(self.points)
+
+    def query(self, target: Tuple[float, float, float], radius: float):
+        """
+        Find the nearest point and all points within a radius.
+
+        Returns:
+            Tuple of the distance and payload of the nearest point (None if
+            the tree is empty) and the payloads of the points within the radius
+        """
+        points = self.points
+        tx, ty, tz = target
+        radius_squared = radius * radius
+        best_squared = math.inf
+        best_payload = None
+        within = []
+
+        stack = [(0, len(points), 0)]
+        while stack:
+            low, high, axis = stack.pop()
+            if low >= high:
+                continue
+            middle = (low + high) // 2
+            point = points[middle]
+
+            distance_squared = (tx - point[0]) ** 2 + (ty - point[1]) ** 2 + (tz - point[2]) ** 2
+            if distance_squared <= radius_squared:
+                within.append(point[3])
+            if distance_squared < best_squared:
+                best_squared = distance_squared
+                best_payload = point[3]
+
+            difference = target[axis] - point[axis]
+            next_axis = (axis + 1) % 3
+            if difference < 0:
+                near, far = (low, middle), (middle + 1, high)
+            else:
+                near, far = (middle + 1, high), (low, middle)
+
+            # The far side can only hold points closer than the plane
+            if difference * difference <= max(best_squared, radius_squared):
+                stack.append((*far, next_axis))
+            stack.append((*near, next_axis))
+
+        if best_payload is None:
+            return None, within
+        return (math.sqrt(best_squared), best_payload), within
+
+
+class POIIndex:
+    """One KD-tree per category, with the name and OSM feature of every point"""
+
+    def __init__(self, rows: Iterable[Tuple[str, str, str, float, float]]):
+        """
+        Args:
+            rows: Tuples of category, OSM id, name, latitude and longitude
+        """
+        self.features = []
+        self.names = []
+        feature_ids = {}
+        points = defaultdict(list)
+
+        for category, osm_id, name, lat, lon in rows:
+            # Points of the same feature share one payload, so it is counted once
+            payload = feature_ids.get((category, osm_id))
+            if payload is None:
+                payload = feature_ids[(category, osm_id)] = len(self.features)
+                self.features.append(osm_id)
+                self.names.append(name)
+            points[category].append((*to_unit_vector(lat, lon), payload))
+
+        self.trees = {category: KDTree(category_points) for category, category_points in points.items()}
+
+    def __len__(self):
+        return sum(len(tree) for tree in self.trees.values())
+
+    def facts(self, lat: float, lon: float) -> Dict[str, Dict]:
+        """
+        Compute distance and count facts around a location.
+
+        Returns:
+            Dict by category with the distance in meters and name of the
+            nearest feature, the number of features within the category's
+            radius, and the radius
+        """
+        target = to_unit_vector(lat, lon)
+        facts = {}
+        for category, radius in FACT_RADII.items():
+            tree = self.trees.get(category)
+            if tree is None:
+                continue
+            nearest, within = tree.query(target, _meters_to_chord(radius))
+            if nearest is None:
+                continue
+            chord, payload = nearest
+            nearest_m = _chord_to_meters(chord)
+            # Closer features may lie outside the loaded region
+            if nearest_m > NEAREST_MAX_M:
+                continue
+            facts[category] = {
+                "nearest_m": round(nearest_m),
+                "nearest_name": self.names[payload],
+                "count": len(set(within)),
+                "radius_m": radius,
+            }
+        return facts
+
+
+def region_of(lat: float, lon: float) -> Tuple[int, int]:
+    return math.floor(lat / REGION_DEGREES), math.floor(lon / REGION_DEGREES)
+
+
+def load_region(region: Tuple[int, int]) -> POIIndex:
+    """Index the points of a region and of the NEAREST_MAX_M around it"""
+    south, west = region[0] * REGION_DEGREES, region[1] * REGION_DEGREES
+    north, east = south + REGION_DEGREES, west + REGION_DEGREES
+    lat_margin = NEAREST_MAX_M / METERS_PER_DEGREE
+    # A degree of longitude is shorter away from the equator, most of all at the pole side of the region
+    lon_margin = lat_margin / max(math.cos(math.radians(min(max(abs(south), abs(north)), 89))), 0.01)
+
+    start = time.perf_counter()
+    index = POIIndex(
+        PointOfInterest.objects.filter(
+            latitude__range=(south - lat_margin, north + lat_margin),
+            longitude__range=(west - lon_margin, east + lon_margin),
+        ).values_list("category", "osm_id", "name", "latitude", "longitude").iterator()
+    )
+    logger.info(f"Indexed {len(index)} points of interest around {region} in {time.perf_counter() - start:.2f}s")
+    return index
+
+
+def get_poi_index(lat: float, lon: float) -> POIIndex:
+    """The index of the region around a location, loaded on first use"""
+    global _regions_version
+
+    version = cache.get(POI_INDEX_VERSION_KEY, 0)
+    region = region_of(lat, lon)
+    with _regions_lock:
+        if _regions_version != version:
+            _regions.clear()
+            _regions_version = version
+        index = _regions.get(region)
+        if index is not None:
+            _regions.move_to_end(region)
+            return index
+
+        index = _regions[region] = load_region(region)
+        if len(_regions) > MAX_REGIONS:
+            _regions.popitem(last=False)
+        return index
+
+
+def invalidate_poi_index():
+    """Make every process load its regions again, after an import"""
+    cache.set(POI_INDEX_VERSION_KEY, time.time(), None)
+
+
+def get_neighborhood_facts(lat: float, lon: float) -> Dict[str, Dict]:
+    """Facts around a location, empty if no points of interest are near"""
+    return get_poi_index(lat, lon).facts(lat, lon)
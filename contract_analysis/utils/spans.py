@@ -0,0 +1,270 @@
+"""
+Timing spans for the analysis pipeline.
+
+A RunRecorder is activated around a pipeline run, and every stage and
+provider call inside it is wrapped in `span()`. Spans find the active run
+and their parent through context variables, so they nest correctly across
+awaits and asyncio.gather. Work handed to a thread pool must go through
+`run_in_executor()`, which carries the context along; sync_to_async does
+so on its own. Outside an active run spans only feed the metrics.
+
+The spans are kept in memory during the run and written with the
+AnalysisRun once it is over.
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+from typing import Dict, List
+
+from django.db.models import CharField, Count, Value
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from contract_analysis.models.pipeline import AnalysisRun, AnalysisSpan
+from klarmieten.metrics import PROVIDER_REQUESTS, STAGE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Longest error message kept on a run or span
+MAX_ERROR_LENGTH = 1000
+
+PERCENTILES = (50, 90, 99)
+
+# Longest window of stage_percentiles(), every span in it is read once
+MAX_PERCENTILE_DAYS = 90
+
+_current_run: ContextVar = ContextVar("analysis_run", default=None)
+_current_span: ContextVar = ContextVar("analysis_span", default=None)
+
+
+def _status_code(error) -> int:
+    """HTTP status of a provider error, from requests, google or mistral exceptions"""
+    for candidate in (error, getattr(error, "response", None)):
+        for attribute in ("status_code", "code"):
+            value = getattr(candidate, attribute, None)
+            if isinstance(value, int):
+                return int(value)
+    return None
+
+
+class Span:
+    def __init__(self, name: str, parent: str = "", attributes: Dict = None, provider: str = None):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes or {}
+        self.provider = provider
+        self.error = ""
+        self.status_code = None
+        self.start = time.perf_counter()
+        self.end = None
+
+    def set(self, **attributes):
+        """Attach attributes like payload sizes or cache hits"""
+        self.attributes.update(attributes)
+
+    def fail(self, error):
+        """Mark the span as failed, for errors that are handled inside it"""
+        self.error = str(error)[:MAX_ERROR_LENGTH] or type(error).__name__
+        self.status_code = _status_code(error)
+        if self.status_code:
+            self.attributes["status_code"] = self.status_code
+
+    @property
+    def outcome(self) -> str:
+        if not self.error:
+            return "ok"
+        return "rate_limited" if self.status_code == 429 else "error"
+
+
+class RunRecorder:
+    """Collects the spans of one pipeline run"""
+
+    def __init__(self):
+        self.started_at = timezone.now()
+        self.start = time.perf_counter()
+        self.spans: List[Span] = []
+        self.error = ""
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        """Record the spans opened within this block, and the threads and tasks it starts"""
+        token = _current_run.set(self)
+        try:
+            yield self
+        finally:
+            _current_run.reset(token)
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def fail(self, error):
+        self.error = str(error)[:MAX_ERROR_LENGTH] or type(error).__name__
+
+    def save(self, contract=None) -> AnalysisRun:
+        """
+        Store the run and its spans.
+
+        Never raises, a failing ledger must not fail the analysis.
+
+        Returns:
+            The stored run, or None if it could not be stored
+        """
+        duration_ms = (time.perf_counter() - self.start) * 1000
+        STAGE_LATENCY.observe(duration_ms / 1000, stage="run")
+        try:
+            run = AnalysisRun.objects.create(
+                contract=contract,
+                started_at=self.started_at,
+                duration_ms=duration_ms,
+                status="error" if self.error else "success",
+                error=self.error,
+            )
+            with self._lock:
+                spans = list(self.spans)
+            AnalysisSpan.objects.bulk_create([
+                AnalysisSpan(
+                    run=run,
+                    name=span.name,
+                    parent=span.parent,
+                    start_ms=(span.start - self.start) * 1000,
+                    duration_ms=(span.end - span.start) * 1000,
+                    success=not span.error,
+                    error=span.error,
+                    attributes=span.attributes,
+                )
+                for span in spans
+            ])
+            return run
+        except Exception as e:
+            logger.error(f"Error storing analysis run: {e}")
+            return None
+
+
+@contextmanager
+def span(name: str, provider: str = None, **attributes):
+    """
+    Time a stage or provider call of the active run.
+
+    Exceptions leaving the block mark the span as failed and are re-raised.
+    Spans of provider calls count their outcome, see PROVIDER_REQUESTS.
+
+    Args:
+        name: Stage name, like "ocr" or "gemini.generate_content"
+        provider: External service called within the span, like "gemini"
+        attributes: Initial attributes of the span
+    """
+    run = _current_run.get()
+    parent = _current_span.get()
+    current = Span(name, parent.name if parent else "", attributes, provider)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.fail(e)
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+        STAGE_LATENCY.observe(current.end - current.start, stage=name)
+        if provider:
+            PROVIDER_REQUESTS.inc(provider=provider, outcome=current.outcome)
+        if run is not None:
+            run.add(current)
+
+
+def run_in_executor(executor, func, *args):
+    """loop.run_in_executor, but func runs in the caller's context and so within its span"""
+    return asyncio.get_running_loop().run_in_executor(executor, copy_context().run, func, *args)
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def _ordered_summaries(rows, counts: Dict) -> Dict:
+    """
+    Summarize durations read in order, without holding them in memory.
+
+    Args:
+        rows: Tuples of a group and a duration, ordered by group and duration
+        counts: Number of durations per group, which the nearest ranks need
+
+    Returns:
+        Dict by group with the count, max and the PERCENTILES
+    """
+    summaries = {}
+    for group, values in groupby(rows, key=itemgetter(0)):
+        ranks = [max(math.ceil(percent / 100 * counts.get(group, 0)), 1) for percent in PERCENTILES]
+        picked = [None] * len(ranks)
+        count, duration = 0, None
+        for count, (_, duration) in enumerate(values, 1):
+            for index, rank in enumerate(ranks):
+                if rank == count:
+                    picked[index] = duration
+        summaries[group] = {
+            "count": count,
+            "max": duration,
+            # Rows deleted since counting can leave a rank unreached
+            "percentiles": [duration if value is None else value for value in picked],
+        }
+    return summaries
+
+
+def stage_percentiles(days: int = 30) -> List[Dict]:
+    """
+    Duration percentiles per stage over the last days, overall and per day.
+
+    The whole run is included as the stage "run". The database sorts the
+    durations and they are read once in order, so memory does not grow with
+    the number of runs. At most MAX_PERCENTILE_DAYS are read.
+
+    Returns:
+        List of dicts with the stage name, count, max and the PERCENTILES in
+        milliseconds, and "daily" with the same per day, newest first
+    """
+    since = timezone.now() - timedelta(days=min(days, MAX_PERCENTILE_DAYS))
+    querysets = [
+        AnalysisRun.objects.filter(started_at__gte=since).annotate(
+            name=Value("run", output_field=CharField()), day=TruncDate("started_at")
+        ),
+        AnalysisSpan.objects.filter(run__started_at__gte=since).annotate(day=TruncDate("run__started_at")),
+    ]
+
+    overall, daily = {}, {}
+    for queryset in querysets:
+        daily_counts = {
+            (row["name"], row["day"]): row["count"]
+            for row in queryset.order_by().values("name", "day").annotate(count=Count("pk"))
+        }
+        counts = defaultdict(int)
+        for (name, _), count in daily_counts.items():
+            counts[name] += count
+
+        rows = queryset.order_by("name", "duration_ms").values_list("name", "duration_ms").iterator()
+        overall.update(_ordered_summaries(rows, counts))
+        rows = queryset.order_by("name", "day", "duration_ms").values_list("name", "day", "duration_ms").iterator()
+        daily.update(_ordered_summaries((((name, day), duration) for name, day, duration in rows), daily_counts))
+
+    stages = []
+    for name in sorted(overall, key=lambda name: (name != "run", name)):
+        days_of_stage = sorted((day for stage_name, day in daily if stage_name == name), reverse=True)
+        stages.append({
+            "name": name,
+            **overall[name],
+            "daily": [{"day": day, **daily[(name, day)]} for day in days_of_stage],
+        })
+    return stages
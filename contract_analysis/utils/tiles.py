@@ -0,0 +1,354 @@
+"""
+Tile sources for neighborhood maps.
+
+OSMTileSource downloads tiles through one pooled session with at most two
+requests in flight, as the OSM tile usage policy asks, and keeps them in a
+z/x/y directory tree on disk. Cached tiles expire after TILE_CACHE_TTL and
+the least recently used ones are evicted once the cache grows past
+TILE_CACHE_MAX_BYTES.
+
+MBTilesTileSource reads a local MBTiles extract instead, for deployments
+that render maps offline. It is used when MBTILES_PATH is set.
+"""
+import functools
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+import requests
+from PIL import Image
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from requests.adapters import HTTPAdapter
+
+from contract_analysis.utils.geocoding import USER_AGENT
+from contract_analysis.utils.spans import span
+from klarmieten.metrics import count_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = 256
+
+# Seconds to wait for a tile
+TILE_TIMEOUT = 5
+
+# The OSM tile usage policy allows at most two concurrent downloads
+MAX_CONCURRENT_TILE_REQUESTS = 2
+
+# Walking the cache directory is not free, evict at most this often
+EVICTION_INTERVAL = 60 * 10
+
+_session = None
+_session_lock = threading.Lock()
+_download_slots = threading.BoundedSemaphore(MAX_CONCURRENT_TILE_REQUESTS)
+_last_eviction = 0.0
+
+
+def get_session() -> requests.Session:
+    """Shared session, so tile requests reuse their connections"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers["User-Agent"] = USER_AGENT
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENT_TILE_REQUESTS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def lat_lon_to_pixel(lat: float, lon: float, zoom: int) -> Tuple[float, float]:
+    """Position of a location in Web Mercator pixels of the whole world at a zoom level"""
+    scale = TILE_SIZE * 2 ** zoom
+    lat_rad = math.radians(lat)
+    x = (lon + 180) / 360 * scale
+    y = (1 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2 * scale
+    return x, y
+
+
+def tile_window(lat: float, lon: float, zoom: int, width_px: int, height_px: int):
+    """
+    Compute exactly the tiles covering a window centered on a location.
+
+    Returns:
+        Tuple of the tile coordinates (x, y) row by row, and the pixel offset
+        of the window's top left corner within the first tile
+    """
+    center_x, center_y = lat_lon_to_pixel(lat, lon, zoom)
+    left = int(round(center_x - width_px / 2))
+    top = int(round(center_y - height_px / 2))
+
+    first_x, first_y = left // TILE_SIZE, top // TILE_SIZE
+    last_x = (left + width_px - 1) // TILE_SIZE
+    last_y = (top + height_px - 1) // TILE_SIZE
+
+    tiles = [(x, y) for y in range(first_y, last_y + 1) for x in range(first_x, last_x + 1)]
+    return tiles, (left - first_x * TILE_SIZE, top - first_y * TILE_SIZE)
+
+
+def _tile_path(zoom: int, x: int, y: int) -> Path:
+    return Path(settings.TILE_CACHE_DIR) / str(zoom) / str(x) / f"{y}.png"
+
+
+def read_cached_tile(zoom: int, x: int, y: int) -> Optional[bytes]:
+    """Get a tile from the disk cache, or None if it is missing or expired"""
+    path = _tile_path(zoom, x, y)
+    try:
+        stat = path.stat()
+        if time.time() - stat.st_mtime > settings.TILE_CACHE_TTL:
+            return None
+        data = path.read_bytes()
+        # The access time marks the last use for eviction, the mtime the download
+        os.utime(path, (time.time(), stat.st_mtime))
+        return data
+    except OSError:
+        return None
+
+
+def write_cached_tile(zoom: int, x: int, y: int, data: bytes):
+    path = _tile_path(zoom, x, y)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Written aside and moved, so readers never see a partial tile
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.error(f"Error caching map tile {path}: {e}")
+
+
+def evict_tile_cache(max_bytes: int = None) -> int:
+    """
+    Delete the least recently used tiles until the cache fits its size limit.
+
+    Returns:
+        Number of deleted tiles
+    """
+    max_bytes = settings.TILE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+
+    entries = []
+    total_bytes = 0
+    for root, _, file_names in os.walk(settings.TILE_CACHE_DIR):
+        for file_name in file_names:
+            path = os.path.join(root, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+            total_bytes += stat.st_size
+
+    if total_bytes <= max_bytes:
+        return 0
+
+    # Shrink below the limit, so eviction does not run on every download
+    target_bytes = max_bytes * 0.9
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total_bytes <= target_bytes:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total_bytes -= size
+        removed += 1
+
+    logger.info(f"Evicted {removed} map tiles from the cache")
+    return removed
+
+
+def _evict_periodically():
+    global _last_eviction
+    now = time.monotonic()
+    if now - _last_eviction < EVICTION_INTERVAL:
+        return
+    _last_eviction = now
+    evict_tile_cache()
+
+
+def _download_tile(zoom: int, x: int, y: int) -> Optional[bytes]:
+    url = settings.TILE_URL.format(z=zoom, x=x, y=y)
+    with span("tiles.download", provider="osm_tiles") as download_span:
+        try:
+            with _download_slots:
+                response = get_session().get(url, timeout=TILE_TIMEOUT)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            download_span.fail(e)
+            logger.error(f"Error fetching map tile {url}: {e}")
+            return None
+        download_span.set(payload_bytes=len(response.content))
+
+    write_cached_tile(zoom, x, y, response.content)
+    return response.content
+
+
+def _decode_tile(data: bytes, description: str) -> Optional[Image.Image]:
+    try:
+        return Image.open(BytesIO(data)).convert("RGB")
+    except OSError as e:
+        logger.error(f"Invalid map tile {description}: {e}")
+        return None
+
+
+class TileSource(ABC):
+    """Where map tiles come from"""
+
+    @abstractmethod
+    def get_tiles(self, zoom: int, coordinates: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], Image.Image]:
+        """
+        Get decoded tiles in XYZ (slippy map) coordinates.
+
+        Returns:
+            Tiles by (x, y), tiles that are not available are left out
+        """
+
+
+class OSMTileSource(TileSource):
+    """Tiles from the OSM tile server, cached on disk"""
+
+    def get_tiles(self, zoom, coordinates):
+        tile_data = {}
+        missing = []
+        for x, y in coordinates:
+            data = read_cached_tile(zoom, x, y)
+            if data is None:
+                missing.append((x, y))
+            else:
+                tile_data[(x, y)] = data
+        count_cache_lookup("tiles", hit=True, count=len(tile_data))
+        count_cache_lookup("tiles", hit=False, count=len(missing))
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_TILE_REQUESTS) as executor:
+                # Each download runs in a copy of this context, so its span joins the analysis run
+                futures = [executor.submit(copy_context().run, _download_tile, zoom, *tile) for tile in missing]
+                for tile, future in zip(missing, futures):
+                    data = future.result()
+                    if data is not None:
+                        tile_data[tile] = data
+            _evict_periodically()
+
+        tiles = {}
+        for (x, y), data in tile_data.items():
+            image = _decode_tile(data, f"{zoom}/{x}/{y}")
+            if image is not None:
+                tiles[(x, y)] = image
+        return tiles
+
+
+class MBTilesTileSource(TileSource):
+    """
+    Raster tiles from a local MBTiles file.
+
+    The file is opened read-only and immutable with memory-mapped reads, one
+    connection per thread. Decoded tiles are kept in an LRU, so maps of the
+    same neighborhood are assembled without touching the file.
+    """
+
+    def __init__(self, path: str, cache_size: int = 512, mmap_size: int = 256 * 1024 * 1024):
+        if not os.path.exists(path):
+            raise ImproperlyConfigured(f"MBTiles file {path} does not exist")
+        self.path = path
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        tile_format = self._metadata().get("format", "png")
+        if tile_format not in ("png", "jpg", "jpeg", "webp"):
+            raise ImproperlyConfigured(f"MBTiles file {path} holds {tile_format} tiles, only raster tiles are supported")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # immutable skips locking and change detection, the file never changes while served
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro&immutable=1", uri=True)
+            connection.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            self._local.connection = connection
+        return connection
+
+    def _metadata(self) -> Dict[str, str]:
+        try:
+            return dict(self._connection().execute("SELECT name, value FROM metadata"))
+        except sqlite3.Error:
+            return {}
+
+    def _read_tile(self, zoom: int, x: int, y: int) -> Optional[bytes]:
+        # MBTiles rows count from the bottom (TMS), slippy map rows from the top
+        tms_y = (1 << zoom) - 1 - y
+        row = self._connection().execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (zoom, x, tms_y),
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_tiles(self, zoom, coordinates):
+        tiles = {}
+        hits = misses = 0
+        for x, y in coordinates:
+            key = (zoom, x, y)
+            with self._cache_lock:
+                image = self._cache.get(key)
+                if image is not None:
+                    self._cache.move_to_end(key)
+                    hits += 1
+            if image is None:
+                misses += 1
+                data = self._read_tile(zoom, x, y)
+                image = _decode_tile(data, f"{zoom}/{x}/{y}") if data else None
+                if image is None:
+                    continue
+                with self._cache_lock:
+                    self._cache[key] = image
+                    if len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+            tiles[(x, y)] = image
+        count_cache_lookup("mbtiles", hit=True, count=hits)
+        count_cache_lookup("mbtiles", hit=False, count=misses)
+        return tiles
+
+
+@functools.cache
+def get_tile_source() -> TileSource:
+    """The configured tile source, MBTiles if MBTILES_PATH is set"""
+    if settings.MBTILES_PATH:
+        return MBTilesTileSource(settings.MBTILES_PATH)
+    return OSMTileSource()
+
+
+def render_map(
+    lat: float, lon: float, zoom: int = 16, width_px: int = 800, height_px: int = 600, source: TileSource = None
+) -> Image.Image:
+    """Assemble a map image of the given size centered on a location"""
+    source = source or get_tile_source()
+    tiles, (offset_x, offset_y) = tile_window(lat, lon, zoom, width_px, height_px)
+    tile_count = 2 ** zoom
+
+    first_x, first_y = tiles[0]
+    last_x, last_y = tiles[-1]
+    canvas = Image.new(
+        "RGB", ((last_x - first_x + 1) * TILE_SIZE, (last_y - first_y + 1) * TILE_SIZE)
+    )
+
+    # Tiles wrap around horizontally, there is nothing above or below the map
+    images = source.get_tiles(zoom, {(x % tile_count, y) for x, y in tiles if 0 <= y < tile_count})
+    for x, y in tiles:
+        image = images.get((x % tile_count, y))
+        if image is not None:
+            canvas.paste(image, ((x - first_x) * TILE_SIZE, (y - first_y) * TILE_SIZE))
+
+    return canvas.crop((offset_x, offset_y, offset_x + width_px, offset_y + height_px))
@@ -14,6 +14,8 @@ from customers.models import Entitlement
 from contract_analysis.analysis import ContractProcessor
 from contract_analysis.models.contract import Contract
 from contract_analysis.utils.error import error_response
+from contract_analysis.utils.fragments import warm_contract_fragments
+from contract_analysis.utils.spans import RunRecorder
 
 logger = logging.getLogger(__name__)
 
@@ -40,9 +42,11 @@ class ContractBaseView(LoginRequiredMixin, View):
 
     @staticmethod
     def mark_analyzed(contract):
-        """Mark contract as analyzed."""
+        """Mark contract as analyzed and render its page fragments once committed."""
         contract.status = "analyzed"
         contract.save(update_fields=['status'])
+        contract.bump_content_version()
+        transaction.on_commit(lambda: warm_contract_fragments(contract))
 
     @staticmethod
     def mark_error(contract):
@@ -78,27 +82,30 @@ class ContractAnalysisView(ContractBaseView):
 
         logger.info(f"Analyzing contract {contract_id} for user {request.user}")
 
-        # Check if user has permission to analyze contracts
-        entitlement = Entitlement.get(user, 'analyses')
-        #if not entitlement or entitlement and entitlement.value <= 0:
-         #   return error_response("User does not have permission to analyze contracts. Please upgrade your plan.",
-         #                         status=403)
-
         contract = self.get_contract(contract_id)
         temp_images = []
 
-        try:
-            # Check if already processing
-            if not self.check_processing_status(contract):
-                return error_response("Contract is already being analyzed", status=400)
+        # Check if already processing
+        if not self.check_processing_status(contract):
+            return error_response("Contract is already being analyzed", status=400)
 
-            with transaction.atomic():
+        # Reserve one analysis up front, so parallel requests cannot overdraw the quota
+        reservation = Entitlement.reserve(user, 'analyses')
+        if reservation is None:
+            return error_response("User does not have permission to analyze contracts. Please upgrade your plan.",
+                                  status=403)
+
+        run = RunRecorder()
+        try:
+            with run.activate(), transaction.atomic():
                 # Update contract status to "processing"
                 self.mark_processing(contract)
 
-                async_to_sync(self.contract_processor.process_contract)(
+                result = async_to_sync(self.contract_processor.process_contract)(
                     contract=contract
                 )
+                if "error" in result:
+                    raise ValueError(result["error"])
 
                 # Update contract status to "analyzed"
                 self.mark_analyzed(contract)
@@ -107,10 +114,15 @@ class ContractAnalysisView(ContractBaseView):
                 return JsonResponse({"success": True})
 
         except Exception as e:
+            # Failed analyses do not count against the quota
+            reservation.refund()
+            run.fail(e)
             self.mark_error(contract)
             logger.exception(f"Error analyzing contract {contract_id}: {str(e)}")
             return error_response(str(e), status=500)
         finally:
+            # Stored outside the transaction, so failed runs are kept as well
+            run.save(contract)
             self.clean_up_temp_files(temp_images)
 
 
@@ -2,7 +2,6 @@ import base64
 import logging
 
 from django.contrib.auth.decorators import login_required
-from django.core.cache import cache
 from django.http import HttpResponse, JsonResponse
 from django.http.response import HttpResponseNotFound
 from django.shortcuts import render, get_object_or_404
@@ -12,10 +11,12 @@ from django.views.decorators.http import require_http_methods
 from customers.models import Entitlement
 from contract_analysis.models.contract import Contract, ContractDetails, ContractFile
 from contract_analysis.utils.error import handle_exception, error_response
-from contract_analysis.utils.map import geocode_address
+from contract_analysis.utils.fragments import PARAGRAPH_PAGE_SIZE, get_contract_fragments
 
 logger = logging.getLogger(__name__)
 
+DASHBOARD_PAGE_SIZE = 12
+
 
 @login_required
 def home_view(request):
@@ -35,11 +36,16 @@ def home_view(request):
         return error_response("Unauthorized", 401)
 
     # Check if user has permission to analyze contracts
-    entitlement = Entitlement.get(user, 'analyses')
-    can_analyze = entitlement is not None and entitlement.value > 0
+    can_analyze = (Entitlement.get(user, 'analyses') or 0) > 0
 
-    contracts = Contract.objects.filter(user=user, archived=False)
-    return render(request, "contract/home.html", {"contracts": contracts, "can_analyze": can_analyze})
+    contracts, next_cursor = Contract.get_dashboard_page(
+        user, cursor=request.GET.get("cursor"), page_size=DASHBOARD_PAGE_SIZE
+    )
+    return render(request, "contract/home.html", {
+        "contracts": contracts,
+        "next_cursor": next_cursor,
+        "can_analyze": can_analyze,
+    })
 
 
 @login_required
@@ -61,7 +67,7 @@ def get_contracts(request):
 def contract_view(request, contract_id):
     """
     View for displaying contract details with location information.
-    Uses caching to improve performance for frequently accessed contracts.
+    The detail sections are cached as rendered fragments per content version.
 
     Args:
         request: HttpRequest object
@@ -70,40 +76,46 @@ def contract_view(request, contract_id):
     Returns:
         Rendered contract detail view or 404 if not found
     """
-    # Try to get from cache first
-    cache_key = f"contract_{contract_id}_{request.user.id}"
-    cached_data = cache.get(cache_key)
-
-    if cached_data:
-        return render(request, "contract/contract.html", cached_data)
-
-    # Get from the database
     contract = get_object_or_404(
         Contract, id=contract_id, user=request.user, archived=False
     )
-    contract_details = ContractDetails.objects.filter(contract=contract).first()
-    if not contract_details:
+
+    fragments = get_contract_fragments(contract)
+    if fragments is None:
         return HttpResponseNotFound("Contract details not found")
 
-    # Create full address string and geocode
-    address_parts = [
-        contract_details.street or "",
-        contract_details.postal_code or "",
-        contract_details.city or "",
-        "Germany"  # Default country
-    ]
-    address = " ".join(filter(None, address_parts))
-    location = geocode_address(address)
-
-    # Cache for 10 minutes
-    context = {
+    return render(request, "contract/contract.html", {
         "contract": contract,
-        "contract_details": contract_details,
-        "location": location,
-    }
-    cache.set(cache_key, context, 60 * 10)
+        "fragments": fragments,
+    })
 
-    return render(request, "contract/contract.html", context)
+
+@login_required
+def get_contract_paragraphs(request, contract_id):
+    """
+    AJAX endpoint returning a page of simplified paragraphs.
+
+    Args:
+        request: HttpRequest object
+        contract_id: ID of the contract
+
+    Returns:
+        JsonResponse with the paragraphs and the offset of the next page
+    """
+    try:
+        offset = max(int(request.GET.get("offset", 0)), 0)
+        limit = min(max(int(request.GET.get("limit", PARAGRAPH_PAGE_SIZE)), 1), 100)
+    except ValueError:
+        return error_response("Invalid offset or limit", status=400)
+
+    contract = get_object_or_404(Contract, id=contract_id, user=request.user, archived=False)
+    contract_details = ContractDetails.objects.only("id").filter(contract=contract).first()
+    if not contract_details:
+        return error_response("Contract details not found", status=404)
+
+    paragraphs = contract_details.get_paragraphs(offset=offset, limit=limit)
+    next_offset = offset + limit if len(paragraphs) == limit else None
+    return JsonResponse({"paragraphs": paragraphs, "next_offset": next_offset})
 
 
 @login_required
@@ -182,10 +194,6 @@ def save_edited_contract(request, contract_id):
             contract_file.set_file_content(file_content)
             contract_file.save()
 
-            # Invalidate any cached versions of this contract
-            cache_key = f"contract_{contract_id}_{request.user.id}"
-            cache.delete(cache_key)
-
             return JsonResponse({"success": True})
         else:
             return error_response("Invalid data URL format", status=400)
@@ -217,8 +225,4 @@ def archive_contract(request, contract_id):
     contract.archived_date = timezone.now()
     contract.save()
 
-    # Invalidate any cached versions of this contract
-    cache_key = f"contract_{contract_id}_{request.user.id}"
-    cache.delete(cache_key)
-
     return JsonResponse({"success": True})
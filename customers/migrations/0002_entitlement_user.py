@@ -0,0 +1,50 @@
+# Generated by Django 5.1.9 on 2026-10-19 10:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_entitlement_user(apps, schema_editor):
+    Entitlement = apps.get_model("customers", "Entitlement")
+    Purchase = apps.get_model("customers", "Purchase")
+    Subscription = apps.get_model("customers", "Subscription")
+
+    Entitlement.objects.filter(purchase__isnull=False).update(
+        user_id=Subquery(Purchase.objects.filter(pk=OuterRef("purchase_id")).values("user_id")[:1])
+    )
+    Entitlement.objects.filter(subscription__isnull=False).update(
+        user_id=Subquery(
+            Subscription.objects.filter(pk=OuterRef("subscription_id")).values("user_id")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("customers", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="entitlement",
+            name="user",
+            field=models.ForeignKey(
+                blank=True,
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="entitlements",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.RunPython(backfill_entitlement_user, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="entitlement",
+            index=models.Index(
+                fields=["user", "capability", "end_date"], name="entitlement_lookup_idx"
+            ),
+        ),
+    ]
@@ -1,9 +1,28 @@
 import uuid
 
 from django.contrib.auth.models import AbstractUser
+from django.core.cache import cache
 from django.db import models
 from django.utils import timezone
 
+from klarmieten.cache import invalidate_page_cache
+
+# Upper bound for how long an entitlement snapshot is cached
+ENTITLEMENT_SNAPSHOT_TIMEOUT = 60 * 15
+
+# Plan capability templates only change through the admin, signals invalidate them
+PLAN_TEMPLATE_TIMEOUT = 60 * 60 * 24
+
+PRICING_MATRIX_CACHE_KEY = "pricing_matrix"
+
+# Which of several active entitlements of a capability applies: the one with the
+# most left, then the one lasting longest. get_snapshot() reports it and reserve()
+# charges it, so the value a user is shown is the one that gets consumed.
+ENTITLEMENT_PRIORITY = [
+    (models.F('value_int') - models.F('usage_count')).desc(nulls_last=True),
+    models.F('end_date').desc(),
+]
+
 
 class User(AbstractUser):
     """Enhanced user model with subscription-related fields"""
@@ -15,6 +34,10 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
 
+    def has(self, capability_code):
+        """Check if the user has an active entitlement for the given capability"""
+        return Entitlement.has(self, capability_code)
+
     def activate_student_status(self):
         """Activate student status for the user"""
         self.is_student = True
@@ -58,6 +81,91 @@ class Plan(models.Model):
     student_discount_percentage = models.PositiveIntegerField(default=0)
     is_active = models.BooleanField(default=True)
 
+    @staticmethod
+    def invalidate_pricing():
+        """Drop the cached pricing matrix and the cached pages rendered from it"""
+        cache.delete(PRICING_MATRIX_CACHE_KEY)
+        invalidate_page_cache()
+
+    @staticmethod
+    def get_pricing_matrix():
+        """
+        Get all active plans with the status of every capability, for the pricing page.
+
+        Built with three queries and cached until a plan or capability changes.
+        """
+        plan_list = cache.get(PRICING_MATRIX_CACHE_KEY)
+        if plan_list is not None:
+            return plan_list
+
+        plans = Plan.objects.filter(is_active=True).prefetch_related('capabilities')
+        capabilities = list(Capability.objects.all())
+
+        plan_list = []
+        for plan in plans:
+            # Uses the prefetched plan capabilities
+            plan_capabilities = {pc.capability_id: pc for pc in plan.capabilities.all()}
+
+            capability_list = []
+            for capability in capabilities:
+                plan_capability = plan_capabilities.get(capability.id)
+
+                display_value = None
+                if plan_capability and capability.value_type == 'INTEGER':
+                    display_value = plan_capability.value_int
+                elif plan_capability and capability.value_type == 'STRING':
+                    display_value = plan_capability.value_text
+
+                capability_list.append({
+                    'id': capability.id,
+                    'name': capability.name,
+                    'has_capability': bool(plan_capability),
+                    'display_value': display_value
+                })
+
+            plan_list.append({
+                'id': plan.id,
+                'name': plan.name,
+                'price': plan.price,
+                'description': plan.description,
+                'billing_type': plan.billing_type,
+                'capabilities': capability_list
+            })
+
+        cache.set(PRICING_MATRIX_CACHE_KEY, plan_list, PLAN_TEMPLATE_TIMEOUT)
+        return plan_list
+
+    @staticmethod
+    def capability_template_cache_key(plan_id):
+        return f"plan_capabilities_{plan_id}"
+
+    @staticmethod
+    def invalidate_capability_template(plan_id):
+        cache.delete(Plan.capability_template_cache_key(plan_id))
+
+    @staticmethod
+    def get_capability_template(plan_id):
+        """
+        Get the capability values granted by a plan as plain dicts.
+
+        Cached until a PlanCapability or Capability changes (see customers/signals.py).
+        """
+        cache_key = Plan.capability_template_cache_key(plan_id)
+        template = cache.get(cache_key)
+        if template is None:
+            template = [
+                {
+                    'capability_id': plan_capability.capability_id,
+                    'code': plan_capability.capability.code,
+                    'value_int': plan_capability.value_int,
+                    'value_bool': plan_capability.value_bool,
+                    'value_text': plan_capability.value_text,
+                }
+                for plan_capability in PlanCapability.objects.filter(plan_id=plan_id).select_related('capability')
+            ]
+            cache.set(cache_key, template, PLAN_TEMPLATE_TIMEOUT)
+        return template
+
 
 class Capability(models.Model):
     """System capabilities that can be granted to users"""
@@ -117,29 +225,20 @@ class Purchase(models.Model):
 
     def create_entitlements(self):
         """Create entitlements based on plan capabilities"""
-        storage_days = 0
+        template = Plan.get_capability_template(self.plan_id)
 
         # Get storage days to calculate expiration
-        storage_capability = self.plan.capabilities.filter(
-            capability__code='storage_days'
-        ).first()
-
-        if storage_capability:
-            storage_days = storage_capability.value_int or 0
+        storage_days = next(
+            (item['value_int'] or 0 for item in template if item['code'] == 'storage_days'), 0
+        )
 
-        expiry_date = timezone.now() + timezone.timedelta(days=storage_days)
+        start_date = timezone.now()
+        expiry_date = start_date + timezone.timedelta(days=storage_days)
 
         # Create entitlements for all capabilities in the plan
-        for plan_capability in self.plan.capabilities.all():
-            Entitlement.objects.create(
-                purchase=self,
-                capability=plan_capability.capability,
-                value_int=plan_capability.value_int,
-                value_bool=plan_capability.value_bool,
-                value_text=plan_capability.value_text,
-                start_date=timezone.now(),
-                end_date=expiry_date
-            )
+        Entitlement.create_from_template(
+            template, purchase=self, user_id=self.user_id, start_date=start_date, end_date=expiry_date
+        )
 
 
 class Subscription(models.Model):
@@ -172,16 +271,13 @@ class Subscription(models.Model):
         self.entitlements.all().delete()
 
         # Create new entitlements for all capabilities in the plan
-        for plan_capability in self.plan.capabilities.all():
-            Entitlement.objects.create(
-                subscription=self,
-                capability=plan_capability.capability,
-                value_int=plan_capability.value_int,
-                value_bool=plan_capability.value_bool,
-                value_text=plan_capability.value_text,
-                start_date=self.start_date,
-                end_date=self.end_date
-            )
+        Entitlement.create_from_template(
+            Plan.get_capability_template(self.plan_id),
+            subscription=self,
+            user_id=self.user_id,
+            start_date=self.start_date,
+            end_date=self.end_date
+        )
 
 
 class Entitlement(models.Model):
@@ -194,6 +290,10 @@ class Entitlement(models.Model):
                                      null=True, blank=True, related_name='entitlements')
     capability = models.ForeignKey(Capability, on_delete=models.CASCADE)
 
+    # Denormalized owner of the purchase or subscription, for single-index lookups
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True,
+                             related_name='entitlements', db_index=False)
+
     # Value fields matching the capability type
     value_int = models.IntegerField(null=True, blank=True)
     value_bool = models.BooleanField(default=False)
@@ -216,11 +316,42 @@ class Entitlement(models.Model):
                 name='one_source_per_entitlement'
             )
         ]
+        indexes = [
+            models.Index(fields=['user', 'capability', 'end_date'], name='entitlement_lookup_idx'),
+        ]
 
     def __str__(self):
-        source = self.purchase or self.subscription
-        user = source.user if source else "Unknown"
-        return f"{user} - {self.capability.code}"
+        return f"{self.user or 'Unknown'} - {self.capability.code}"
+
+    def save(self, *args, **kwargs):
+        if self.user_id is None:
+            # Keep the denormalized user in sync with the source
+            source = self.purchase or self.subscription
+            if source:
+                self.user_id = source.user_id
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def create_from_template(template, user_id, **source):
+        """
+        Create one entitlement per plan capability template entry with a single INSERT.
+
+        bulk_create skips save() and post_save, so the user is passed in explicitly
+        and the snapshot is invalidated here.
+        """
+        entitlements = Entitlement.objects.bulk_create([
+            Entitlement(
+                capability_id=item['capability_id'],
+                user_id=user_id,
+                value_int=item['value_int'],
+                value_bool=item['value_bool'],
+                value_text=item['value_text'],
+                **source
+            )
+            for item in template
+        ])
+        Entitlement.invalidate_snapshot(user_id)
+        return entitlements
 
     @property
     def value(self):
@@ -242,36 +373,121 @@ class Entitlement(models.Model):
         return self.start_date <= now < self.end_date
 
     def use(self, count=1):
-        """Use this entitlement (for consumable capabilities)"""
-        if self.capability.value_type == 'INTEGER':
+        """
+        Use this entitlement (for consumable capabilities).
+
+        The usage is incremented in a single conditional UPDATE, so concurrent
+        requests can neither lose increments nor exceed the granted amount.
+
+        Returns:
+            bool: False if not enough of the entitlement was left
+        """
+        if self.capability.value_type != 'INTEGER':
+            return True
+
+        updated = Entitlement.objects.filter(
+            pk=self.pk,
+            usage_count__lte=models.F('value_int') - count
+        ).update(usage_count=models.F('usage_count') + count)
+
+        if updated:
             self.usage_count += count
-            self.save()
-            return self.value >= 0
-        return True
+            Entitlement.invalidate_snapshot(self.user_id)
+        return bool(updated)
+
+    def refund(self, count=1):
+        """Give back usage reserved for an operation that failed"""
+        if self.capability.value_type != 'INTEGER':
+            return True
+
+        updated = Entitlement.objects.filter(
+            pk=self.pk,
+            usage_count__gte=count
+        ).update(usage_count=models.F('usage_count') - count)
+
+        if updated:
+            self.usage_count -= count
+            Entitlement.invalidate_snapshot(self.user_id)
+        return bool(updated)
 
     @staticmethod
-    def has(user, capability_code):
-        """Check if user has an active entitlement for the given capability"""
+    def reserve(user, capability_code, count=1):
+        """
+        Consume a consumable capability of the user, from the entitlement get() reports.
+
+        Returns:
+            Entitlement: the entitlement that was charged (pass it to refund() on failure),
+            or None if the user has none left
+        """
         now = timezone.now()
-        entitlement = Entitlement.objects.filter(
-            models.Q(purchase__user=user) | models.Q(subscription__user=user),
+        candidates = Entitlement.objects.filter(
+            user=user,
             capability__code=capability_code,
             start_date__lte=now,
-            end_date__gt=now
-        ).exists()
-        return entitlement.is_valid
+            end_date__gt=now,
+            usage_count__lte=models.F('value_int') - count
+        ).select_related('capability').order_by(*ENTITLEMENT_PRIORITY)
+
+        for entitlement in candidates:
+            # Another request may have used it up since the SELECT, so try the next one
+            if entitlement.use(count):
+                return entitlement
+        return None
+
+    @staticmethod
+    def has(user, capability_code):
+        """Check if user has an active entitlement for the given capability"""
+        return bool(Entitlement.get_snapshot(user).get(capability_code))
 
     @staticmethod
     def get(user, capability_code):
         """Get the value of an entitlement for a specific capability"""
+        return Entitlement.get_snapshot(user).get(capability_code)
+
+    @staticmethod
+    def snapshot_cache_key(user_id):
+        return f"entitlements_{user_id}"
+
+    @staticmethod
+    def invalidate_snapshot(user_id):
+        """Drop the cached entitlement snapshot of a user"""
+        if user_id is not None:
+            cache.delete(Entitlement.snapshot_cache_key(user_id))
+
+    @staticmethod
+    def get_snapshot(user):
+        """
+        Get the values of all active entitlements of a user, keyed by capability code.
+
+        The snapshot is resolved in one query and cached until the next entitlement
+        starts or ends. Changes to purchases, subscriptions and entitlements
+        invalidate it through signals (see customers/signals.py).
+        """
+        if user is None or user.pk is None:
+            return {}
+
+        cache_key = Entitlement.snapshot_cache_key(user.pk)
+        snapshot = cache.get(cache_key)
+        if snapshot is not None:
+            return snapshot
+
         now = timezone.now()
-        entitlement = Entitlement.objects.filter(
-            models.Q(purchase__user=user) | models.Q(subscription__user=user),
-            capability__code=capability_code,
-            start_date__lte=now,
+        entitlements = Entitlement.objects.filter(
+            user=user,
             end_date__gt=now
-        ).order_by('-value_int', '-end_date').first()
-
-        if entitlement and entitlement.is_valid:
-            return entitlement.value
-        return None
+        ).select_related('capability').order_by(*ENTITLEMENT_PRIORITY)
+
+        snapshot = {}
+        next_change = now + timezone.timedelta(seconds=ENTITLEMENT_SNAPSHOT_TIMEOUT)
+        for entitlement in entitlements:
+            if entitlement.start_date > now:
+                # Not active yet, but the snapshot must expire when it starts
+                next_change = min(next_change, entitlement.start_date)
+                continue
+            next_change = min(next_change, entitlement.end_date)
+            # The first entitlement per capability wins, see ENTITLEMENT_PRIORITY
+            snapshot.setdefault(entitlement.capability.code, entitlement.value)
+
+        timeout = max(1, int((next_change - now).total_seconds()))
+        cache.set(cache_key, snapshot, timeout)
+        return snapshot
@@ -0,0 +1,49 @@
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Capability, Entitlement, Plan, PlanCapability, Purchase, Subscription
+
+
+@receiver([post_save, post_delete], sender=Purchase)
+@receiver([post_save, post_delete], sender=Subscription)
+def invalidate_source_entitlements(sender, instance, **kwargs):
+    """Drop the entitlement snapshot when a purchase or subscription changes"""
+    Entitlement.invalidate_snapshot(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=Entitlement)
+def invalidate_entitlement(sender, instance, **kwargs):
+    """Drop the entitlement snapshot of the user owning the entitlement"""
+    if instance.user_id is not None:
+        Entitlement.invalidate_snapshot(instance.user_id)
+        return
+
+    try:
+        source = instance.purchase or instance.subscription
+    except ObjectDoesNotExist:
+        # Source was deleted in the same cascade, its own signal invalidates
+        return
+    if source:
+        Entitlement.invalidate_snapshot(source.user_id)
+
+
+@receiver([post_save, post_delete], sender=Plan)
+def invalidate_plan(sender, instance, **kwargs):
+    """Drop the pricing matrix when a plan changes"""
+    Plan.invalidate_pricing()
+
+
+@receiver([post_save, post_delete], sender=PlanCapability)
+def invalidate_plan_capability(sender, instance, **kwargs):
+    """Drop the cached capability template of the plan and the pricing matrix"""
+    Plan.invalidate_capability_template(instance.plan_id)
+    Plan.invalidate_pricing()
+
+
+@receiver([post_save, post_delete], sender=Capability)
+def invalidate_capability(sender, instance, **kwargs):
+    """Drop the capability templates of all plans granting the capability and the pricing matrix"""
+    for plan_id in PlanCapability.objects.filter(capability=instance).values_list('plan_id', flat=True):
+        Plan.invalidate_capability_template(plan_id)
+    Plan.invalidate_pricing()
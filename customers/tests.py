@@ -0,0 +1,214 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from customers.models import Capability, Entitlement, Plan, PlanCapability, Product, Purchase, User
+
+# The database cache would add its queries to the ones counted here
+local_cache = override_settings(CACHES={
+    "default": {"BACKEND": "klarmieten.cache.LocMemCache", "LOCATION": "customers-tests"},
+})
+
+
+def create_purchase(user, analyses=3, days=30, start_date=None):
+    """Purchase of a plan granting a number of analyses, with its entitlement"""
+    product, _ = Product.objects.get_or_create(code="analysis", defaults={"name": "Analyse", "type": "ANALYSIS"})
+    plan, _ = Plan.objects.get_or_create(
+        code="basic", defaults={"name": "Basic", "product": product, "price": Decimal("9.99"), "billing_type": "ONE_TIME"}
+    )
+    capability, _ = Capability.objects.get_or_create(
+        code="analyses", defaults={"name": "Analysen", "value_type": "INTEGER"}
+    )
+    purchase = Purchase.objects.create(user=user, plan=plan, price_paid=plan.price)
+    start_date = start_date or timezone.now()
+    Entitlement.objects.create(
+        purchase=purchase,
+        capability=capability,
+        value_int=analyses,
+        start_date=start_date,
+        end_date=start_date + timezone.timedelta(days=days),
+    )
+    return purchase
+
+
+@local_cache
+class EntitlementSnapshotTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user("tenant")
+        self.purchase = create_purchase(self.user)
+
+    def test_snapshot_is_cached(self):
+        self.assertEqual(Entitlement.get(self.user, "analyses"), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(Entitlement.get(self.user, "analyses"), 3)
+            self.assertTrue(self.user.has("analyses"))
+            self.assertFalse(self.user.has("chat"))
+
+    def test_entitlement_change_invalidates(self):
+        self.assertEqual(Entitlement.get(self.user, "analyses"), 3)
+        entitlement = self.purchase.entitlements.get()
+        entitlement.usage_count = 1
+        entitlement.save()
+        self.assertEqual(Entitlement.get(self.user, "analyses"), 2)
+
+    def test_purchase_changes_invalidate(self):
+        self.assertEqual(Entitlement.get(self.user, "analyses"), 3)
+        create_purchase(self.user, analyses=10)
+        self.assertEqual(Entitlement.get(self.user, "analyses"), 10)
+
+        Purchase.objects.filter(user=self.user).delete()
+        self.assertIsNone(Entitlement.get(self.user, "analyses"))
+
+    def test_snapshot_expires_when_next_entitlement_starts(self):
+        create_purchase(self.user, analyses=10, start_date=timezone.now() + timezone.timedelta(minutes=5))
+        with mock.patch("customers.models.cache.set") as cache_set:
+            self.assertEqual(Entitlement.get(self.user, "analyses"), 3)
+        timeout = cache_set.call_args.args[2]
+        self.assertLessEqual(timeout, 5 * 60)
+
+
+@local_cache
+class EntitlementUserTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user("tenant")
+
+    def test_user_copied_from_source(self):
+        entitlement = create_purchase(self.user).entitlements.get()
+        self.assertEqual(entitlement.user, self.user)
+
+    def test_lookup_does_not_join_sources(self):
+        create_purchase(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            Entitlement.get_snapshot(self.user)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("customers_purchase", queries[0]["sql"])
+        self.assertNotIn("customers_subscription", queries[0]["sql"])
+
+
+@local_cache
+class EntitlementConsumptionTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user("tenant")
+        self.entitlement = create_purchase(self.user, analyses=1).entitlements.get()
+
+    def test_use_exhausted_quota(self):
+        self.assertTrue(self.entitlement.use())
+        self.assertFalse(self.entitlement.use())
+        self.entitlement.refresh_from_db()
+        self.assertEqual(self.entitlement.usage_count, 1)
+
+    def test_use_from_stale_instances(self):
+        stale = Entitlement.objects.get(pk=self.entitlement.pk)
+        self.assertTrue(self.entitlement.use())
+        # The stale copy still sees the unit, the database does not
+        self.assertFalse(stale.use())
+
+    def test_two_reservations_against_one_unit(self):
+        self.assertEqual(Entitlement.reserve(self.user, "analyses"), self.entitlement)
+        self.assertIsNone(Entitlement.reserve(self.user, "analyses"))
+        self.assertEqual(Entitlement.get(self.user, "analyses"), 0)
+
+    def test_reserve_charges_the_reported_entitlement(self):
+        # Lasts longer, but has less left than the one get() reports
+        create_purchase(self.user, analyses=1, days=90)
+        larger = create_purchase(self.user, analyses=5).entitlements.get()
+        self.assertEqual(Entitlement.get(self.user, "analyses"), 5)
+
+        self.assertEqual(Entitlement.reserve(self.user, "analyses"), larger)
+        self.assertEqual(Entitlement.get(self.user, "analyses"), 4)
+
+    def test_refund_after_failure(self):
+        reservation = Entitlement.reserve(self.user, "analyses")
+        self.assertEqual(Entitlement.get(self.user, "analyses"), 0)
+
+        self.assertTrue(reservation.refund())
+        self.assertEqual(Entitlement.get(self.user, "analyses"), 1)
+        # Nothing left to give back
+        self.assertFalse(reservation.refund())
+        self.assertIsNotNone(Entitlement.reserve(self.user, "analyses"))
+
+
+@local_cache
+class PlanTemplateTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user("tenant")
+        product = Product.objects.create(code="analysis", name="Analyse", type="ANALYSIS")
+        self.plan = Plan.objects.create(
+            code="basic", name="Basic", product=product, price=Decimal("9.99"), billing_type="ONE_TIME"
+        )
+        analyses = Capability.objects.create(code="analyses", name="Analysen", value_type="INTEGER")
+        storage = Capability.objects.create(code="storage_days", name="Speicherdauer", value_type="INTEGER")
+        self.analyses = PlanCapability.objects.create(plan=self.plan, capability=analyses, value_int=3)
+        PlanCapability.objects.create(plan=self.plan, capability=storage, value_int=30)
+
+    def test_entitlements_created_with_one_insert(self):
+        Plan.get_capability_template(self.plan.pk)
+        purchase = Purchase.objects.create(user=self.user, plan=self.plan, price_paid=self.plan.price)
+
+        with self.assertNumQueries(1):
+            purchase.create_entitlements()
+
+        entitlements = {entitlement.capability.code: entitlement for entitlement in purchase.entitlements.all()}
+        self.assertEqual(entitlements["analyses"].value_int, 3)
+        self.assertEqual(entitlements["analyses"].user, self.user)
+        self.assertEqual(
+            entitlements["analyses"].end_date - entitlements["analyses"].start_date, timezone.timedelta(days=30)
+        )
+        self.assertEqual(Entitlement.get(self.user, "analyses"), 3)
+
+    def values(self):
+        return {item["code"]: item["value_int"] for item in Plan.get_capability_template(self.plan.pk)}
+
+    def test_template_invalidated_on_change(self):
+        self.assertEqual(self.values()["analyses"], 3)
+        self.analyses.value_int = 5
+        self.analyses.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.values()["analyses"], 5)
+
+
+# The manifest only exists after collectstatic
+@override_settings(STORAGES={
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+})
+@local_cache
+class PricingTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        product = Product.objects.create(code="analysis", name="Analyse", type="ANALYSIS")
+        self.plan = Plan.objects.create(
+            code="basic", name="Basic", product=product, price=Decimal("9.99"), billing_type="ONE_TIME"
+        )
+        analyses = Capability.objects.create(code="analyses", name="Analysen", value_type="INTEGER")
+        Capability.objects.create(code="chat", name="Chat", value_type="BOOLEAN")
+        PlanCapability.objects.create(plan=self.plan, capability=analyses, value_int=3)
+
+    def test_matrix(self):
+        matrix = Plan.get_pricing_matrix()
+        capabilities = {capability["name"]: capability for capability in matrix[0]["capabilities"]}
+        self.assertEqual(capabilities["Analysen"]["display_value"], 3)
+        self.assertFalse(capabilities["Chat"]["has_capability"])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(Plan.get_pricing_matrix(), matrix)
+
+    def test_page_cached_until_plan_changes(self):
+        self.client.get(reverse("pricing"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("pricing"))
+        self.assertContains(response, "Basic")
+
+        self.plan.name = "Basis"
+        self.plan.save()
+        self.assertContains(self.client.get(reverse("pricing")), "Basis")
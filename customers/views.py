@@ -3,11 +3,12 @@ import logging
 from django.contrib.auth import login, authenticate
 from django.shortcuts import render, redirect
 from django.urls import reverse_lazy
+from django.views.decorators.csrf import ensure_csrf_cookie
 from django.views.generic import CreateView
 
 from klarmieten.faq import FAQ_pricing
 from .forms import LoginForm, RegisterForm
-from .models import Plan, Capability
+from .models import Plan
 
 logger = logging.getLogger(__name__)
 
@@ -35,65 +36,23 @@ class SignUpView(CreateView):
 
 # Create your views here.
 
+@ensure_csrf_cookie
 def pricing(request):
     """
     Pricing page view for non-authenticated users.
 
+    The plan matrix is cached. The page contains no CSRF token, so for
+    anonymous visitors it is served by the page cache middleware.
+
     Args:
         request: HttpRequest object
 
     Returns:
         Rendered pricing page
     """
-
-    plans = Plan.objects.filter(is_active=True).prefetch_related('capabilities__capability')
-    capabilities = Capability.objects.all()
-
-    # Create a list of plans for the template
-    plan_list = []
-    for plan in plans:
-        plan_list.append({
-            'id': plan.id,
-            'name': plan.name,
-            'price': plan.price,
-            'description': plan.description,
-            'billing_type': plan.billing_type,
-            'capabilities': []
-        })
-
-    # For each plan, add all capabilities with their status
-    for plan_data in plan_list:
-        plan = Plan.objects.get(id=plan_data['id'])
-
-        # Get all plan capabilities
-        plan_capabilities = {
-            pc.capability_id: pc
-            for pc in plan.capabilities.all()
-        }
-
-        # Add all capabilities with their status for this plan
-        for capability in capabilities:
-            plan_capability = plan_capabilities.get(capability.id)
-
-            capability_info = {
-                'id': capability.id,
-                'name': capability.name,
-                'has_capability': bool(plan_capability),
-                'display_value': None
-            }
-
-            # Add value if needed
-            if plan_capability and capability.value_type != 'BOOLEAN':
-                if capability.value_type == 'INTEGER':
-                    capability_info['display_value'] = plan_capability.value_int
-                else:  # STRING
-                    capability_info['display_value'] = plan_capability.value_text
-
-            plan_data['capabilities'].append(capability_info)
-
     context = {
         "faq": FAQ_pricing,
-        'plans': plan_list
+        'plans': Plan.get_pricing_matrix()
     }
 
     return render(request, "pricing.html", context)
@@ -0,0 +1,50 @@
+from django.contrib import admin
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from klarmieten.models import RequestProfile
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ["created_at", "method", "path", "view_name", "status", "duration_ms", "sql_count", "sql_ms",
+                    "reason", "download_link"]
+    list_filter = ["view_name", "reason", "mode"]
+    search_fields = ["path"]
+    exclude = ["profile"]
+    readonly_fields = ["created_at", "method", "path", "view_name", "status", "reason", "duration_ms", "sql_count",
+                       "sql_ms", "slowest_queries", "mode", "download_link"]
+
+    def get_queryset(self, request):
+        # The profiles can be megabytes, only the download needs them
+        return super().get_queryset(request).defer("profile")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path(
+                "<int:profile_id>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="klarmieten_requestprofile_download",
+            ),
+        ] + super().get_urls()
+
+    @admin.display(description="Profile")
+    def download_link(self, obj):
+        url = reverse("admin:klarmieten_requestprofile_download", args=[obj.pk])
+        return format_html('<a href="{}">Download</a>', url)
+
+    def download_view(self, request, profile_id):
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        profile = get_object_or_404(RequestProfile, pk=profile_id)
+        response = HttpResponse(bytes(profile.profile), content_type="application/octet-stream")
+        response["Content-Disposition"] = f'attachment; filename="{profile.file_name}"'
+        return response
@@ -0,0 +1,116 @@
+"""
+Cache backends shared by all worker processes, with hit and miss counters.
+
+The backend is chosen in settings.CACHES from the environment. All of them
+count hits and misses of the process, see get_cache_stats().
+"""
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.core.cache.backends.db import DatabaseCache as BaseDatabaseCache
+from django.core.cache.backends.filebased import FileBasedCache as BaseFileBasedCache
+from django.core.cache.backends.locmem import LocMemCache as BaseLocMemCache
+from django.core.cache.backends.redis import RedisCache as BaseRedisCache
+
+from klarmieten.metrics import count_cache_lookup
+
+_MISSING = object()
+
+PAGE_CACHE_GENERATION_KEY = "page_cache_generation"
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(hits, misses):
+    with _stats_lock:
+        _stats["hits"] += hits
+        _stats["misses"] += misses
+    count_cache_lookup("django", hit=True, count=hits)
+    count_cache_lookup("django", hit=False, count=misses)
+
+
+def get_cache_stats():
+    """
+    Get the cache hits and misses counted by this process.
+
+    Returns:
+        Dict with hits, misses and the hit ratio
+    """
+    with _stats_lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    lookups = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / lookups if lookups else None,
+    }
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def invalidate_page_cache():
+    """Drop all pages cached by klarmieten.middleware.PageCacheMiddleware by starting a new cache generation"""
+    cache.set(PAGE_CACHE_GENERATION_KEY, time.time_ns(), None)
+
+
+class CacheMetricsMixin:
+    """
+    Counts hits and misses of get() and get_many().
+
+    Backends implement get() through get_many() or the other way round, so
+    only the outermost call of a thread is counted.
+    """
+
+    _local = threading.local()
+
+    def get(self, key, default=None, version=None):
+        if getattr(self._local, "counting", False):
+            return super().get(key, default, version=version)
+
+        self._local.counting = True
+        try:
+            value = super().get(key, _MISSING, version=version)
+        finally:
+            self._local.counting = False
+
+        if value is _MISSING:
+            _count(0, 1)
+            return default
+        _count(1, 0)
+        return value
+
+    def get_many(self, keys, version=None):
+        if getattr(self._local, "counting", False):
+            return super().get_many(keys, version=version)
+
+        keys = list(keys)
+        self._local.counting = True
+        try:
+            values = super().get_many(keys, version=version)
+        finally:
+            self._local.counting = False
+
+        _count(len(values), len(keys) - len(values))
+        return values
+
+
+class DatabaseCache(CacheMetricsMixin, BaseDatabaseCache):
+    """Shared through the database, needs `manage.py createcachetable`"""
+
+
+class FileBasedCache(CacheMetricsMixin, BaseFileBasedCache):
+    """Shared by the processes of a single host"""
+
+
+class RedisCache(CacheMetricsMixin, BaseRedisCache):
+    """Shared by all hosts, needs the redis package"""
+
+
+class LocMemCache(CacheMetricsMixin, BaseLocMemCache):
+    """Per process, only for development and tests"""
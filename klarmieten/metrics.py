@@ -0,0 +1,343 @@
+"""
+Operational metrics in the Prometheus text format, served at /metrics.
+
+Counters and histograms live in memory. Gunicorn runs several worker
+processes, so with METRICS_DIR set every process also writes its values
+to a JSON file there, at most once per METRICS_FLUSH_INTERVAL, and the
+/metrics view adds up the files of all processes. Files of stopped
+workers are kept so counters never go backwards; clear the directory when
+the server starts. Gauges are computed when scraped instead.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTE_BUCKETS = (0, 1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024)
+
+_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric(ABC):
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        registry.register(self)
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def merge(self, target: Dict, values: Dict):
+        """Add the values of one process to the merged values in target"""
+
+    @abstractmethod
+    def samples(self, values: Dict) -> Iterable[str]:
+        """Lines of the exposition format for merged values"""
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        registry.check_fork()
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        registry.changed()
+
+    def merge(self, target, values):
+        for key, value in values.items():
+            target[key] = target.get(key, 0) + value
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        registry.check_fork()
+        with _lock:
+            # Per bucket counts, then the +Inf bucket, the sum and the count
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * (len(self.buckets) + 3)
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+        registry.changed()
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def merge(self, target, values):
+        for key, state in values.items():
+            if key in target:
+                target[key] = [a + b for a, b in zip(target[key], state)]
+            else:
+                target[key] = list(state)
+
+    def samples(self, values):
+        for key, state in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(state[-2])}"
+            yield f"{self.name}_count{labels} {state[-1]}"
+
+
+class Gauge(Metric):
+    """Computed by a function when scraped, in the process serving /metrics"""
+
+    type = "gauge"
+
+    def __init__(self, name, documentation, function: Callable[[], float], labelnames=()):
+        """
+        Args:
+            function: Returns the value, or with labels a dict by label value tuple
+        """
+        self.function = function
+        super().__init__(name, documentation, labelnames)
+
+    def collect(self) -> Dict:
+        try:
+            result = self.function()
+        except Exception as e:
+            logger.error(f"Error collecting metric {self.name}: {e}")
+            return {}
+        return result if isinstance(result, dict) else {(): result}
+
+    def merge(self, target, values):
+        pass
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self._pid = os.getpid()
+        self._file_name = None
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+
+    def register(self, metric: Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def check_fork(self):
+        # A forked worker starts from its parent's values, which the parent reports itself
+        if os.getpid() != self._pid:
+            with _lock:
+                for metric in self.metrics.values():
+                    metric.values.clear()
+            self._pid = os.getpid()
+            self._file_name = None
+            self._last_flush = 0.0
+
+    def snapshot(self) -> Dict[str, Dict]:
+        self.check_fork()
+        with _lock:
+            return {
+                name: {json.dumps(key): value for key, value in metric.values.items()}
+                for name, metric in self.metrics.items()
+                if not isinstance(metric, Gauge)
+            }
+
+    def changed(self):
+        if settings.METRICS_DIR and time.monotonic() - self._last_flush >= settings.METRICS_FLUSH_INTERVAL:
+            # Another thread flushing already writes these values too
+            if self._flush_lock.acquire(blocking=False):
+                try:
+                    self._write()
+                finally:
+                    self._flush_lock.release()
+
+    def flush(self):
+        """Write this process's values to METRICS_DIR"""
+        if settings.METRICS_DIR:
+            with self._flush_lock:
+                self._write()
+
+    def _write(self):
+        snapshot = self.snapshot()
+        self._last_flush = time.monotonic()
+        if self._file_name is None:
+            # The pid alone could be reused by a later worker and overwrite its file
+            self._file_name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+
+        directory = Path(settings.METRICS_DIR)
+        try:
+            directory.mkdir(parents=True, exist_ok=True)
+            temp_path = directory / f".{self._file_name}.tmp"
+            temp_path.write_text(json.dumps(snapshot))
+            os.replace(temp_path, directory / self._file_name)
+        except OSError as e:
+            logger.error(f"Error writing metrics to {directory}: {e}")
+
+    def collect(self) -> Dict[str, Dict]:
+        """Values of all processes, with this process's current ones"""
+        own = self.snapshot()
+        snapshots = [own]
+        if settings.METRICS_DIR:
+            self.flush()
+            for path in Path(settings.METRICS_DIR).glob("*.json"):
+                if path.name == self._file_name:
+                    continue
+                try:
+                    snapshots.append(json.loads(path.read_text()))
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping unreadable metrics file {path}: {e}")
+
+        merged = {}
+        for name, metric in self.metrics.items():
+            values = {}
+            if isinstance(metric, Gauge):
+                values = metric.collect()
+            else:
+                for snapshot in snapshots:
+                    metric.merge(values, {tuple(json.loads(key)): value for key, value in snapshot.get(name, {}).items()})
+            merged[name] = values
+        return merged
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        collected = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            lines.extend(metric.samples(collected[name]))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+
+# Decrypted bytes of the current request, a list so that threads and tasks started by it add to the same total
+_decrypted_bytes: ContextVar = ContextVar("decrypted_bytes", default=None)
+
+
+@contextmanager
+def count_decrypted_bytes():
+    """Tally the bytes decrypted within this block, see record_decrypted_bytes()"""
+    tally = [0]
+    token = _decrypted_bytes.set(tally)
+    try:
+        yield tally
+    finally:
+        _decrypted_bytes.reset(token)
+
+
+def record_decrypted_bytes(size: int):
+    DECRYPTED_BYTES.inc(size)
+    tally = _decrypted_bytes.get()
+    if tally is not None:
+        tally[0] += size
+
+
+def _analysis_queue_depth():
+    from contract_analysis.models.contract import Contract
+
+    return Contract.objects.filter(status="processing").count()
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling a request, by view",
+    ("view", "method", "status"),
+)
+REQUEST_DECRYPTED_BYTES = Histogram(
+    "http_request_decrypted_bytes",
+    "Bytes of encrypted fields and files decrypted while handling a request, by view",
+    ("view",),
+    buckets=BYTE_BUCKETS,
+)
+DECRYPTED_BYTES = Counter(
+    "decrypted_bytes_total",
+    "Bytes of encrypted fields and files decrypted",
+)
+STAGE_LATENCY = Histogram(
+    "analysis_stage_duration_seconds",
+    "Duration of analysis pipeline stages and provider calls",
+    ("stage",),
+    buckets=STAGE_BUCKETS,
+)
+PROVIDER_REQUESTS = Counter(
+    "provider_requests_total",
+    "Calls to external providers by outcome: ok, error or rate_limited (HTTP 429)",
+    ("provider", "outcome"),
+)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "Cache lookups by cache and result (hit or miss)",
+    ("cache", "result"),
+)
+ANALYSIS_QUEUE_DEPTH = Gauge(
+    "analysis_queue_depth",
+    "Contracts currently being analyzed",
+    _analysis_queue_depth,
+)
+
+
+def count_cache_lookup(cache_name: str, hit: bool, count: int = 1):
+    if count:
+        CACHE_LOOKUPS.inc(count, cache=cache_name, result="hit" if hit else "miss")
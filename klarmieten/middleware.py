@@ -0,0 +1,194 @@
+import gzip
+import hashlib
+import random
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.utils.translation import get_language
+
+from klarmieten.cache import PAGE_CACHE_GENERATION_KEY
+from klarmieten.metrics import REQUEST_DECRYPTED_BYTES, REQUEST_LATENCY, count_decrypted_bytes
+
+_ACCEPTS_GZIP = re.compile(r"\bgzip\b")
+# A rendered {% csrf_token %} would hand one visitor's token to everybody
+_CSRF_TOKEN_IN_BODY = re.compile(rb'name="csrfmiddlewaretoken" value="[^"]+"')
+# Headers of the view's response that the entry itself sets on hits
+_ENTRY_HEADERS = {"content-type", "content-length", "content-encoding", "etag", "last-modified", "vary"}
+
+
+def page_cache_key(request):
+    """
+    Cache key of a page for anonymous visitors.
+
+    Keyed on the deployed version, the cache generation, the language and
+    the path, so a deploy or a plan change never serves stale pages. The
+    query string is left out, the cached pages do not read it and it would
+    let anybody fill the cache with copies of a page.
+    """
+    generation = cache.get_or_set(PAGE_CACHE_GENERATION_KEY, 0, None)
+    return f"page:{settings.APP_VERSION}:{generation}:{get_language()}:{request.path}"
+
+
+class PageCacheMiddleware:
+    """
+    Serve the marketing pages to anonymous visitors from the cache.
+
+    Only views listed in PAGE_CACHE_URL_NAMES are cached. Bodies are stored
+    gzip compressed together with an ETag and Last-Modified, so repeat
+    visits are answered with a 304 without rendering anything.
+
+    Must come after the authentication and CSRF middleware: cached pages
+    contain no CSRF token, so get_token() is called to set the CSRF cookie
+    the page's forms read instead.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.url_names = set(settings.PAGE_CACHE_URL_NAMES)
+        self.timeout = settings.PAGE_CACHE_TIMEOUT
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        key = getattr(request, "_page_cache_key", None)
+        # Hits were answered from the cache, storing them again would only reset Last-Modified
+        if key is None or getattr(request, "_page_cache_hit", False) or not self._is_cacheable_response(response):
+            return response
+
+        entry = self._store(key, response)
+        return self._respond(request, entry, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self._is_cacheable_request(request):
+            return None
+
+        # Cached pages read the token from the cookie, make sure it is set
+        get_token(request)
+
+        key = page_cache_key(request)
+        request._page_cache_key = key
+
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        request._page_cache_hit = True
+        return self._respond(request, entry)
+
+    def _is_cacheable_request(self, request):
+        return (
+            request.method in ("GET", "HEAD")
+            and request.resolver_match.url_name in self.url_names
+            and not request.user.is_authenticated
+        )
+
+    @staticmethod
+    def _is_cacheable_response(response):
+        return (
+            response.status_code == 200
+            and not response.streaming
+            and not response.has_header("Content-Encoding")
+            and not _CSRF_TOKEN_IN_BODY.search(response.content)
+        )
+
+    def _store(self, key, response):
+        entry = {
+            "body": gzip.compress(response.content),
+            "content_type": response["Content-Type"],
+            "etag": f'"{hashlib.md5(response.content).hexdigest()}"',
+            "last_modified": time.time(),
+            # Like Cache-Control or Content-Language, so hits carry them as well
+            "headers": {name: value for name, value in response.items() if name.lower() not in _ENTRY_HEADERS},
+        }
+        cache.set(key, entry, self.timeout)
+        return entry
+
+    @staticmethod
+    def _respond(request, entry, response=None):
+        """
+        Build the response for a cached entry, or a 304 if the client's copy is current.
+
+        Args:
+            request: HttpRequest object
+            entry: Cached page entry
+            response: Freshly rendered response on a cache miss
+
+        Returns:
+            HttpResponse for the entry
+        """
+        accepts_gzip = _ACCEPTS_GZIP.search(request.headers.get("Accept-Encoding", ""))
+        if response is None:
+            body = entry["body"] if accepts_gzip else gzip.decompress(entry["body"])
+            response = HttpResponse(body, content_type=entry["content_type"])
+            for name, value in entry.get("headers", {}).items():
+                response[name] = value
+        elif accepts_gzip:
+            # Replaced in place, so the view's headers and cookies are kept
+            response.content = entry["body"]
+            response.headers.pop("Content-Length", None)
+        if accepts_gzip:
+            response["Content-Encoding"] = "gzip"
+
+        response["ETag"] = entry["etag"]
+        response["Last-Modified"] = http_date(entry["last_modified"])
+        patch_vary_headers(response, ("Accept-Encoding", "Cookie"))
+
+        return get_conditional_response(
+            request,
+            etag=entry["etag"],
+            last_modified=int(entry["last_modified"]),
+            response=response,
+        )
+
+
+class MetricsMiddleware:
+    """Record the latency and the decrypted bytes of every request by view, see klarmieten.metrics"""
+
+    # Any other method is counted as "other", so clients cannot add labels
+    METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with count_decrypted_bytes() as decrypted:
+            response = self.get_response(request)
+
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unmatched"
+        method = request.method if request.method in self.METHODS else "other"
+        REQUEST_LATENCY.observe(time.perf_counter() - start, view=view, method=method, status=response.status_code)
+        REQUEST_DECRYPTED_BYTES.observe(decrypted[0], view=view)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile a sample of requests, and requests of staff users sending the X-Profile header.
+
+    Only loaded with PROFILING_ENABLED, so it costs nothing otherwise. The
+    profiles are stored as RequestProfile for download from the admin, see
+    klarmieten.profiling.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        from klarmieten.profiling import profile_request
+
+        self.get_response = get_response
+        self.profile_request = profile_request
+
+    def __call__(self, request):
+        if request.headers.get("X-Profile") and request.user.is_staff:
+            return self.profile_request(request, self.get_response, "header")
+        if random.random() < settings.PROFILING_SAMPLE_RATE:
+            return self.profile_request(request, self.get_response, "sampled")
+        return self.get_response(request)
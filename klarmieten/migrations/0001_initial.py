@@ -0,0 +1,68 @@
+# Generated by Django 5.1.9 on 2026-10-19 11:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="RequestProfile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, db_index=True),
+                ),
+                ("method", models.CharField(max_length=10)),
+                ("path", models.CharField(max_length=255)),
+                (
+                    "view_name",
+                    models.CharField(blank=True, default="", max_length=255),
+                ),
+                ("status", models.PositiveSmallIntegerField()),
+                (
+                    "reason",
+                    models.CharField(
+                        choices=[
+                            ("sampled", "Sampled"),
+                            ("header", "Requested by header"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("duration_ms", models.FloatField()),
+                ("sql_count", models.PositiveIntegerField()),
+                ("sql_ms", models.FloatField()),
+                ("slowest_queries", models.JSONField(blank=True, default=list)),
+                (
+                    "mode",
+                    models.CharField(
+                        choices=[
+                            ("cprofile", "cProfile"),
+                            ("sampling", "Stack sampling"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("profile", models.BinaryField()),
+            ],
+            options={
+                "verbose_name": "Request Profile",
+                "verbose_name_plural": "Request Profiles",
+                "ordering": ["-created_at"],
+            },
+        ),
+    ]
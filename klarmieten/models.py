@@ -0,0 +1,45 @@
+from django.db import models
+
+
+class RequestProfile(models.Model):
+    """Profile of a sampled request, see klarmieten.profiling"""
+
+    MODE_CHOICES = [
+        ("cprofile", "cProfile"),
+        ("sampling", "Stack sampling"),
+    ]
+    REASON_CHOICES = [
+        ("sampled", "Sampled"),
+        ("header", "Requested by header"),
+    ]
+
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    view_name = models.CharField(max_length=255, blank=True, default="")
+    status = models.PositiveSmallIntegerField()
+    reason = models.CharField(max_length=10, choices=REASON_CHOICES)
+    duration_ms = models.FloatField()
+
+    sql_count = models.PositiveIntegerField()
+    sql_ms = models.FloatField()
+    # The slowest statements with their duration in milliseconds
+    slowest_queries = models.JSONField(default=list, blank=True)
+
+    mode = models.CharField(max_length=10, choices=MODE_CHOICES)
+    # pstats data for cProfile, collapsed stacks for stack sampling
+    profile = models.BinaryField()
+
+    class Meta:
+        verbose_name = "Request Profile"
+        verbose_name_plural = "Request Profiles"
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f}ms)"
+
+    @property
+    def file_name(self):
+        """Name of the profile download, the extension tells tools how to read it"""
+        extension = "prof" if self.mode == "cprofile" else "collapsed.txt"
+        return f"profile-{self.pk}-{self.created_at:%Y%m%d-%H%M%S}.{extension}"
@@ -0,0 +1,184 @@
+"""
+Profiling of single requests, see klarmieten.middleware.ProfilingMiddleware.
+
+Two profilers are available through PROFILING_MODE:
+
+- "cprofile" records every call with cProfile. The download is a pstats
+  file for `python -m pstats`, snakeviz or flameprof.
+- "sampling" reads the request thread's stack from a background thread
+  every PROFILING_SAMPLE_INTERVAL seconds. This costs less and shows where
+  time goes including waits. The download holds collapsed stacks, ready for
+  flamegraph.pl or speedscope.
+
+Both only see the thread handling the request; work handed to other
+threads, like the analysis pipeline's providers, shows up as waiting.
+SQL queries of the request are counted and timed either way.
+"""
+import cProfile
+import heapq
+import logging
+import marshal
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from klarmieten.models import RequestProfile
+
+logger = logging.getLogger(__name__)
+
+# Number of slowest SQL statements kept per profile
+SLOWEST_QUERY_COUNT = 10
+
+# Longest SQL statement kept, in characters
+MAX_SQL_LENGTH = 2000
+
+
+class QueryRecorder:
+    """Counts and times the SQL queries of a thread, as a connection execute wrapper"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self._slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            entry = (duration, self.count, sql[:MAX_SQL_LENGTH])
+            if len(self._slowest) < SLOWEST_QUERY_COUNT:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heappushpop(self._slowest, entry)
+
+    @property
+    def slowest(self):
+        return [
+            {"sql": sql, "ms": round(duration * 1000, 3)}
+            for duration, _, sql in sorted(self._slowest, reverse=True)
+        ]
+
+
+class CProfiler:
+    mode = "cprofile"
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def output(self) -> bytes:
+        self._profile.create_stats()
+        return marshal.dumps(self._profile.stats)
+
+
+class StackSampler:
+    mode = "sampling"
+
+    def __init__(self, interval: float = None):
+        self.interval = interval or settings.PROFILING_SAMPLE_INTERVAL
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread_id = None
+        self._thread = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def output(self) -> bytes:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()).encode("utf-8")
+
+
+PROFILERS = {
+    CProfiler.mode: CProfiler,
+    StackSampler.mode: StackSampler,
+}
+
+
+def profile_request(request, get_response, reason: str):
+    """
+    Handle a request under the configured profiler and store its profile.
+
+    Returns:
+        The response, with the id of the stored profile in X-Profile-Id
+    """
+    profiler = PROFILERS[settings.PROFILING_MODE]()
+    queries = QueryRecorder()
+
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(queries))
+        start = time.perf_counter()
+        try:
+            profiler.start()
+        except ValueError as e:
+            # Another profiler, like a debugger, is already active
+            logger.warning(f"Cannot profile request: {e}")
+            return get_response(request)
+        try:
+            response = get_response(request)
+        finally:
+            profiler.stop()
+        duration = time.perf_counter() - start
+
+    match = getattr(request, "resolver_match", None)
+    try:
+        profile = RequestProfile.objects.create(
+            method=request.method[:10],
+            path=request.path[:255],
+            view_name=(match.view_name if match else "")[:255],
+            status=response.status_code,
+            reason=reason,
+            duration_ms=duration * 1000,
+            sql_count=queries.count,
+            sql_ms=queries.duration * 1000,
+            slowest_queries=queries.slowest,
+            mode=profiler.mode,
+            profile=profiler.output(),
+        )
+        prune_profiles()
+    except Exception as e:
+        logger.error(f"Error storing request profile: {e}")
+        return response
+
+    response["X-Profile-Id"] = str(profile.pk)
+    return response
+
+
+def prune_profiles():
+    """Delete the oldest profiles beyond PROFILING_MAX_PROFILES"""
+    stale = list(
+        RequestProfile.objects.order_by("-created_at").values_list("pk", flat=True)[settings.PROFILING_MAX_PROFILES:]
+    )
+    if stale:
+        RequestProfile.objects.filter(pk__in=stale).delete()
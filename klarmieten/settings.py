@@ -88,13 +88,19 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so it times everything below
+    "klarmieten.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # Needs request.user for the X-Profile header of staff users
+    "klarmieten.middleware.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    # Needs request.user and the CSRF middleware to set the cookie on cache hits
+    "klarmieten.middleware.PageCacheMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
@@ -197,21 +203,70 @@ STORAGES = {
 
 # CACHING
 # ------------------------------------------------------------------------------
-if IS_VERCEL:
-    CACHES = {
-        "default": {
-            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-            "LOCATION": "vercel-cache",
-            "TIMEOUT": 300,  # 5 minutes
-        }
-    }
-else:
-    CACHES = {
-        "default": {
-            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-            "LOCATION": "unique-contracts",
-        }
+# Shared by all worker processes: Redis when REDIS_URL is set, otherwise the
+# database (needs `manage.py createcachetable`). CACHE_BACKEND=file keeps the
+# cache in a directory for single-host deployments, locmem is per process and
+# the default with DEBUG, so a fresh checkout runs without the cache table.
+REDIS_URL = os.getenv("REDIS_URL")
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "redis" if REDIS_URL else "locmem" if DEBUG else "db")
+
+CACHE_BACKENDS = {
+    "redis": ("klarmieten.cache.RedisCache", REDIS_URL),
+    "db": ("klarmieten.cache.DatabaseCache", "django_cache"),
+    "file": ("klarmieten.cache.FileBasedCache", os.getenv("CACHE_DIR", str(BASE_DIR / ".cache"))),
+    "locmem": ("klarmieten.cache.LocMemCache", "klarmieten"),
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[CACHE_BACKEND][0],
+        "LOCATION": CACHE_BACKENDS[CACHE_BACKEND][1],
+        "TIMEOUT": 300,  # 5 minutes
+        # Namespaced and versioned, bump CACHE_VERSION to drop all entries
+        "KEY_PREFIX": "klarmieten",
+        "VERSION": int(os.getenv("CACHE_VERSION", "1")),
     }
+}
+
+# External map services. Other servers, like the fakes of
+# `manage.py run_fake_providers`, need their own TILE_CACHE_DIR
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search.php")
+TILE_URL = os.getenv("TILE_URL", "https://tile.openstreetmap.org/{z}/{x}/{y}.png")
+
+# Compiled postal code centroids, created by `manage.py import_plz_gazetteer`
+PLZ_GAZETTEER_PATH = os.getenv("PLZ_GAZETTEER_PATH", str(BASE_DIR / "contract_analysis" / "data" / "plz_gazetteer.bin"))
+
+# Neighborhood analyses are shared by all contracts in a geohash cell of this
+# precision (7 is about 150 m x 150 m) and regenerated after the TTL
+NEIGHBORHOOD_GEOHASH_PRECISION = int(os.getenv("NEIGHBORHOOD_GEOHASH_PRECISION", 7))
+NEIGHBORHOOD_CACHE_TTL_DAYS = int(os.getenv("NEIGHBORHOOD_CACHE_TTL_DAYS", 180))
+
+# Downloaded OSM tiles for neighborhood maps, see contract_analysis.utils.tiles
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR", "/tmp/tiles" if IS_VERCEL else str(BASE_DIR / ".tiles"))
+TILE_CACHE_TTL = 60 * 60 * 24 * 7
+TILE_CACHE_MAX_BYTES = int(os.getenv("TILE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# Local MBTiles raster extract, replaces the OSM tile server when set
+MBTILES_PATH = os.getenv("MBTILES_PATH")
+
+# Full-page cache for anonymous visitors, see klarmieten.middleware
+PAGE_CACHE_URL_NAMES = ["landing", "pricing"]
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Prometheus metrics at /metrics, see klarmieten.metrics. The gunicorn workers
+# share their values through METRICS_DIR, which should be emptied on startup.
+# Outside DEBUG the endpoint needs METRICS_TOKEN as bearer token.
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = 1
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Request profiling, see klarmieten.profiling. With PROFILING_ENABLED a share of
+# PROFILING_SAMPLE_RATE of all requests is profiled, plus requests of staff users
+# with an X-Profile header. PROFILING_MODE is "cprofile" or "sampling".
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False") == "True"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))
+PROFILING_MODE = os.getenv("PROFILING_MODE", "cprofile")
+PROFILING_SAMPLE_INTERVAL = 0.005
+PROFILING_MAX_PROFILES = int(os.getenv("PROFILING_MAX_PROFILES", 500))
 
 # Simplified logging for faster startup
 # ------------------------------------------------------------------------------
@@ -243,4 +298,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # ------------------------------------------------------------------------------
 APP_NAME = "KlarMieten"
 
+# Deployed version, part of all page cache keys
+APP_VERSION = os.getenv("APP_VERSION") or os.getenv("VERCEL_GIT_COMMIT_SHA", "dev")
+
 print("Settings loaded successfully")
@@ -0,0 +1,268 @@
+import json
+import marshal
+import tempfile
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from customers.models import User
+from klarmieten import metrics
+from klarmieten.cache import LocMemCache, get_cache_stats, invalidate_page_cache, reset_cache_stats
+from klarmieten.models import RequestProfile
+from klarmieten.profiling import QueryRecorder, StackSampler, prune_profiles
+
+
+# The manifest only exists after collectstatic
+@override_settings(STORAGES={
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+})
+class PageCacheMiddlewareTests(TestCase):
+    def setUp(self):
+        invalidate_page_cache()
+        self.addCleanup(cache.clear)
+        self.client = Client(HTTP_HOST="localhost")
+
+    def test_hit_without_gzip_keeps_entry(self):
+        first = self.client.get(reverse("landing"))
+        self.assertEqual(first.status_code, 200)
+
+        # A rewritten entry would carry the later time as Last-Modified
+        later = time.time() + 3600
+        with mock.patch("klarmieten.middleware.time.time", return_value=later):
+            second = self.client.get(reverse("landing"))
+
+        self.assertEqual(second.status_code, 200)
+        self.assertFalse(second.has_header("Content-Encoding"))
+        self.assertEqual(second["Last-Modified"], first["Last-Modified"])
+        self.assertEqual(second.content, first.content)
+
+        revalidated = self.client.get(reverse("landing"), HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_hit_with_gzip(self):
+        self.client.get(reverse("landing"))
+        with self.assertTemplateNotUsed("main.html"):
+            response = self.client.get(reverse("landing"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_miss_with_gzip_keeps_view_headers(self):
+        response = self.client.get(reverse("landing"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["X-Frame-Options"], "DENY")
+        self.assertIn("csrftoken", response.cookies)
+
+    def test_query_string_shares_entry(self):
+        self.client.get(reverse("landing"))
+        with self.assertTemplateNotUsed("main.html"):
+            self.client.get(reverse("landing") + "?utm_source=newsletter")
+
+    def test_revalidation_with_etag(self):
+        first = self.client.get(reverse("landing"))
+        self.assertIn("csrftoken", first.cookies)
+
+        revalidated = self.client.get(reverse("landing"), HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_invalidate_page_cache(self):
+        first = self.client.get(reverse("landing"))
+        invalidate_page_cache()
+        with self.assertTemplateUsed("main.html"):
+            self.client.get(reverse("landing"), HTTP_IF_NONE_MATCH=first["ETag"])
+
+    def test_authenticated_users_bypass_cache(self):
+        self.client.get(reverse("landing"))
+        self.client.force_login(User.objects.create_user("tenant"))
+        with self.assertTemplateUsed("main.html"):
+            response = self.client.get(reverse("landing"))
+        self.assertFalse(response.has_header("ETag"))
+
+
+class CacheStatsTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = LocMemCache("cache-stats-tests", {})
+        reset_cache_stats()
+        self.addCleanup(reset_cache_stats)
+
+    def test_get(self):
+        self.assertIsNone(self.cache.get("missing"))
+        self.cache.set("present", 0)
+        self.assertEqual(self.cache.get("present"), 0)
+        self.assertEqual(get_cache_stats(), {"hits": 1, "misses": 1, "hit_ratio": 0.5})
+
+    def test_get_many_counts_each_key_once(self):
+        self.cache.set("present", 1)
+        self.assertEqual(self.cache.get_many(["present", "missing", "other"]), {"present": 1})
+        self.assertEqual(get_cache_stats()["hits"], 1)
+        self.assertEqual(get_cache_stats()["misses"], 2)
+
+    def test_no_lookups(self):
+        self.assertIsNone(get_cache_stats()["hit_ratio"])
+
+
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        # Metrics created here register with their own registry
+        patcher = mock.patch.object(metrics, "registry", metrics.Registry())
+        self.registry = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_exposition_format(self):
+        counter = metrics.Counter("lookups_total", "Lookups", ("result",))
+        histogram = metrics.Histogram("duration_seconds", "Duration", buckets=(0.1, 1))
+        counter.inc(result="hit")
+        counter.inc(2, result="hit")
+        histogram.observe(0.5)
+        histogram.observe(3)
+
+        with override_settings(METRICS_DIR=None):
+            lines = self.registry.render().splitlines()
+        self.assertEqual(lines, [
+            "# HELP lookups_total Lookups",
+            "# TYPE lookups_total counter",
+            'lookups_total{result="hit"} 3',
+            "# HELP duration_seconds Duration",
+            "# TYPE duration_seconds histogram",
+            'duration_seconds_bucket{le="0.1"} 0',
+            'duration_seconds_bucket{le="1"} 1',
+            'duration_seconds_bucket{le="+Inf"} 2',
+            "duration_seconds_sum 3.5",
+            "duration_seconds_count 2",
+        ])
+
+    def test_labels_must_match(self):
+        counter = metrics.Counter("lookups_total", "Lookups", ("result",))
+        with self.assertRaises(ValueError):
+            counter.inc(cache="tiles")
+
+    def test_values_of_other_processes_are_added(self):
+        counter = metrics.Counter("lookups_total", "Lookups", ("result",))
+        histogram = metrics.Histogram("duration_seconds", "Duration", buckets=(1,))
+        counter.inc(result="hit")
+        histogram.observe(0.5)
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            other = {
+                "lookups_total": {json.dumps(["hit"]): 2, json.dumps(["miss"]): 1},
+                "duration_seconds": {json.dumps([]): [0, 1, 2.0, 1]},
+            }
+            with open(f"{directory}/1-other.json", "w") as file:
+                json.dump(other, file)
+            collected = self.registry.collect()
+
+        self.assertEqual(collected["lookups_total"], {("hit",): 3, ("miss",): 1})
+        self.assertEqual(collected["duration_seconds"], {(): [1, 1, 2.5, 2]})
+
+    def test_gauge_computed_when_scraped(self):
+        metrics.Gauge("queue_depth", "Depth", lambda: 4)
+        with override_settings(METRICS_DIR=None):
+            self.assertIn("queue_depth 4", self.registry.render().splitlines())
+
+    def test_metric_is_abstract(self):
+        class Incomplete(metrics.Metric):
+            type = "counter"
+
+        with self.assertRaises(TypeError):
+            Incomplete("incomplete", "Missing merge and samples")
+
+
+@override_settings(STORAGES={
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+})
+class MetricsViewTests(SimpleTestCase):
+    @override_settings(METRICS_TOKEN=None, DEBUG=False)
+    def test_hidden_without_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+
+    @override_settings(METRICS_TOKEN="secret", METRICS_DIR=None)
+    def test_needs_bearer_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 401)
+
+        with mock.patch.object(metrics.ANALYSIS_QUEUE_DEPTH, "function", return_value=0):
+            response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "# TYPE http_request_duration_seconds histogram")
+
+
+@override_settings(
+    STORAGES={
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    },
+    PROFILING_ENABLED=True,
+    PROFILING_SAMPLE_RATE=0,
+    PROFILING_MODE="cprofile",
+)
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        self.addCleanup(cache.clear)
+        self.client = Client(HTTP_HOST="localhost")
+
+    def test_staff_header_profiles_request(self):
+        self.client.force_login(User.objects.create_user("admin", is_staff=True))
+        response = self.client.get(reverse("pricing"), HTTP_X_PROFILE="1")
+
+        profile = RequestProfile.objects.get(pk=response["X-Profile-Id"])
+        self.assertEqual(profile.reason, "header")
+        self.assertEqual(profile.view_name, "pricing")
+        self.assertGreater(profile.sql_count, 0)
+        self.assertEqual(len(profile.slowest_queries), min(profile.sql_count, 10))
+        self.assertIsInstance(marshal.loads(bytes(profile.profile)), dict)
+
+    def test_header_ignored_for_other_users(self):
+        self.client.force_login(User.objects.create_user("tenant"))
+        response = self.client.get(reverse("landing"), HTTP_X_PROFILE="1")
+        self.assertFalse(response.has_header("X-Profile-Id"))
+        self.assertFalse(RequestProfile.objects.exists())
+
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled(self):
+        response = self.client.get(reverse("landing"))
+        self.assertEqual(RequestProfile.objects.get(pk=response["X-Profile-Id"]).reason, "sampled")
+
+    @override_settings(PROFILING_MAX_PROFILES=2)
+    def test_only_newest_profiles_kept(self):
+        for _ in range(3):
+            RequestProfile.objects.create(
+                method="GET", path="/", status=200, reason="sampled", duration_ms=1, sql_count=0, sql_ms=0,
+                mode="cprofile", profile=b"",
+            )
+        newest = list(RequestProfile.objects.values_list("pk", flat=True)[:2])
+        prune_profiles()
+        self.assertEqual(list(RequestProfile.objects.values_list("pk", flat=True)), newest)
+
+
+class ProfilerTests(SimpleTestCase):
+    def test_stack_sampler_collapses_stacks(self):
+        def waiting():
+            time.sleep(0.05)
+
+        sampler = StackSampler(interval=0.001)
+        sampler.start()
+        waiting()
+        sampler.stop()
+
+        stacks = sampler.output().decode().splitlines()
+        self.assertTrue(stacks)
+        stack, count = stacks[0].rsplit(" ", 1)
+        self.assertIn("waiting (", stack.split(";")[-1])
+        self.assertGreater(int(count), 0)
+
+    def test_query_recorder_keeps_slowest(self):
+        recorder = QueryRecorder()
+        durations = {f"SELECT {number}": number / 1000 for number in range(15)}
+
+        def execute(sql, params, many, context):
+            recorder_clock[0] += durations[sql]
+
+        recorder_clock = [0.0]
+        with mock.patch("klarmieten.profiling.time.perf_counter", side_effect=lambda: recorder_clock[0]):
+            for sql in durations:
+                recorder(execute, sql, None, False, {})
+
+        self.assertEqual(recorder.count, 15)
+        self.assertEqual([query["sql"] for query in recorder.slowest], [f"SELECT {n}" for n in range(14, 4, -1)])
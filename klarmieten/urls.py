@@ -20,11 +20,12 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
-from klarmieten.views import main
+from klarmieten.views import main, metrics
 
 urlpatterns = [
                   path("admin/", admin.site.urls, name="admin"),
                   path("", main, name="landing"),
+                  path("metrics", metrics, name="metrics"),
                   path("contract/", include("contract_analysis.urls"), name="contract"),
                   path("user/", include("customers.urls")),
                   path("user/", include("django.contrib.auth.urls")),
@@ -1,6 +1,10 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
 
 from klarmieten.faq import FAQ_landing, FAQ_pricing
+from klarmieten.metrics import registry
 
 
 def main(request):
@@ -17,3 +21,23 @@ def main(request):
         "faq": FAQ_landing
     }
     return render(request, "main.html", context)
+
+
+def metrics(request):
+    """
+    Prometheus metrics of all worker processes.
+
+    Args:
+        request: HttpRequest object, with METRICS_TOKEN as bearer token
+
+    Returns:
+        Metrics in the Prometheus text format
+    """
+    if settings.METRICS_TOKEN:
+        authorization = request.headers.get("Authorization", "")
+        if not constant_time_compare(authorization, f"Bearer {settings.METRICS_TOKEN}"):
+            return HttpResponse(status=401)
+    elif not settings.DEBUG:
+        raise Http404
+
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")